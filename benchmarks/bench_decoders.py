@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""Benchmark: hand-written decoders against ones compiled from field specs.
+
+The previous decoders.py had a function per command, indexing the
+message data and calling ``struct.unpack`` with a format string parsed
+on each call. decoders.py now builds most decoders from Field specs,
+compiled once into a ``struct.Struct`` and a converter per field (see
+fields.py). The hand-written functions are kept here, verbatim, as the
+baseline, and every command is decoded by both from the simulated Leaf's
+answer.
+"""
+
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_tokenizer import _best_of  # noqa: E402
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands  # noqa: E402
+from custom_components.nissan_leaf_obd_ble.protocols.protocol import Message  # noqa: E402
+from custom_components.nissan_leaf_obd_ble.simulator import leaf_ecus  # noqa: E402
+
+RESPONSES = 20000
+
+# the previous decoders.py, from power_switch on
+
+
+def power_switch(messages):
+    """Decode power switch messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] & 0x80 == 0x80
+    return {"power_switch": v}
+
+
+def gear_position(messages):
+    """Decode gear position messages."""
+    d = messages[0].data  # only operate on a single message
+    match d[3]:
+        case 1:
+            v = "Park"
+        case 2:
+            v = "Reverse"
+        case 3:
+            v = "Neutral"
+        case 4:
+            v = "Drive"
+        case 5:
+            v = "Eco"
+        case _:
+            v = "Unknown"
+
+    return {"gear_position": v}
+
+
+def bat_12v_voltage(messages):
+    """Decode 12V battery voltage messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] * 0.08
+    return {"bat_12v_voltage": v}
+
+
+def bat_12v_current(messages):
+    """Decode 12V battery current messages."""
+    d = messages[0].data  # only operate on a single message
+    v = struct.unpack("!h", d[3:5])[0] / 256
+    return {"bat_12v_current": v}
+
+
+def quick_charges(messages):
+    """Decode Number of quick charges messages."""
+    d = messages[0].data  # only operate on a single message
+    v = int.from_bytes(d[3:5])
+    return {"quick_charges": v}
+
+
+def l1_l2_charges(messages):
+    """Decode Number of L1/L2 charges messages."""
+    d = messages[0].data  # only operate on a single message
+    v = int.from_bytes(d[3:5])
+    return {"l1_l2_charges": v}
+
+
+def ambient_temp(messages):
+    """Decode ambient temperature messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] / 2 - 40
+    return {"ambient_temp": v}
+
+
+def estimated_ac_power(messages):
+    """Decode estimated AC power messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] * 50
+    return {"estimated_ac_power": v}
+
+
+def estimated_ptc_power(messages):
+    """Decode estimated PTC power messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] * 250
+    return {"estimated_ptc_power": v}
+
+
+def aux_power(messages):
+    """Decode Auxiliary equipment power messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] * 100
+    return {"aux_power": v}
+
+
+def ac_power(messages):
+    """Decode AC system power messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] * 250
+    return {"ac_power": v}
+
+
+def plug_state(messages):
+    """Decode Plug state of J1772 socket messages."""
+    d = messages[0].data  # only operate on a single message
+    match d[3]:
+        case 0:
+            v = "Not plugged"
+        case 1:
+            v = "Partial plugged"
+        case 2:
+            v = "Plugged"
+        case _:
+            v = "Unknown"
+    return {"plug_state": v}
+
+
+def charge_mode(messages):
+    """Decode Charging mode messages."""
+    d = messages[0].data  # only operate on a single message
+    match d[3]:
+        case 0:
+            v = "Not charging"
+        case 1:
+            v = "L1 charging"
+        case 2:
+            v = "L2 charging"
+        case 3:
+            v = "L3 charging"
+        case _:
+            v = "Unknown"
+    return {"charge_mode": v}
+
+
+def rpm(messages):
+    """Decode Motor RPM messages."""
+    d = messages[0].data  # only operate on a single message
+    v = struct.unpack("!h", d[3:5])[0]
+    # todo: fix this parser
+    return {"rpm": v}
+
+
+def obc_out_power(messages):
+    """Decode On-board charger output power messages (W)."""
+    d = messages[0].data  # only operate on a single message
+    v = struct.unpack("!h", d[3:5])[0] * 100
+    return {"obc_out_power": v}
+
+
+def motor_power(messages):
+    """Decode Traction motor power messages (W)."""
+    d = messages[0].data  # only operate on a single message
+    v = struct.unpack("!h", d[3:5])[0] * 40
+    return {"motor_power": v}
+
+
+def speed(messages):
+    """Decode Vehicle speed messages (km/h)."""
+    d = messages[0].data  # only operate on a single message
+    v = struct.unpack("!h", d[3:5])[0] / 10
+    return {"speed": v}
+
+
+def ac_on(messages):
+    """Decode AC status messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] == 0x01
+    return {"ac_on": v}
+
+
+def rear_heater(messages):
+    """Decode Rear heater status messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] == 0xA2
+    return {"rear_heater": v}
+
+
+def eco_mode(messages):
+    """Decode ECO mode status messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] == 0x10 | d[3] == 0x11
+    return {"eco_mode": v}
+
+
+def e_pedal_mode(messages):
+    """Decode e-Pedal mode status messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] == 0x04
+    return {"e_pedal_mode": v}
+
+
+def odometer(messages):
+    """Decode Total odometer reading (km) messages."""
+    d = messages[0].data  # only operate on a single message
+    v = struct.unpack("!i", bytearray([0x00]) + d[3:6])[0]
+    return {"odometer": v}
+
+
+def tp_fr(messages):
+    """Decode Tyre pressure front right (kPa) messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] * 1.7236894
+    return {"tp_fr": v}
+
+
+def tp_fl(messages):
+    """Decode Tyre pressure front left (kPa) messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] * 1.7236894
+    return {"tp_fl": v}
+
+
+def tp_rr(messages):
+    """Decode Tyre pressure rear right (kPa) messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] * 1.7236894
+    return {"tp_rr": v}
+
+
+def tp_rl(messages):
+    """Decode Tyre pressure rear left (kPa) messages."""
+    d = messages[0].data  # only operate on a single message
+    v = d[3] * 1.7236894
+    return {"tp_rl": v}
+
+
+def range_remaining(messages):
+    """Decode Remaining range (km) messages."""
+    # todo: fix this decoder
+    d = messages[0].data  # only operate on a single message
+    v = struct.unpack("!h", d[3:5])[0] / 10
+    return {"range_remaining": v}
+
+
+def lbc(messages):
+    """Decode LBC message."""
+    d = messages[0].data
+    if len(d) == 0:
+        return None
+    hv_battery_current_1 = int.from_bytes(d[2:6], byteorder="big", signed=False)
+    hv_battery_current_2 = int.from_bytes(d[8:12], byteorder="big", signed=False)
+    if hv_battery_current_1 & 0x8000000 == 0x8000000:
+        hv_battery_current_1 = hv_battery_current_1 | -0x100000000
+    if hv_battery_current_2 & 0x8000000 == 0x8000000:
+        hv_battery_current_2 = hv_battery_current_2 | -0x100000000
+    return {
+        "state_of_charge": int.from_bytes(d[33:36]) / 10000,
+        "hv_battery_health": int.from_bytes(d[30:32]) / 102.4,
+        "hv_battery_Ah": int.from_bytes(d[37:40]) / 10000,
+        "hv_battery_current_1": hv_battery_current_1 / 1024,
+        "hv_battery_current_2": hv_battery_current_2 / 1024,
+        "hv_battery_voltage": int.from_bytes(d[20:22]) / 100,
+    }
+
+
+LEGACY = {
+    name: fn
+    for name, fn in globals().items()
+    if name in leaf_commands and callable(fn)
+}
+
+
+def _message(cmd, ecus):
+    """Return the message of the simulated Leaf's answer, as the decoder gets it."""
+    ecu = ecus[int(cmd.header, 16)]
+    request = bytes.fromhex(cmd.command.decode())
+    message = Message([])
+    message.data = bytearray(ecu.handle(request[1 : 1 + request[0]]))
+    # padded or chopped to the command's size, as OBDCommand does
+    message.data = (message.data + bytes(cmd.bytes))[: cmd.bytes]
+    return [message]
+
+
+def run(responses=RESPONSES):
+    """Return CPU microseconds per response for each decoder, and in total."""
+    ecus = leaf_ecus()
+    results = {}
+    for name, legacy in LEGACY.items():
+        cmd = leaf_commands[name]
+        messages = _message(cmd, ecus)
+        assert legacy(messages) == cmd.decode(messages), name
+        legacy_us, compiled_us = _best_of(
+            [lambda: legacy(messages), lambda: cmd.decode(messages)], responses
+        )
+        results[name] = {"legacy_us": legacy_us, "compiled_us": compiled_us}
+    results["total"] = {
+        key: sum(r[key] for r in results.values())
+        for key in ("legacy_us", "compiled_us")
+    }
+    return results
+
+
+def main():
+    """Print the results."""
+    for name, r in run().items():
+        print(
+            f"{name}: legacy {r['legacy_us']:.3f} us  compiled {r['compiled_us']:.3f} us  "
+            f"({r['legacy_us'] / r['compiled_us']:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
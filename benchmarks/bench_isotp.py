@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Benchmark: ISO-TP reassembly of an lbc response, after the prompt vs streamed.
+
+The previous path waited for the ELM prompt, then parsed every line into
+a Frame, grouped and sorted the frames and concatenated the CF payloads.
+ISOTPReassembler parses each frame as its line arrives and writes it into
+a preallocated payload, so once the last frame is in only the final line
+remains to be handled.
+
+Two figures are reported, both in CPU microseconds per response:
+``after_last_frame`` is the work left on the critical path once the last
+frame has arrived, ``total`` is the work for the whole response.
+
+The larger win is not CPU: when the frame count is not known, the ELM
+prints the prompt only after its response timeout (ATST, about 200 ms by
+default) expires. Returning on completion takes that wait off the query.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_ringbuffer import lbc_response  # noqa: E402
+from benchmarks.bench_tokenizer import _best_of  # noqa: E402
+from custom_components.nissan_leaf_obd_ble.protocols.protocol_can import (  # noqa: E402
+    ISO_15765_4_11bit_500k,
+    ISOTPReassembler,
+)
+
+RESPONSES = 4000
+ELM_DEFAULT_TIMEOUT_MS = 0x32 * 4.096  # ATST default
+
+
+def run(responses=RESPONSES):
+    """Run the benchmark and return CPU microseconds per response."""
+    protocol = ISO_15765_4_11bit_500k()
+    reassembler = ISOTPReassembler(protocol)
+    lines = [line for line in lbc_response().rstrip(b">").split(b"\r") if line]
+    head, last = lines[:-1], lines[-1]
+
+    def streamed_all():
+        reassembler.reset()
+        for line in lines:
+            reassembler.feed(line)
+        return reassembler.message()
+
+    assert streamed_all().data == protocol(lines)[0].data
+
+    def streamed_tail():
+        # replay everything but the last frame outside the timed region
+        reassembler.reset()
+        for line in head:
+            reassembler.feed(line)
+
+    def last_frame():
+        reassembler.feed(last)
+        return reassembler.message()
+
+    def legacy():
+        return protocol(lines)
+
+    # time the tail work alone: prepare, then measure the last frame
+    legacy_us, total_us = _best_of([legacy, streamed_all], responses)
+    prepare_us, prepare_and_last_us = _best_of(
+        [streamed_tail, lambda: (streamed_tail(), last_frame())], responses
+    )
+    return {
+        "after_last_frame": {
+            "legacy_us": legacy_us,
+            "streaming_us": max(prepare_and_last_us - prepare_us, 0.0),
+        },
+        "total": {"legacy_us": legacy_us, "streaming_us": total_us},
+        "prompt_wait_avoided_ms": ELM_DEFAULT_TIMEOUT_MS,
+    }
+
+
+def main():
+    """Print the results."""
+    for name, r in run().items():
+        if isinstance(r, dict):
+            print(
+                f"{name}: legacy {r['legacy_us']:.2f} us  streaming {r['streaming_us']:.2f} us"
+            )
+        else:
+            print(f"{name}: up to {r:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Benchmark: bleserial receive buffer operations.
+
+Feeds multi-frame LBC (``022101`` on 79B) responses into the receive buffer
+as 20-byte BLE notifications and consumes them the way the stack does:
+``readline`` after every notification, and ``read_until(b">")``. Compares
+the previous bytearray buffer (slice-and-copy on every read, full rescan
+for the delimiter on every check) with RingBuffer.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from custom_components.nissan_leaf_obd_ble.ringbuffer import RingBuffer  # noqa: E402
+
+NOTIFICATION_SIZE = 20
+RESPONSES = 2000
+
+
+def lbc_response(payload_len=53):
+    """Return an ATH1/ATS0/ATCAF0 style multi-frame response for lbc."""
+    payload = bytes([0x61, 0x01]) + bytes(range(payload_len - 2))
+    lines = [b"7BB10%02X" % payload_len + payload[:6].hex().upper().encode()]
+    seq = 1
+    for i in range(6, payload_len, 7):
+        chunk = payload[i : i + 7].ljust(7, b"\xff")
+        lines.append(b"7BB2%X" % (seq & 0x0F) + chunk.hex().upper().encode())
+        seq += 1
+    return b"\r".join(lines) + b"\r\r>"
+
+
+def notifications(data, size=NOTIFICATION_SIZE):
+    """Split data into BLE-notification sized chunks."""
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+class BytearrayBuffer:
+    """The previous receive buffer: a bytearray that is re-sliced on every read."""
+
+    def __init__(self) -> None:
+        """Initialise."""
+        self._rx_buffer = bytearray()
+
+    def extend(self, data):
+        self._rx_buffer.extend(data)
+
+    def find(self, delimiter):
+        # the old wait predicate rescanned the whole buffer, then index() again
+        if delimiter not in self._rx_buffer:
+            return -1
+        return self._rx_buffer.index(delimiter)
+
+    def read(self, size):
+        data = self._rx_buffer[:size]
+        self._rx_buffer = self._rx_buffer[size:]
+        return bytes(data)
+
+    def __len__(self):
+        return len(self._rx_buffer)
+
+
+def _readline_pattern(buffer, chunks):
+    """Check for a complete line after every notification, like readline."""
+    lines = 0
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while (i := buffer.find(b"\r")) >= 0:
+            buffer.read(i + 1)
+            lines += 1
+    buffer.read(len(buffer))
+    return lines
+
+
+def _read_until_pattern(buffer, chunks):
+    """Check for the prompt after every notification, like read_until."""
+    for chunk in chunks:
+        buffer.extend(chunk)
+        if (i := buffer.find(b">")) >= 0:
+            return buffer.read(i + 1)
+    return b""
+
+
+def _time(fn, buffer_cls, chunks, responses):
+    buffer = buffer_cls()
+    start = time.perf_counter()
+    for _ in range(responses):
+        fn(buffer, chunks)
+    return (time.perf_counter() - start) / responses * 1e6
+
+
+def run(responses=RESPONSES):
+    """Run the benchmark and return microseconds per response."""
+    chunks = notifications(lbc_response())
+    results = {}
+    for name, fn in (
+        ("readline", _readline_pattern),
+        ("read_until", _read_until_pattern),
+    ):
+        results[name] = {
+            "bytearray_us": _time(fn, BytearrayBuffer, chunks, responses),
+            "ringbuffer_us": _time(fn, RingBuffer, chunks, responses),
+        }
+    # a backlog of responses queued in the buffer (e.g. while the event loop
+    # was busy) is where re-slicing the whole tail really hurts
+    backlog = b"".join([lbc_response()] * 1000)
+    results["backlog_readline"] = {
+        "bytearray_us": _time(_readline_pattern, BytearrayBuffer, [backlog], 5),
+        "ringbuffer_us": _time(_readline_pattern, RingBuffer, [backlog], 5),
+    }
+    return results
+
+
+def main():
+    """Print the results."""
+    for name, r in run().items():
+        print(
+            f"{name:>16}: bytearray {r['bytearray_us']:8.2f} us  "
+            f"ringbuffer {r['ringbuffer_us']:8.2f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Microbenchmark: per-command receive latency of bleserial.
+
+Compares the old sleep-polling receive loop (``asyncio.sleep(0.01)`` until
+bytes show up) with the event-driven path where ``_notification_handler``
+wakes the reader directly. Latency is measured from the moment the final
+notification of a response (the one carrying the ``>`` prompt) is delivered
+to the moment the reader returns it.
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from custom_components.nissan_leaf_obd_ble.bleserial import bleserial  # noqa: E402
+
+# a typical single frame 0x22 answer, as seen with ATH1 ATS0 ATCAF0
+RESPONSE = b"79A0562110300A3\r\r>"
+NOTIFICATION_SIZE = 20
+COMMANDS = 200
+
+
+class PollingSerial(bleserial):
+    """bleserial with the previous sleep-polling receive loop."""
+
+    async def read_until(self, expected=b"\n"):
+        buffer = bytearray()
+        while expected not in buffer:
+            while len(self._rx_buffer) < 1:
+                await asyncio.sleep(0.01)
+            buffer.extend(self._rx_buffer.read())
+        return bytes(buffer)
+
+
+async def _one_command(port, response):
+    loop = asyncio.get_running_loop()
+    done_at = []
+
+    def deliver(chunk, last):
+        port._notification_handler(None, chunk)
+        if last:
+            done_at.append(time.perf_counter())
+
+    chunks = [
+        response[i : i + NOTIFICATION_SIZE]
+        for i in range(0, len(response), NOTIFICATION_SIZE)
+    ]
+    # the adapter answers a few ms after the command was written
+    for n, chunk in enumerate(chunks):
+        loop.call_later(0.002 + 0.001 * n, deliver, chunk, n == len(chunks) - 1)
+    await port.read_until(b">")
+    return time.perf_counter() - done_at[0]
+
+
+async def _measure(port_cls, commands=COMMANDS):
+    port = port_cls("bench", None, None, None)
+    latencies = []
+    cpu_start = time.process_time()
+    for _ in range(commands):
+        latencies.append(await _one_command(port, RESPONSE))
+    cpu = time.process_time() - cpu_start
+    return {
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p95_ms": statistics.quantiles(latencies, n=20)[-1] * 1000,
+        "max_ms": max(latencies) * 1000,
+        "cpu_ms_per_command": cpu / commands * 1000,
+    }
+
+
+def run(commands=COMMANDS):
+    """Run the benchmark and return the results as a dict."""
+    return {
+        "polling": asyncio.run(_measure(PollingSerial, commands)),
+        "event_driven": asyncio.run(_measure(bleserial, commands)),
+    }
+
+
+def main():
+    """Print the results."""
+    results = run()
+    for name, r in results.items():
+        print(
+            f"{name:>13}: mean {r['mean_ms']:.3f} ms  p95 {r['p95_ms']:.3f} ms  "
+            f"max {r['max_ms']:.3f} ms  cpu {r['cpu_ms_per_command']:.3f} ms/cmd"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Benchmark: ELM327 response line handling, from notifications to frames.
+
+The previous path accumulated the whole response, then ran ``re.sub`` to
+strip NULs, decoded to str, ``re.split`` into lines, and the protocol
+parser checked each line with ``isHex`` and unhexlified the str again.
+The streaming tokenizer splits lines as 20-byte notifications arrive and
+hands bytes to the parser. Both sides end with the parsed CAN messages.
+"""
+
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_ringbuffer import lbc_response, notifications  # noqa: E402
+from custom_components.nissan_leaf_obd_ble.protocols.protocol import (  # noqa: E402
+    HEX_DIGITS,
+    Frame,
+    Message,
+)
+from custom_components.nissan_leaf_obd_ble.protocols.protocol_can import (  # noqa: E402
+    ISO_15765_4_11bit_500k,
+)
+from custom_components.nissan_leaf_obd_ble.tokenizer import ELMTokenizer  # noqa: E402
+from custom_components.nissan_leaf_obd_ble.utils import isHex  # noqa: E402
+
+RESPONSES = 4000
+
+
+def legacy_lines(chunks):
+    """The previous ELM327.__read post-processing."""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer.extend(chunk)
+        if b">" in buffer:
+            break
+    buffer = re.sub(b"\x00", b"", buffer)
+    if buffer.endswith(b">"):
+        buffer = buffer[:-1]
+    string = buffer.decode("utf-8", "ignore")
+    return [s.strip() for s in re.split("[\r\n]", string) if bool(s)]
+
+
+def legacy_parse(protocol, lines):
+    """The previous Protocol.__call__ preprocessing, then the shared parser."""
+    frames = []
+    for line in lines:
+        line_no_spaces = line.replace(" ", "")
+        if isHex(line_no_spaces):
+            frame = Frame(line_no_spaces)
+            if protocol._parse_frame(frame):
+                frames.append(frame)
+    message = Message(frames)
+    protocol._parse_message(message)
+    return [message]
+
+
+def streaming(protocol, chunks, tokenizer):
+    """Feed the tokenizer per notification, then parse the bytes lines."""
+    tokenizer.reset()
+    for chunk in chunks:
+        tokenizer.feed(chunk)
+    return protocol(tokenizer.take_lines())
+
+
+def _best_of(fns, responses, repeat=20):
+    """Return the best CPU microseconds per call for each function.
+
+    The functions are timed in alternating small batches so that noise on a
+    shared machine hits both sides equally.
+    """
+    best = [None] * len(fns)
+    batch = max(responses // repeat, 1)
+    for _ in range(repeat):
+        for n, fn in enumerate(fns):
+            start = time.process_time()
+            for _ in range(batch):
+                fn()
+            elapsed = (time.process_time() - start) / batch * 1e6
+            best[n] = elapsed if best[n] is None else min(best[n], elapsed)
+    return best
+
+
+def run(responses=RESPONSES):
+    """Run the benchmark and return CPU microseconds per response."""
+    chunks = notifications(lbc_response())
+    protocol = ISO_15765_4_11bit_500k()
+    tokenizer = ELMTokenizer()
+    assert legacy_parse(protocol, legacy_lines(chunks))[0].data == streaming(
+        protocol, chunks, tokenizer
+    )[0].data
+
+    legacy, stream = _best_of(
+        [
+            lambda: legacy_parse(protocol, legacy_lines(chunks)),
+            lambda: streaming(protocol, chunks, tokenizer),
+        ],
+        responses,
+    )
+
+    # the line handling alone: splitting plus the hex/non-hex classification
+    def legacy_split():
+        return [isHex(line.replace(" ", "")) for line in legacy_lines(chunks)]
+
+    def streaming_split():
+        tokenizer.reset()
+        for chunk in chunks:
+            tokenizer.feed(chunk)
+        return [
+            not line.replace(b" ", b"").translate(None, HEX_DIGITS)
+            for line in tokenizer.take_lines()
+        ]
+
+    legacy_lines_us, stream_lines_us = _best_of(
+        [legacy_split, streaming_split], responses
+    )
+    return {
+        "lbc_line_handling": {
+            "legacy_us": legacy_lines_us,
+            "streaming_us": stream_lines_us,
+        },
+        "lbc_to_messages": {"legacy_us": legacy, "streaming_us": stream},
+    }
+
+
+def main():
+    """Print the results."""
+    for name, r in run().items():
+        print(
+            f"{name}: legacy {r['legacy_us']:.2f} us  streaming {r['streaming_us']:.2f} us  "
+            f"({r['legacy_us'] / r['streaming_us']:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""Benchmark suite for the poll path, with machine-readable results.
+
+Each hot path is timed on its own, then a whole polling cycle is run end
+to end against the simulator (simulator.ELMSimulator, with its delays
+scaled to zero so only our own work is measured, and with the parked
+Leaf's broadcast frames on the bus):
+
+- ``buffer``: bleserial notifications into the RingBuffer, read back a
+  line at a time
+- ``line_splitting``: the ELMTokenizer splitting notifications into
+  lines, as ELM327.__read_lines waits on
+- ``protocol``: Protocol.__call__ (_parse_frame/_parse_message) on a
+  single frame and on a multi-frame response, the streaming
+  ISOTPReassembler, and the CompactReassembler on the same responses
+  formatted by the adapter (ATH0/ATCAF1)
+- ``decoders``: every command in commands.py, decoding the simulated
+  Leaf's answer
+- ``cycle``: NissanLeafObdBleApiClient.async_get_data, both for a cycle
+  that reads every command and for a steady state cycle that only reads
+  what is due (see commands.py intervals), and the full cycle again with
+  compact responses
+
+Per operation the results hold the best CPU time (``cpu_us``) and the
+peak memory traced by tracemalloc while running it once
+(``peak_alloc_bytes``). Cycles also report wall clock latency and the
+traffic exchanged with the adapter.
+
+Run ``python benchmarks/suite.py --output results.json`` and compare
+runs with ``--baseline old.json``.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_ringbuffer import lbc_response, notifications  # noqa: E402
+from benchmarks.bench_tokenizer import _best_of  # noqa: E402
+from custom_components.nissan_leaf_obd_ble.api import (  # noqa: E402
+    NissanLeafObdBleApiClient,
+)
+from custom_components.nissan_leaf_obd_ble.bleserial import bleserial  # noqa: E402
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands  # noqa: E402
+from custom_components.nissan_leaf_obd_ble.protocols.protocol_can import (  # noqa: E402
+    ISO_15765_4_11bit_500k,
+    CompactReassembler,
+    ISOTPReassembler,
+)
+from custom_components.nissan_leaf_obd_ble.simulator import (  # noqa: E402
+    ELMSimulator,
+    isotp_frames,
+    leaf_ecus,
+)
+from custom_components.nissan_leaf_obd_ble.tokenizer import ELMTokenizer  # noqa: E402
+
+SCHEMA_VERSION = 1
+ITERATIONS = 4000  # per micro benchmark
+CYCLES = 20  # per cycle benchmark
+
+
+def _peak_alloc(fn):
+    """Return the peak bytes traced by tracemalloc during one call of fn."""
+    fn()  # warm up caches so that only per-call allocations are seen
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        fn()
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+def _measure(fns, iterations):
+    """Return cpu_us and peak_alloc_bytes for each of a dict of functions."""
+    names = list(fns)
+    cpu = _best_of([fns[name] for name in names], iterations)
+    return {
+        name: {"cpu_us": us, "peak_alloc_bytes": _peak_alloc(fns[name])}
+        for name, us in zip(names, cpu, strict=True)
+    }
+
+
+def _lines(cmd, ecus):
+    """Return the ATH1/ATS0/ATCAF0 lines the simulated Leaf sends for cmd."""
+    ecu = ecus[int(cmd.header, 16)]
+    request = bytes.fromhex(cmd.command.decode())
+    response = ecu.handle(request[1 : 1 + request[0]])
+    return [
+        b"%03X" % ecu.response_id + frame.hex().upper().encode()
+        for frame in isotp_frames(response)
+    ]
+
+
+def _compact_lines(cmd, ecus):
+    """Return the ATH0/ATS0/ATCAF1 lines the simulated Leaf sends for cmd."""
+    ecu = ecus[int(cmd.header, 16)]
+    request = bytes.fromhex(cmd.command.decode())
+    response = ecu.handle(request[1 : 1 + request[0]])
+    frames = isotp_frames(response)
+    if len(frames) == 1:
+        return [response.hex().upper().encode()]
+    lines = [b"%03X" % len(response), b"0:" + frames[0][2:].hex().upper().encode()]
+    for n, frame in enumerate(frames[1:], start=1):
+        lines.append(b"%X:" % (n & 0x0F) + frame[1:].hex().upper().encode())
+    return lines
+
+
+def bench_buffer(iterations=ITERATIONS):
+    """bleserial receive path: notifications in, lines out."""
+    chunks = notifications(lbc_response())
+    port = bleserial("benchmark", None, None, None)
+
+    def readline():
+        # as bleserial.readline() after every notification
+        buffer = port._rx_buffer
+        lines = 0
+        for chunk in chunks:
+            port._notification_handler(None, chunk)
+            while (i := buffer.find(b"\r")) >= 0:
+                buffer.read(i + 1)
+                lines += 1
+        buffer.clear()
+        return lines
+
+    return _measure({"lbc_readline": readline}, iterations)
+
+
+def bench_line_splitting(iterations=ITERATIONS):
+    """ELMTokenizer: notifications split into lines as they arrive."""
+    tokenizer = ELMTokenizer()
+
+    def split(chunks):
+        def fn():
+            tokenizer.reset()
+            for chunk in chunks:
+                tokenizer.feed(chunk)
+            return tokenizer.take_lines()
+
+        return fn
+
+    return _measure(
+        {
+            "single_frame": split(notifications(b"79A0562110300A3\r\r>")),
+            "lbc": split(notifications(lbc_response())),
+        },
+        iterations,
+    )
+
+
+def bench_protocol(iterations=ITERATIONS):
+    """Protocol parsing of frames into messages."""
+    ecus = leaf_ecus()
+    protocol = ISO_15765_4_11bit_500k()
+    reassembler = ISOTPReassembler(protocol)
+    single = _lines(leaf_commands["speed"], ecus)
+    multi = _lines(leaf_commands["lbc"], ecus)
+    compact = CompactReassembler()
+    compact_single = _compact_lines(leaf_commands["speed"], ecus)
+    compact_multi = _compact_lines(leaf_commands["lbc"], ecus)
+
+    def streamed():
+        reassembler.reset()
+        for line in multi:
+            reassembler.feed(line)
+        return reassembler.message()
+
+    return _measure(
+        {
+            "single_frame": lambda: protocol(single),
+            "lbc": lambda: protocol(multi),
+            "lbc_isotp_streamed": streamed,
+            "single_frame_compact": lambda: compact(compact_single),
+            "lbc_compact": lambda: compact(compact_multi),
+        },
+        iterations,
+    )
+
+
+def bench_decoders(iterations=ITERATIONS):
+    """Every command decoding the simulated Leaf's answer."""
+    ecus = leaf_ecus()
+    protocol = ISO_15765_4_11bit_500k()
+    fns = {}
+    for name, cmd in leaf_commands.items():
+        lines = _lines(cmd, ecus)
+
+        def decode(cmd=cmd, lines=lines):
+            # the decoder trims message data, so parse afresh each time
+            return cmd.decode(protocol(lines))
+
+        fns[name] = decode
+    results = _measure(fns, iterations)
+    # the parsing done inside each call, measured once for reference
+    for name, cmd in leaf_commands.items():
+        lines = _lines(cmd, ecus)
+        (parse_us,) = _best_of([lambda lines=lines: protocol(lines)], iterations)
+        decode_us = max(results[name]["cpu_us"] - parse_us, 0.0)
+        results[name]["decode_only_us"] = decode_us
+    return results
+
+
+async def _cycles(cycles, full, compact=False):
+    ports = []
+
+    def transport():
+        ports.append(ELMSimulator(time_scale=0.0, bus_traffic=True))
+        return ports[-1]
+
+    client = NissanLeafObdBleApiClient("benchmark", transport=transport)
+    client.compact = compact
+    await client.async_get_data()  # connect, and learn frame counts
+    for _ in range(3):
+        client._scheduler.reset_due()
+        await client.async_get_data()
+
+    stats = ports[-1].stats
+    before = dict(stats)
+    wall = []
+    cpu = []
+    for _ in range(cycles):
+        if full:
+            client._scheduler.reset_due()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        data = await client.async_get_data()
+        wall.append(time.perf_counter() - start_wall)
+        cpu.append(time.process_time() - start_cpu)
+
+    if full:
+        client._scheduler.reset_due()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        await client.async_get_data()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    await client.async_disconnect()
+
+    wall.sort()
+    return {
+        "values": len(data),
+        "wall_ms": {
+            "best": wall[0] * 1e3,
+            "median": wall[len(wall) // 2] * 1e3,
+            "worst": wall[-1] * 1e3,
+        },
+        "cpu_ms": min(cpu) * 1e3,
+        "peak_alloc_bytes": peak,
+        # adapter traffic per cycle
+        "commands": (stats["commands"] - before["commands"]) / cycles,
+        "can_frames": (stats["can_frames"] - before["can_frames"]) / cycles,
+        "bytes_written": (stats["bytes_written"] - before["bytes_written"]) / cycles,
+        "bytes_received": (stats["bytes_received"] - before["bytes_received"])
+        / cycles,
+    }
+
+
+def bench_cycle(cycles=CYCLES):
+    """async_get_data against the simulator."""
+    return {
+        "full": asyncio.run(_cycles(cycles, full=True)),
+        "steady": asyncio.run(_cycles(cycles, full=False)),
+        "full_compact": asyncio.run(_cycles(cycles, full=True, compact=True)),
+    }
+
+
+def run(iterations=ITERATIONS, cycles=CYCLES):
+    """Run the whole suite and return its results."""
+    return {
+        "schema": SCHEMA_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "iterations": iterations,
+        "cycles": cycles,
+        "results": {
+            "buffer": bench_buffer(iterations),
+            "line_splitting": bench_line_splitting(iterations),
+            "protocol": bench_protocol(iterations),
+            "decoders": bench_decoders(iterations),
+            "cycle": bench_cycle(cycles),
+        },
+    }
+
+
+def _flatten(results, prefix=""):
+    """Return {"a.b.c": number} for every number in nested results."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, int | float):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(baseline, current):
+    """Return {metric: (baseline, current, ratio)} for metrics in both runs."""
+    old = _flatten(baseline["results"])
+    new = _flatten(current["results"])
+    return {
+        key: (old[key], new[key], new[key] / old[key] if old[key] else None)
+        for key in sorted(old.keys() & new.keys())
+    }
+
+
+def main():
+    """Run the suite and print (or save) the JSON results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument(
+        "--baseline", help="JSON results of an earlier run to compare with"
+    )
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    parser.add_argument("--cycles", type=int, default=CYCLES)
+    args = parser.parse_args()
+
+    results = run(args.iterations, args.cycles)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key, (old, new, ratio) in compare(baseline, results).items():
+            change = f"{ratio:.2f}x" if ratio is not None else "n/a"
+            print(f"{key}: {old:.4g} -> {new:.4g} ({change})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
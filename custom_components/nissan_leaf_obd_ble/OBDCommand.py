@@ -49,6 +49,7 @@ class OBDCommand:
         decoder,
         header,
         fast=False,
+        interval=None,
     ) -> None:
         """Initialise."""
         self.name = name  # human readable name (also used as key in commands dict)
@@ -58,6 +59,7 @@ class OBDCommand:
         self.decode = decoder  # decoding function
         self.header = header  # header used for the queries
         self.fast = fast  # can an extra digit be added to the end of the command? (to make the ELM return early)
+        self.interval = interval  # seconds between refreshes (None = every poll)
 
     def clone(self):
         """Copy constructor."""
@@ -69,8 +71,14 @@ class OBDCommand:
             self.decode,
             self.header,
             self.fast,
+            self.interval,
         )
 
+    @property
+    def fields(self):
+        """Return the fields the decoder was compiled from, if any (see fields.py)."""
+        return getattr(self.decode, "fields", None)
+
     @property
     def mode(self):
         """Return the mode."""
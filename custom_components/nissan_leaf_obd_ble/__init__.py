@@ -7,23 +7,71 @@ https://github.com/pbutterworth/nissan-leaf-obd-ble
 import logging
 
 from bleak_retry_connector import get_device
+import voluptuous as vol
 
 from homeassistant.components import bluetooth
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_ADDRESS
 from homeassistant.core_config import Config
-from homeassistant.core import HomeAssistant, callback
-from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+    callback,
+)
+from homeassistant.exceptions import ConfigEntryNotReady, HomeAssistantError
+from homeassistant.helpers.storage import Store
 
 from .api import NissanLeafObdBleApiClient
-from .const import DOMAIN, PLATFORMS, STARTUP_MESSAGE
+from .const import (
+    CONF_PROFILE,
+    DOMAIN,
+    PLATFORMS,
+    PROFILE_STORAGE_VERSION,
+    SERVICE_PROBE,
+    STARTUP_MESSAGE,
+    TRANSCRIPT_FILE,
+)
 from .coordinator import NissanLeafObdBleDataUpdateCoordinator
+from .monitor import CANMonitor
+from .profile import VehicleProfile
+from .transcript import TranscriptRecorder
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+PROBE_SCHEMA = vol.Schema({vol.Optional(ATTR_CONFIG_ENTRY_ID): str})
+
 
 async def async_setup(hass: HomeAssistant, config: Config):
     """Set up this integration using YAML is not supported."""
+
+    async def async_probe(call: ServiceCall) -> ServiceResponse:
+        """Probe what each car (or the given one) supports."""
+        coordinators = hass.data.get(DOMAIN, {})
+        entry_id = call.data.get(ATTR_CONFIG_ENTRY_ID)
+        if entry_id is not None:
+            if entry_id not in coordinators:
+                raise HomeAssistantError(f"No loaded entry {entry_id}")
+            coordinators = {entry_id: coordinators[entry_id]}
+        results = {}
+        for entry_id, coordinator in coordinators.items():
+            summary = await coordinator.async_probe()
+            if summary is None:
+                raise HomeAssistantError(
+                    "The car did not answer, check that it is turned on"
+                )
+            results[entry_id] = summary
+        return results
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PROBE,
+        async_probe,
+        schema=PROBE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
     return True
 
 
@@ -43,6 +91,12 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         )
 
     api = NissanLeafObdBleApiClient(ble_device)
+    # what was learned about this car on previous runs, or else what the
+    # capability probe found when it was set up
+    store = Store(hass, PROFILE_STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}")
+    stored = await store.async_load()
+    api.profile = VehicleProfile.from_dict(stored or entry.data.get(CONF_PROFILE))
+    api.profile.dirty = stored is None and CONF_PROFILE in entry.data
     # Provide default options if none exist yet
     options = dict(entry.options) if entry.options else {
         "cache_values": False,
@@ -50,9 +104,12 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
         "slow_poll": 300,
         "xs_poll": 3600,
     }
+    api.recorder = _transcript_recorder(hass, entry, options)
+    api.compact = options.get("compact_responses", False)
     coordinator = NissanLeafObdBleDataUpdateCoordinator(
-        hass, address=address, api=api, options=options
+        hass, address=address, api=api, options=options, store=store
     )
+    api.monitor = _can_monitor(coordinator, options)
 
     hass.data[DOMAIN][entry.entry_id] = coordinator
 
@@ -82,6 +139,10 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     async def update_options_listener(hass: HomeAssistant | None, entry: ConfigEntry):
         """Handle options update."""
         coordinator.options = entry.options
+        # takes effect from the next session with the dongle
+        api.recorder = _transcript_recorder(hass, entry, entry.options)
+        api.compact = entry.options.get("compact_responses", False)
+        api.monitor = _can_monitor(coordinator, entry.options)
 
     entry.async_on_unload(
         entry.add_update_listener(update_options_listener)
@@ -91,9 +152,29 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     return True
 
 
+def _transcript_recorder(hass: HomeAssistant, entry: ConfigEntry, options):
+    """Return a recorder for the dongle traffic if the user enabled it."""
+    if not options.get("record_transcript", False):
+        return None
+    path = hass.config.path(TRANSCRIPT_FILE.format(entry_id=entry.entry_id))
+    _LOGGER.info("Recording dongle traffic to %s", path)
+    return TranscriptRecorder(path)
+
+
+def _can_monitor(coordinator: NissanLeafObdBleDataUpdateCoordinator, options):
+    """Return a monitor for broadcast frames if the user enabled it."""
+    if not options.get("monitor_broadcasts", False):
+        return None
+    return CANMonitor(on_values=coordinator.async_monitor_values)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Handle removal of an entry."""
     unloaded = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    coordinator = hass.data[DOMAIN].get(entry.entry_id)
+    if coordinator is not None:
+        await coordinator.api.async_disconnect()
+        await coordinator.async_flush_transcript()
     hass.data.pop(DOMAIN)
     return unloaded
 
@@ -1,15 +1,35 @@
 """API for nissan leaf obd ble."""
 
-# import asyncio
+import asyncio
+from collections.abc import Callable
+from itertools import groupby
 import logging
+from operator import attrgetter
+import time
 
 from bleak.backends.device import BLEDevice
 
+from .breaker import CircuitBreakers
+from .capabilities import probe_capabilities
 from .commands import leaf_commands
+from .deadline import Deadline
+from .elm327 import OBDStatus
+from .monitor import CANMonitor
 from .obd import OBD
+from .profile import VehicleProfile
+from .scheduler import QueryScheduler
+from .timeouts import ResponseTimeouts
+from .tracing import Tracer
+from .transcript import TranscriptRecorder
+from .uds import NEGATIVE, POSITIVE, classify
 
 _LOGGER: logging.Logger = logging.getLogger(__package__)
 
+# wall-clock budget for the queries of a polling cycle, in seconds: well
+# within the fastest polling interval, so that a stuck dongle can't hold
+# up the coordinator
+CYCLE_BUDGET = 8.0
+
 
 class NissanLeafObdBleApiClient:
     """API for connecting to the Nissan Leaf OBD BLE dongle."""
@@ -17,9 +37,190 @@ class NissanLeafObdBleApiClient:
     def __init__(
         self,
         ble_device: BLEDevice,
+        transport: Callable[[], object] | None = None,
     ) -> None:
-        """Initialise."""
+        """Initialise.
+
+        transport optionally builds the serial port for each session
+        (e.g. a simulator) instead of connecting to ble_device over BLE.
+        """
         self._ble_device = ble_device
+        self._transport = transport
+        self._api: OBD | None = None  # long-lived session, kept open while the car is on
+        # learned per-vehicle settings; replaced by the stored profile on setup
+        self.profile = VehicleProfile()
+        self._lock = asyncio.Lock()
+        # the "unknown" command goes first: if it gets no response, the car is off
+        self._scheduler = QueryScheduler(probe=leaf_commands["unknown"])
+        # command name -> its latest value, carried forward while the
+        # command isn't due, or isn't sent (breaker open, out of time)
+        self._values: dict[str, dict] = {}
+        # timing of every stage of a cycle, kept across sessions
+        self.tracer = Tracer()
+        # ECU response latencies, for the dongle's response timeout
+        self.timeouts = ResponseTimeouts()
+        # ECUs that stopped answering, skipped until they answer a trial
+        self.breakers = CircuitBreakers()
+        # set to record the raw traffic with the dongle (opt-in)
+        self.recorder: TranscriptRecorder | None = None
+        # set to listen to broadcast frames between cycles (opt-in)
+        self.monitor: CANMonitor | None = None
+        # have the dongle format responses itself, to save BLE bytes (opt-in)
+        self.compact = False
+        # how the last session left the dongle: None before the first one,
+        # else whether it put back the settings it changed
+        self._restored: bool | None = None
+        # counters exposed through diagnostics
+        self.stats = {
+            "cycles": 0,
+            "at_commands_sent": 0,  # header settings sent in the last cycle
+            "at_commands_saved": 0,  # header settings skipped in the last cycle
+            "at_commands_saved_total": 0,
+            "warm_starts": 0,  # sessions that didn't need to reset the dongle
+            "deadlines_exceeded": 0,  # cycles cut short by CYCLE_BUDGET
+        }
+
+    @property
+    def connected(self) -> bool:
+        """Return True if a session to the dongle is currently open."""
+        return self._api is not None and self._api.is_alive()
+
+    async def _async_get_session(self) -> OBD | None:
+        """Return an open OBD session, reusing the previous one if it is healthy."""
+        if self._api is not None:
+            if self._api.is_alive():
+                return self._api
+            _LOGGER.debug("Session to dongle lost, reconnecting")
+            await self._api.close()
+            self._restored = self._api.clean_close
+            self._api = None
+
+        # start from the latencies found by a capability probe, if any
+        for header, samples in self.profile.latencies.items():
+            self.timeouts.seed(header.encode(), samples)
+        port = self._transport() if self._transport is not None else None
+        with self.tracer.span(stage="session_connect"):
+            api = await OBD.create(
+                self._ble_device,
+                protocol="6",
+                profile=self.profile,
+                port=port,
+                tracer=self.tracer,
+                recorder=self.recorder,
+                compact=self.compact,
+                timeouts=self.timeouts,
+                # the dongle likely kept its setup, unless it lost power
+                warm_start=self._restored is not None,
+                restored=bool(self._restored),
+            )
+        if api is None or api.status() == OBDStatus.NOT_CONNECTED:
+            return None
+        if api.warm_started:
+            self.stats["warm_starts"] += 1
+        self._api = api
+        return api
+
+    def diagnostics(self) -> dict:
+        """Return connection state and counters for the diagnostics download."""
+        return {
+            "connected": self.connected,
+            "compact": self.compact,
+            "generation": self.profile.generation,
+            # ambiguous compact responses asked for again in this session
+            "compact_fallbacks": self._api.compact_fallbacks if self._api else 0,
+            **self.stats,
+            "timing": self.tracer.summary(),
+            "response_timeouts": self.timeouts.summary(),
+            "circuit_breakers": self.breakers.summary(),
+            "unsupported_commands": sorted(self.profile.unsupported),
+        }
+
+    async def async_disconnect(self) -> None:
+        """Close the session to the dongle, if one is open."""
+        async with self._lock:
+            await self._async_close_session()
+
+    async def _async_close_session(self) -> None:
+        if self._api is not None:
+            _LOGGER.debug("Closing session to dongle")
+            await self._api.close()
+            self._restored = self._api.clean_close
+            self._api = None
+        # the next session starts with a full read, of every ECU
+        self._scheduler.reset_due()
+        self.breakers.reset()
+        self._values = {}
+        if self.monitor is not None:
+            self.monitor.reset()
+
+    async def async_probe(self) -> dict | None:
+        """Find out what the car supports, into the profile (see capabilities.py).
+
+        Returns a summary, or None if the car could not be reached.
+        """
+        if self._ble_device is None:
+            return None
+
+        async with self._lock:
+            api = await self._async_get_session()
+            if api is None:
+                return None
+            try:
+                with self.tracer.span(stage="probe"):
+                    return await probe_capabilities(
+                        api, leaf_commands.values(), self._scheduler.probe
+                    )
+            except Exception:
+                await self._async_close_session()
+                raise
+
+    def _update_stats(self, api: OBD, sent: int, saved: int) -> None:
+        saved = api.at_commands_saved - saved
+        self.stats["cycles"] += 1
+        self.stats["at_commands_sent"] = api.at_commands_sent - sent
+        self.stats["at_commands_saved"] = saved
+        self.stats["at_commands_saved_total"] += saved
+
+    async def _async_query(
+        self,
+        api: OBD,
+        commands: list,
+        deadline: Deadline,
+        breakers: CircuitBreakers | None = None,
+    ) -> list:
+        """Query commands for one ECU, feeding their latency to the scheduler."""
+        start = time.monotonic()
+        responses = await api.query_batch(commands, deadline, breakers)
+        per_command = (time.monotonic() - start) / len(commands)
+        for command in commands:
+            self._scheduler.record(command, per_command)
+        return responses
+
+    def _observe_support(self, results) -> None:
+        """Count the commands left unanswered, or rejected, by an answering ECU.
+
+        A command to an ECU that answered nothing this cycle tells nothing
+        about the command: the ECU may be asleep (see breaker.py).
+        """
+        answering = {cmd.header for cmd, response in results if response.messages}
+        for cmd, response in results:
+            if response.value is not None:
+                self.profile.observe_answer(cmd)
+            elif response.messages:
+                kind, nrc = classify(response.messages[0].data)
+                if kind == NEGATIVE:
+                    self.profile.observe_missing(cmd, nrc)
+                elif kind == POSITIVE:
+                    self.profile.observe_answer(cmd)
+            elif cmd.header in answering:
+                self.profile.observe_missing(cmd)
+
+    async def _async_start_monitor(self, api: OBD) -> None:
+        """Listen to broadcast frames until the next cycle."""
+        # one ID at a time: no filter passes them all and little else
+        can_filter, can_mask = self.monitor.next_filter()
+        if not await api.monitor(self.monitor.feed_line, can_filter, can_mask):
+            _LOGGER.debug("Could not start monitoring the bus")
 
     async def async_get_data(self) -> dict:
         """Get data from the API."""
@@ -27,19 +228,84 @@ class NissanLeafObdBleApiClient:
         if self._ble_device is None:
             return {}
 
-        api = await OBD.create(self._ble_device, protocol="6")
+        async with self._lock:
+            with self.tracer.span(stage="cycle"):
+                return await self._async_get_data()
 
+    async def _async_get_data(self) -> dict:
+        # connecting is bounded by its own timeouts, and counts against
+        # the budget of the queries
+        deadline = Deadline(CYCLE_BUDGET)
+        api = await self._async_get_session()
         if api is None:
-            return None
+            return {}
 
         data = {}
-        for command in leaf_commands.values():
-            response = await api.query(command, force=True)
-            # the first command is the Mystery command. If this doesn't have a response, then none of the other will
-            if command.name == "unknown" and len(response.messages) == 0:
-                break
-            if response.value is not None:
-                data.update(response.value)  # send the command, and parse the response
+        sent, saved = api.at_commands_sent, api.at_commands_saved
+        try:
+            if self.monitor is not None:
+                await api.stop_monitor()
+            now = time.monotonic()
+            self.breakers.start_cycle()
+            probe = self._scheduler.probe
+            # commands this car doesn't support drop out until they expire
+            commands = [
+                cmd
+                for cmd in leaf_commands.values()
+                if cmd == probe or self.profile.is_supported(cmd)
+            ]
+            due = self._scheduler.due(commands, now)
+            plan = self._scheduler.plan(due, api.header)
+            if plan and plan[0] == probe:
+                # the probe is never skipped, so a car that was off is
+                # noticed as soon as it is back on
+                response = (await self._async_query(api, plan[:1], deadline))[0]
+                # the first command is the Mystery command. If this doesn't have a response, then none of the other will
+                plan = plan[1:] if len(response.messages) > 0 else []
+                if response.messages:
+                    self.breakers.success(probe.header)
+                if response.value is not None:
+                    data.update(response.value)
+                    self._values[probe.name] = response.value
+            # the plan is grouped by header: each group can share requests
+            results = []
+            for _, group in groupby(plan, key=attrgetter("header")):
+                # likely unsupported commands last, so that they can't
+                # trip the breaker before the ECU has answered anything
+                group = sorted(group, key=self.profile.misses)
+                responses = await self._async_query(api, group, deadline, self.breakers)
+                for command, response in zip(group, responses, strict=True):
+                    results.append((command, response))
+                    if response.value is not None:
+                        data.update(response.value)
+                        self._values[command.name] = response.value
+                        self._scheduler.polled(command, now)
+                    elif response.command is not None:
+                        # sent and not answered: its last value is stale
+                        self._values.pop(command.name, None)
+        except Exception:
+            # don't reuse a session that failed part way through a cycle
+            await self._async_close_session()
+            raise
+        finally:
+            self._update_stats(api, sent, saved)
+        if deadline.expired:
+            # the rest stays due, and the session can be used again
+            _LOGGER.debug("Cycle ran out of time, returning what was read")
+            self.stats["deadlines_exceeded"] += 1
+        else:
+            self._observe_support(results)
+        if data:
+            # carry forward the values of the commands not sent this cycle,
+            # and those heard since the last one
+            values = {}
+            for value in self._values.values():
+                values.update(value)
+            if self.monitor is not None:
+                values.update(self.monitor.values)
+            values.update(data)
+            data = values
+            if self.monitor is not None:
+                await self._async_start_monitor(api)
         _LOGGER.debug("Returning data: %s", data)
-        await api.close()
         return data
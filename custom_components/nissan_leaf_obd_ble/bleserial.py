@@ -1,15 +1,22 @@
 """Module to implement a serial-like interface over BLE GATT."""
 
 import asyncio
+from collections.abc import Callable
 import logging
 
 from bleak import BleakError
 from bleak.backends.device import BLEDevice
 from bleak_retry_connector import establish_connection, BleakClientWithServiceCache
 
+from .ringbuffer import RingBuffer
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
 
+# how long a read or a write may wait for the dongle, unless told otherwise:
+# a dongle that stops answering must not block its caller indefinitely
+DEFAULT_TIMEOUT = 2.0
+
 
 class bleserial:
     """Encapsulates the ble connection and make it appear something like a UART port."""
@@ -30,16 +37,64 @@ class bleserial:
         self.characteristic_uuid_read = characteristic_uuid_read
         self.characteristic_uuid_write = characteristic_uuid_write
         self.client: Optional[BleakClientWithServiceCache] = None
-        self._rx_buffer = bytearray()
-        self._timeout = None
+        self._rx_buffer = RingBuffer()
+        self._timeout = DEFAULT_TIMEOUT
+        self._write_timeout = DEFAULT_TIMEOUT
+        # readers blocked until their condition on the rx buffer is met:
+        # list of (predicate, future), resolved from _notification_handler
+        self._waiters: list[tuple[Callable[[], bool], asyncio.Future]] = []
+        # optional streaming consumer (e.g. a line tokenizer) that receives
+        # notifications directly instead of the rx buffer
+        self._consumer = None
+
+    async def _wait_until(self, predicate: Callable[[], bool]):
+        """Block until predicate() holds, woken by incoming notifications."""
+        if predicate():
+            return
+        future = asyncio.get_running_loop().create_future()
+        waiter = (predicate, future)
+        self._waiters.append(waiter)
+        try:
+            await future
+        finally:
+            self._waiters.remove(waiter)
+
+    def _wake_waiters(self):
+        """Resolve every waiter whose condition is now satisfied."""
+        for predicate, future in self._waiters:
+            if not future.done() and predicate():
+                future.set_result(None)
+
+    async def wait_until(self, predicate: Callable[[], bool], timeout=None) -> bool:
+        """Wait until predicate() holds or the timeout expires.
+
+        The predicate is re-evaluated each time a notification arrives.
+        Returns whether it was satisfied.
+        """
+        try:
+            await asyncio.wait_for(self._wait_until(predicate), timeout=timeout)
+        except TimeoutError:
+            return predicate()
+        return True
+
+    def set_consumer(self, consumer):
+        """Route incoming notifications to consumer.feed() instead of the rx buffer.
+
+        Pass None to go back to buffering notifications for read()/readline().
+        While a consumer is set, the rx buffer is bypassed: ELM327 sets its
+        tokenizer for the whole session, so the rx buffer only serves
+        read()/read_until()/readline() callers that don't set one.
+        """
+        self._consumer = consumer
 
     async def _wait_for_data(self, size):
-        while len(self._rx_buffer) < size:
-            await asyncio.sleep(0.01)
+        await self._wait_until(lambda: len(self._rx_buffer) >= size)
 
     async def _wait_for_line(self):
-        while b"\n" not in self._rx_buffer:
-            await asyncio.sleep(0.01)
+        await self._wait_until(lambda: self._rx_buffer.find(b"\n") >= 0)
+
+    async def _wait_for_marker(self, expected):
+        await self._wait_until(lambda: self._rx_buffer.find(expected) >= 0)
 
     def reset_input_buffer(self):
         """Reset the input buffer."""
@@ -61,6 +116,11 @@ class bleserial:
         """Return the number of bytes in the receive buffer."""
         return len(self._rx_buffer)
 
+    @property
+    def is_connected(self):
+        """Return True if the underlying BLE link is still up."""
+        return self.client is not None and self.client.is_connected
+
     @property
     def timeout(self):
         """Timeout duration."""
@@ -84,7 +144,12 @@ class bleserial:
     def _notification_handler(self, sender, data):
         """Handle when a GATT notification arrives."""
         logger.debug("Notification received: %s", data)
-        self._rx_buffer.extend(data)
+        if self._consumer is not None:
+            self._consumer.feed(data)
+        else:
+            self._rx_buffer.extend(data)
+        if self._waiters:
+            self._wake_waiters()
 
     async def open(self):
         """Open the port."""
@@ -127,21 +192,52 @@ class bleserial:
                 self.characteristic_uuid_write,
                 data,
             )
-            await self.client.write_gatt_char(self.characteristic_uuid_write, data)
+            await asyncio.wait_for(
+                self.client.write_gatt_char(self.characteristic_uuid_write, data),
+                timeout=self._write_timeout,
+            )
             logger.debug("Data written")
+        except TimeoutError as e:
+            logger.info("Write operation timed out")
+            raise BleakError("Write operation timed out") from e
         except BleakError as e:
             logger.info("Failed to write data: %s", e)
             raise
 
     async def read(self, size=1):
-        """Read from the buffer."""
+        """Read from the buffer.
+
+        Like pyserial, returns fewer than size bytes if the timeout expires.
+        """
+        try:
+            try:
+                await asyncio.wait_for(self._wait_for_data(size), timeout=self._timeout)
+            except TimeoutError:
+                logger.debug("Read operation timed out")
+            data = self._rx_buffer.read(size)
+            logger.debug("Read data: %s", data)
+            return data
+        except Exception as e:
+            logger.info("Failed to read data: %s", e)
+            raise
+
+    async def read_until(self, expected=b"\n"):
+        """Read up to and including the expected sequence.
+
+        Like pyserial, returns whatever has arrived if the timeout expires.
+        """
         try:
-            while len(self._rx_buffer) < size:
-                await asyncio.sleep(0.01)
-            data = self._rx_buffer[:size]
-            self._rx_buffer = self._rx_buffer[size:]
+            try:
+                await asyncio.wait_for(
+                    self._wait_for_marker(expected), timeout=self._timeout
+                )
+                index = self._rx_buffer.index(expected) + len(expected)
+            except TimeoutError:
+                logger.debug("Read until %s timed out", expected)
+                index = len(self._rx_buffer)
+            data = self._rx_buffer.read(index)
             logger.debug("Read data: %s", data)
-            return bytes(data)
+            return data
         except Exception as e:
             logger.info("Failed to read data: %s", e)
             raise
@@ -151,10 +247,9 @@ class bleserial:
         try:
             await asyncio.wait_for(self._wait_for_line(), timeout=self._timeout)
             index = self._rx_buffer.index(b"\n") + 1
-            data = self._rx_buffer[:index]
-            self._rx_buffer = self._rx_buffer[index:]
+            data = self._rx_buffer.read(index)
             logger.debug("Read line: %s", data)
-            return bytes(data)
+            return data
         except TimeoutError as e:
             logger.info("Readline operation timed out")
             raise BleakError("Readline operation timed out") from e
@@ -0,0 +1,92 @@
+"""Circuit breakers that stop asking an ECU which has stopped answering.
+
+When the car is only partly awake, some ECUs (typically the meter, 743)
+don't answer at all, and every query sent to them waits out the ELM's
+response timeout before "NO DATA". Each ECU gets a breaker: the first
+query it leaves unanswered opens it, and its other queries are skipped
+for the rest of the cycle. On a later cycle the breaker is half-open:
+one query is let through, and if it is answered the ECU is asked
+everything again. Each further unanswered trial doubles the number of
+cycles until the next one, up to MAX_BACKOFF.
+
+An ECU that has answered a query in the current cycle is awake: a query
+it then leaves unanswered (e.g. a DID it doesn't have) doesn't open its
+breaker.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 8  # cycles between trial queries to a silent ECU
+
+
+class CircuitBreakers:
+    """Per-ECU breakers, counted in polling cycles."""
+
+    def __init__(self) -> None:
+        """Initialise."""
+        self._cycle = 0
+        self._retry: dict[bytes, int] = {}  # header -> cycle of the next trial
+        self._backoff: dict[bytes, int] = {}  # header -> cycles after a failed trial
+        self.skipped: dict[bytes, int] = {}  # header -> queries not sent
+        self._answered: set[bytes] = set()  # headers that answered this cycle
+
+    def start_cycle(self) -> None:
+        """Mark the start of a polling cycle."""
+        self._cycle += 1
+        self._answered.clear()
+
+    def allow(self, header: bytes) -> bool:
+        """Return True if a query to the ECU should be sent.
+
+        A query that is not sent is counted as skipped.
+        """
+        retry = self._retry.get(header)
+        if retry is None or self._cycle >= retry:
+            return True
+        self.skipped[header] = self.skipped.get(header, 0) + 1
+        return False
+
+    def failure(self, header: bytes) -> None:
+        """Record a query the ECU left unanswered."""
+        if header in self._answered:
+            return
+        backoff = self._backoff.get(header)
+        if backoff is None:
+            logger.debug("No answer from %s, skipping it this cycle", header)
+            self._retry[header] = self._cycle + 1
+            self._backoff[header] = 2
+        else:
+            logger.debug("Still no answer from %s, next try in %d cycles", header, backoff)
+            self._retry[header] = self._cycle + backoff
+            self._backoff[header] = min(backoff * 2, MAX_BACKOFF)
+
+    def success(self, header: bytes) -> None:
+        """Record an answer from the ECU, closing its breaker."""
+        self._answered.add(header)
+        if self._retry.pop(header, None) is not None:
+            logger.debug("%s answered again", header)
+        self._backoff.pop(header, None)
+
+    def is_open(self, header: bytes) -> bool:
+        """Return True while queries to the ECU are being skipped."""
+        return header in self._retry
+
+    def reset(self) -> None:
+        """Close every breaker, e.g. for a new session."""
+        self._retry.clear()
+        self._backoff.clear()
+        self._answered.clear()
+
+    def summary(self) -> dict:
+        """Return each ECU's breaker state and skipped query count."""
+        summary = {}
+        for header in sorted(self.skipped.keys() | self._retry.keys()):
+            retry = self._retry.get(header)
+            summary[header.decode()] = {
+                "open": retry is not None,
+                "retry_in": max(retry - self._cycle, 0) if retry is not None else None,
+                "skipped": self.skipped.get(header, 0),
+            }
+        return summary
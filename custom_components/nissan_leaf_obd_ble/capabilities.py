@@ -0,0 +1,126 @@
+"""Find out what a car supports, to start polling with a full profile.
+
+Left to itself, the integration learns about a car while polling: frame
+counts settle after a few cycles, response timeouts after a few dozen
+answers, and an unsupported command is only dropped after it has cost a
+timeout on several cycles (see profile.py). probe_capabilities() does
+all of that up front, in one session, with the car on:
+
+- every command is sent, and those answered are sent STABLE_HITS times,
+  so that their frame counts can be relied on from the first cycle
+- a command its ECU leaves unanswered, or rejects for good, while
+  answering others is recorded as unsupported; one rejected for now
+  (e.g. conditions not correct) is left to be tried when polling
+- the latencies measured along the way are kept, to start each ECU's
+  response timeout from
+- the model generation is told from the length of the lbc response
+
+The probe can be run again at any time (e.g. after a firmware update):
+whatever it finds replaces what was known about each command.
+"""
+
+import logging
+
+from .OBDCommand import OBDCommand
+from .obd import OBD
+from .profile import VehicleProfile
+from .uds import NEGATIVE, PERMANENT_NRCS, POSITIVE, classify
+
+logger = logging.getLogger(__name__)
+
+# total length of the lbc (21 01) response of each generation
+GENERATIONS = {
+    0x29: "ZE0",  # 2011-2013, 24 kWh
+    0x35: "AZE0",  # 2013-2017, 24/30 kWh
+    0x3D: "ZE1",  # 2018 on, 40/62 kWh
+}
+LBC = "lbc"
+
+
+def generation(lbc_length: int) -> str | None:
+    """Return the model generation for an lbc response length, if known."""
+    return GENERATIONS.get(lbc_length)
+
+
+def _unpadded(cmd: OBDCommand) -> OBDCommand:
+    """Return a copy of cmd whose responses keep their length (see OBDCommand)."""
+    cmd = cmd.clone()
+    cmd.bytes = 0
+    return cmd
+
+
+async def probe_capabilities(
+    obd: OBD, commands, wake: OBDCommand | None = None
+) -> dict | None:
+    """Send every command once or more, recording the results in obd.profile.
+
+    wake is sent first: if the car doesn't answer it, nothing else is
+    sent and None is returned. Otherwise, returns a summary of what was
+    found.
+    """
+    profile = obd.profile
+    if wake is not None:
+        response = await obd.query(wake, force=True)
+        if not response.messages:
+            logger.debug("No answer to %s, the car is off", wake.name)
+            return None
+
+    results = {}
+    for cmd in commands:
+        if cmd == wake:
+            continue
+        profile.forget_unsupported(cmd)
+        # the lbc response is padded to the AZE0 length, unless asked unpadded
+        first = _unpadded(cmd) if cmd.name == LBC else cmd
+        response = await obd.query(first, force=True)
+        kind, nrc = (
+            classify(response.messages[0].data) if response.messages else (None, None)
+        )
+        if kind == POSITIVE:
+            # settle the frame count, and collect latencies
+            for _ in range(VehicleProfile.STABLE_HITS - 1):
+                await obd.query(cmd, force=True)
+            if cmd.name == LBC:
+                length = len(response.messages[0].data)
+                profile.generation = generation(length)
+                logger.debug("lbc response is %d bytes: %s", length, profile.generation)
+        results[cmd] = (kind, nrc)
+
+    answering = {cmd.header for cmd, (kind, _) in results.items() if kind is not None}
+    if wake is not None:
+        answering.add(wake.header)
+    for cmd, (kind, nrc) in results.items():
+        if kind is None and cmd.header in answering:
+            profile.set_unsupported(cmd)
+        elif kind == NEGATIVE and nrc not in PERMANENT_NRCS:
+            logger.debug("%s rejected for now (NRC 0x%02X)", cmd.name, nrc)
+
+    for header in answering:
+        samples = obd.timeouts.samples(header)
+        if samples:
+            profile.latencies[header.decode()] = [round(s, 4) for s in samples]
+    profile.dirty = True
+    return _summary(obd, results, answering)
+
+
+def _summary(obd: OBD, results, answering) -> dict:
+    """Return what a probe found, for the config flow and the service."""
+    profile = obd.profile
+    supported = [cmd.name for cmd, (kind, _) in results.items() if kind == POSITIVE]
+    return {
+        "generation": profile.generation,
+        "ecus": {
+            header.decode(): header in answering
+            for header in sorted({cmd.header for cmd in results})
+        },
+        "supported": supported,
+        "unsupported": [
+            cmd.name for cmd in results if not profile.is_supported(cmd)
+        ],
+        "frame_counts": {
+            cmd.name: profile.frame_count(cmd)
+            for cmd, (kind, _) in results.items()
+            if kind == POSITIVE
+        },
+        "response_timeouts": obd.timeouts.summary(),
+    }
@@ -1,5 +1,7 @@
 """Adds config flow for Nissan Leaf OBD BLE."""
 
+import asyncio
+import logging
 from typing import Any
 
 from bluetooth_data_tools import human_readable_name
@@ -8,15 +10,20 @@ import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.components.bluetooth import (
     BluetoothServiceInfoBleak,
+    async_ble_device_from_address,
     async_discovered_service_info,
 )
 from homeassistant.const import CONF_ADDRESS
 from homeassistant.core import callback
 from homeassistant.data_entry_flow import FlowResult
 
-from .const import DOMAIN
+from .api import NissanLeafObdBleApiClient
+from .const import CONF_PROFILE, DOMAIN
+
+_LOGGER: logging.Logger = logging.getLogger(__package__)
 
 LOCAL_NAMES = {"OBDBLE"}
+PROBE_TIMEOUT = 120  # seconds
 
 
 class NissanLeafObdBleFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
@@ -30,6 +37,10 @@ class NissanLeafObdBleFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
         self._errors = {}
         self._discovery_info: BluetoothServiceInfoBleak | None = None
         self._discovered_devices: dict[str, BluetoothServiceInfoBleak] = {}
+        self._address: str | None = None
+        self._title: str | None = None
+        self._probe_task: asyncio.Task | None = None
+        self._profile: dict | None = None  # found by the capability probe
 
     @staticmethod
     @callback
@@ -65,12 +76,9 @@ class NissanLeafObdBleFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
                 discovery_info.address, raise_on_progress=False
             )
             self._abort_if_unique_id_configured()
-            return self.async_create_entry(
-                title=local_name,
-                data={
-                    CONF_ADDRESS: discovery_info.address,
-                },
-            )
+            self._address = discovery_info.address
+            self._title = local_name
+            return await self.async_step_probe()
 
         if discovery := self._discovery_info:
             self._discovered_devices[discovery.address] = discovery
@@ -107,6 +115,68 @@ class NissanLeafObdBleFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
             errors=errors,
         )
 
+    async def async_step_probe(
+        self, user_input: dict | None = None, errors: dict | None = None
+    ) -> FlowResult:
+        """Offer to probe what the car supports before creating the entry."""
+        if user_input is not None:
+            if user_input["probe"]:
+                return await self.async_step_probing()
+            return await self.async_step_finish()
+
+        return self.async_show_form(
+            step_id="probe",
+            data_schema=vol.Schema({vol.Required("probe", default=True): bool}),
+            errors=errors or {},
+        )
+
+    async def async_step_probing(self, user_input: dict | None = None) -> FlowResult:
+        """Run the capability probe, showing progress until it is done."""
+        if self._probe_task is None:
+            self._probe_task = self.hass.async_create_task(self._async_probe())
+        if not self._probe_task.done():
+            return self.async_show_progress(
+                progress_action="probing", progress_task=self._probe_task
+            )
+        try:
+            self._profile = self._probe_task.result()
+        except Exception:  # noqa: BLE001
+            _LOGGER.exception("Capability probe failed")
+            self._profile = None
+        self._probe_task = None
+        if self._profile is None:
+            return self.async_show_progress_done(next_step_id="probe_failed")
+        return self.async_show_progress_done(next_step_id="finish")
+
+    async def async_step_probe_failed(
+        self, user_input: dict | None = None
+    ) -> FlowResult:
+        """Offer to try the probe again, or to skip it."""
+        return await self.async_step_probe(errors={"base": "probe_failed"})
+
+    async def async_step_finish(self, user_input: dict | None = None) -> FlowResult:
+        """Create the entry, with the profile found by the probe if any."""
+        data = {CONF_ADDRESS: self._address}
+        if self._profile is not None:
+            data[CONF_PROFILE] = self._profile
+        return self.async_create_entry(title=self._title, data=data)
+
+    async def _async_probe(self) -> dict | None:
+        """Connect to the car once, returning the vehicle profile found."""
+        ble_device = async_ble_device_from_address(
+            self.hass, self._address.upper(), True
+        )
+        if ble_device is None:
+            return None
+        api = NissanLeafObdBleApiClient(ble_device)
+        try:
+            async with asyncio.timeout(PROBE_TIMEOUT):
+                summary = await api.async_probe()
+        finally:
+            await api.async_disconnect()
+        _LOGGER.debug("Capability probe found: %s", summary)
+        return api.profile.as_dict() if summary is not None else None
+
 
 class NissanLeafObdBleOptionsFlowHandler(config_entries.OptionsFlow):
     """Config flow options handler for nissan_leaf_obd_ble."""
@@ -146,6 +216,18 @@ class NissanLeafObdBleOptionsFlowHandler(config_entries.OptionsFlow):
                     vol.Required(
                         "xs_poll", default=self.options.get("xs_poll", 3600)
                     ): int,
+                    vol.Required(
+                        "monitor_broadcasts",
+                        default=self.options.get("monitor_broadcasts", False),
+                    ): bool,
+                    vol.Required(
+                        "compact_responses",
+                        default=self.options.get("compact_responses", False),
+                    ): bool,
+                    vol.Required(
+                        "record_transcript",
+                        default=self.options.get("record_transcript", False),
+                    ): bool,
                 }
             ),
         )
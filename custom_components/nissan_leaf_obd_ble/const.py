@@ -15,6 +15,18 @@ ISSUE_URL = "https://github.com/pbutterworth/nissan-leaf-obd-ble/issues"
 PLATFORMS: list[Platform] = [Platform.BINARY_SENSOR, Platform.SENSOR]
 
 
+# Storage for the learned vehicle profile (see profile.py)
+PROFILE_STORAGE_VERSION = 1
+PROFILE_SAVE_DELAY = 60  # seconds
+# the profile found by the capability probe during setup, in the entry data
+CONF_PROFILE = "profile"
+
+# Services
+SERVICE_PROBE = "probe_vehicle"
+
+# Raw dongle traffic, recorded when the record_transcript option is on
+TRANSCRIPT_FILE = DOMAIN + ".{entry_id}.transcript.gz"
+
 # Configuration and options
 CONF_ENABLED = "enabled"
 CONF_USERNAME = "username"
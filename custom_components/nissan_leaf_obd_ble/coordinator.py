@@ -5,11 +5,12 @@ import logging
 from typing import Any
 
 from homeassistant.components.bluetooth.api import async_address_present
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 
 from .api import NissanLeafObdBleApiClient
-from .const import DOMAIN
+from .const import DOMAIN, PROFILE_SAVE_DELAY
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -33,7 +34,12 @@ class NissanLeafObdBleDataUpdateCoordinator(DataUpdateCoordinator):
     """Class to manage fetching data from the API."""
 
     def __init__(
-        self, hass: HomeAssistant, address: str, api: NissanLeafObdBleApiClient, options
+        self,
+        hass: HomeAssistant,
+        address: str,
+        api: NissanLeafObdBleApiClient,
+        options,
+        store: Store | None = None,
     ) -> None:
         """Initialize."""
         super().__init__(
@@ -45,12 +51,14 @@ class NissanLeafObdBleDataUpdateCoordinator(DataUpdateCoordinator):
         )
         self._address = address
         self.api = api
+        self._store = store  # where the api's vehicle profile is persisted
         self._cache_data: dict[str, Any] = {}
         self.cache_data = {}
         self.options = options
 
     async def _async_update_data(self) -> dict[str, Any]:
         """Update data via library."""
+        await self.async_flush_transcript()
 
         # Check if the device is still available
         _LOGGER.debug("Check if the device is still available to connect")
@@ -58,6 +66,7 @@ class NissanLeafObdBleDataUpdateCoordinator(DataUpdateCoordinator):
         if not available:
             # Device out of range? Switch to active polling interval for when it reappears
             _LOGGER.debug("Car out of range? Switch to extra slow polling")
+            await self.api.async_disconnect()
             self.update_interval = timedelta(seconds=self._xs_poll_interval)
             _LOGGER.debug(
                 "Car out of range? Switch to ultra slow polling: interval = %s",
@@ -70,7 +79,9 @@ class NissanLeafObdBleDataUpdateCoordinator(DataUpdateCoordinator):
         try:
             new_data = await self.api.async_get_data()
             if len(new_data) == 0:
-                # Car is probably off. Switch to slow polling inteval
+                # Car is probably off. Switch to slow polling inteval, and
+                # release the dongle until the next slow poll
+                await self.api.async_disconnect()
                 self.update_interval = timedelta(seconds=self._slow_poll_interval)
                 _LOGGER.debug(
                     "Car is probably off, switch to slow polling: interval = %s",
@@ -85,11 +96,41 @@ class NissanLeafObdBleDataUpdateCoordinator(DataUpdateCoordinator):
         except Exception as err:
             raise UpdateFailed(f"Unable to fetch data: {err}") from err
         else:
+            self._async_save_profile()
             if self.options.get("cache_values", False):
                 self.cache_data.update(new_data)
                 return self.cache_data
             return new_data
 
+    async def async_probe(self) -> dict | None:
+        """Run a capability probe, and save the profile it fills in."""
+        summary = await self.api.async_probe()
+        self._async_save_profile()
+        return summary
+
+    def _async_save_profile(self) -> None:
+        """Schedule a save of the vehicle profile if it has changed."""
+        profile = self.api.profile
+        if self._store is None or not profile.dirty:
+            return
+        profile.dirty = False
+        self._store.async_delay_save(profile.as_dict, PROFILE_SAVE_DELAY)
+
+    @callback
+    def async_monitor_values(self, values: dict[str, Any]) -> None:
+        """Pass on values decoded from broadcast frames between polls."""
+        if not self.data:
+            return
+        # unlike async_set_updated_data(), this doesn't delay the next poll
+        self.data = {**self.data, **values}
+        self.async_update_listeners()
+
+    async def async_flush_transcript(self) -> None:
+        """Write out the dongle traffic recorded since the last flush."""
+        recorder = self.api.recorder
+        if recorder is not None and recorder.pending:
+            await self.hass.async_add_executor_job(recorder.flush)
+
     @property
     def options(self):
         """User configuration options."""
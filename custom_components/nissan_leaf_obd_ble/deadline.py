@@ -0,0 +1,47 @@
+"""A wall-clock budget shared by every step of a polling cycle.
+
+Each wait for the adapter (a read, a write, the prompt after an
+interrupted response) is bounded by its own timeout, but a cycle makes
+dozens of them. A Deadline is created once per cycle and passed down
+through OBD, ELM327 and the serial port; each wait gets whatever is
+left of the budget, if that is less than its own timeout. Once it has
+run out, the remaining queries of the cycle are not sent at all, and
+the adapter is interrupted at the start of the next command, so the
+session can be used again.
+"""
+
+import time
+
+
+class Deadline:
+    """The point in time by which a cycle must be done."""
+
+    def __init__(self, seconds: float) -> None:
+        """Initialise, with the budget starting now."""
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Return the seconds left, or 0.0 once the deadline has passed."""
+        return max(self.expires - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        """Return True once the deadline has passed."""
+        return time.monotonic() >= self.expires
+
+    def timeout(self, timeout: float | None) -> float:
+        """Return timeout, cut down to what is left of the budget.
+
+        A timeout of None (wait indefinitely) becomes the remaining budget.
+        """
+        remaining = self.remaining()
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+
+def bounded(timeout: float | None, deadline: Deadline | None) -> float | None:
+    """Return timeout, cut down to the deadline's remaining budget if any."""
+    if deadline is None:
+        return timeout
+    return deadline.timeout(timeout)
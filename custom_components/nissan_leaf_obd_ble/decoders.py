@@ -30,9 +30,9 @@
 ########################################################################
 
 import logging
-import struct
 
 from .codes import OBD_COMPLIANCE
+from .fields import Field, compile_decoder
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +43,8 @@ def <name>(<list_of_messages>):
     ...
     return <value>
 
+Those that only read fixed fields are built from a table of Field specs
+below, instead of written out.
 """
 
 
@@ -70,244 +72,55 @@ def unknown(messages):
     return None
 
 
-def power_switch(messages):
-    """Decode power switch messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] & 0x80 == 0x80
-    return {"power_switch": v}
-
-
-def gear_position(messages):
-    """Decode gear position messages."""
-    d = messages[0].data  # only operate on a single message
-    match d[3]:
-        case 1:
-            v = "Park"
-        case 2:
-            v = "Reverse"
-        case 3:
-            v = "Neutral"
-        case 4:
-            v = "Drive"
-        case 5:
-            v = "Eco"
-        case _:
-            v = "Unknown"
-
-    return {"gear_position": v}
-
-
-def bat_12v_voltage(messages):
-    """Decode 12V battery voltage messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] * 0.08
-    return {"bat_12v_voltage": v}
-
-
-def bat_12v_current(messages):
-    """Decode 12V battery current messages."""
-    d = messages[0].data  # only operate on a single message
-    v = struct.unpack("!h", d[3:5])[0] / 256
-    return {"bat_12v_current": v}
-
-
-def quick_charges(messages):
-    """Decode Number of quick charges messages."""
-    d = messages[0].data  # only operate on a single message
-    v = int.from_bytes(d[3:5])
-    return {"quick_charges": v}
-
-
-def l1_l2_charges(messages):
-    """Decode Number of L1/L2 charges messages."""
-    d = messages[0].data  # only operate on a single message
-    v = int.from_bytes(d[3:5])
-    return {"l1_l2_charges": v}
-
-
-def ambient_temp(messages):
-    """Decode ambient temperature messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] / 2 - 40
-    return {"ambient_temp": v}
-
-
-def estimated_ac_power(messages):
-    """Decode estimated AC power messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] * 50
-    return {"estimated_ac_power": v}
-
-
-def estimated_ptc_power(messages):
-    """Decode estimated PTC power messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] * 250
-    return {"estimated_ptc_power": v}
-
-
-def aux_power(messages):
-    """Decode Auxiliary equipment power messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] * 100
-    return {"aux_power": v}
-
-
-def ac_power(messages):
-    """Decode AC system power messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] * 250
-    return {"ac_power": v}
-
-
-def plug_state(messages):
-    """Decode Plug state of J1772 socket messages."""
-    d = messages[0].data  # only operate on a single message
-    match d[3]:
-        case 0:
-            v = "Not plugged"
-        case 1:
-            v = "Partial plugged"
-        case 2:
-            v = "Plugged"
-        case _:
-            v = "Unknown"
-    return {"plug_state": v}
-
-
-def charge_mode(messages):
-    """Decode Charging mode messages."""
-    d = messages[0].data  # only operate on a single message
-    match d[3]:
-        case 0:
-            v = "Not charging"
-        case 1:
-            v = "L1 charging"
-        case 2:
-            v = "L2 charging"
-        case 3:
-            v = "L3 charging"
-        case _:
-            v = "Unknown"
-    return {"charge_mode": v}
-
-
-def rpm(messages):
-    """Decode Motor RPM messages."""
-    d = messages[0].data  # only operate on a single message
-    v = struct.unpack("!h", d[3:5])[0]
-    # todo: fix this parser
-    return {"rpm": v}
-
-
-def obc_out_power(messages):
-    """Decode On-board charger output power messages (W)."""
-    d = messages[0].data  # only operate on a single message
-    v = struct.unpack("!h", d[3:5])[0] * 100
-    return {"obc_out_power": v}
-
-
-def motor_power(messages):
-    """Decode Traction motor power messages (W)."""
-    d = messages[0].data  # only operate on a single message
-    v = struct.unpack("!h", d[3:5])[0] * 40
-    return {"motor_power": v}
-
-
-def speed(messages):
-    """Decode Vehicle speed messages (km/h)."""
-    d = messages[0].data  # only operate on a single message
-    v = struct.unpack("!h", d[3:5])[0] / 10
-    return {"speed": v}
-
-
-def ac_on(messages):
-    """Decode AC status messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] == 0x01
-    return {"ac_on": v}
-
-
-def rear_heater(messages):
-    """Decode Rear heater status messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] == 0xA2
-    return {"rear_heater": v}
-
-
-def eco_mode(messages):
-    """Decode ECO mode status messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] == 0x10 | d[3] == 0x11
-    return {"eco_mode": v}
-
-
-def e_pedal_mode(messages):
-    """Decode e-Pedal mode status messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] == 0x04
-    return {"e_pedal_mode": v}
-
-
-def odometer(messages):
-    """Decode Total odometer reading (km) messages."""
-    d = messages[0].data  # only operate on a single message
-    v = struct.unpack("!i", bytearray([0x00]) + d[3:6])[0]
-    return {"odometer": v}
-
-
-def tp_fr(messages):
-    """Decode Tyre pressure front right (kPa) messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] * 1.7236894
-    return {"tp_fr": v}
-
-
-def tp_fl(messages):
-    """Decode Tyre pressure front left (kPa) messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] * 1.7236894
-    return {"tp_fl": v}
-
-
-def tp_rr(messages):
-    """Decode Tyre pressure rear right (kPa) messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] * 1.7236894
-    return {"tp_rr": v}
-
-
-def tp_rl(messages):
-    """Decode Tyre pressure rear left (kPa) messages."""
-    d = messages[0].data  # only operate on a single message
-    v = d[3] * 1.7236894
-    return {"tp_rl": v}
-
-
-def range_remaining(messages):
-    """Decode Remaining range (km) messages."""
-    # todo: fix this decoder
-    d = messages[0].data  # only operate on a single message
-    v = struct.unpack("!h", d[3:5])[0] / 10
-    return {"range_remaining": v}
-
-
-def lbc(messages):
-    """Decode LBC message."""
-    d = messages[0].data
-    if len(d) == 0:
-        return None
-    hv_battery_current_1 = int.from_bytes(d[2:6], byteorder="big", signed=False)
-    hv_battery_current_2 = int.from_bytes(d[8:12], byteorder="big", signed=False)
-    if hv_battery_current_1 & 0x8000000 == 0x8000000:
-        hv_battery_current_1 = hv_battery_current_1 | -0x100000000
-    if hv_battery_current_2 & 0x8000000 == 0x8000000:
-        hv_battery_current_2 = hv_battery_current_2 | -0x100000000
-    return {
-        "state_of_charge": int.from_bytes(d[33:36]) / 10000,
-        "hv_battery_health": int.from_bytes(d[30:32]) / 102.4,
-        "hv_battery_Ah": int.from_bytes(d[37:40]) / 10000,
-        "hv_battery_current_1": hv_battery_current_1 / 1024,
-        "hv_battery_current_2": hv_battery_current_2 / 1024,
-        "hv_battery_voltage": int.from_bytes(d[20:22]) / 100,
-    }
+# Decoders compiled from field specs (see fields.py)
+#
+# Offsets count from the service byte: in "62 11 03 xx", xx is at 3.
+
+GEARS = {1: "Park", 2: "Reverse", 3: "Neutral", 4: "Drive", 5: "Eco"}
+PLUG_STATES = {0: "Not plugged", 1: "Partial plugged", 2: "Plugged"}
+CHARGE_MODES = {0: "Not charging", 1: "L1 charging", 2: "L2 charging", 3: "L3 charging"}
+PSI_TO_KPA = 1.7236894  # per unit of the raw tyre pressures
+
+# fmt: off
+power_switch        = compile_decoder(Field("power_switch",        3, mask=0x80, values={0x80: True}, default=False))
+gear_position       = compile_decoder(Field("gear_position",       3, values=GEARS, default="Unknown"))
+bat_12v_voltage     = compile_decoder(Field("bat_12v_voltage",     3, scale=0.08))
+bat_12v_current     = compile_decoder(Field("bat_12v_current",     3, width=2, signed=True, divisor=256))
+quick_charges       = compile_decoder(Field("quick_charges",       3, width=2))
+l1_l2_charges       = compile_decoder(Field("l1_l2_charges",       3, width=2))
+ambient_temp        = compile_decoder(Field("ambient_temp",        3, divisor=2, bias=-40))
+estimated_ac_power  = compile_decoder(Field("estimated_ac_power",  3, scale=50))
+estimated_ptc_power = compile_decoder(Field("estimated_ptc_power", 3, scale=250))
+aux_power           = compile_decoder(Field("aux_power",           3, scale=100))
+ac_power            = compile_decoder(Field("ac_power",            3, scale=250))
+plug_state          = compile_decoder(Field("plug_state",          3, values=PLUG_STATES, default="Unknown"))
+charge_mode         = compile_decoder(Field("charge_mode",         3, values=CHARGE_MODES, default="Unknown"))
+# todo: fix this parser
+rpm                 = compile_decoder(Field("rpm",                 3, width=2, signed=True))
+obc_out_power       = compile_decoder(Field("obc_out_power",       3, width=2, signed=True, scale=100))
+motor_power         = compile_decoder(Field("motor_power",         3, width=2, signed=True, scale=40))
+speed               = compile_decoder(Field("speed",               3, width=2, signed=True, divisor=10))
+ac_on               = compile_decoder(Field("ac_on",               3, values={0x01: True}, default=False))
+rear_heater         = compile_decoder(Field("rear_heater",         3, values={0xA2: True}, default=False))
+# only 0x11: the original test, "d[3] == 0x10 | d[3] == 0x11", chains
+# as d[3] == (0x10 | d[3]) == 0x11
+eco_mode            = compile_decoder(Field("eco_mode",            3, values={0x11: True}, default=False))
+e_pedal_mode        = compile_decoder(Field("e_pedal_mode",        3, values={0x04: True}, default=False))
+odometer            = compile_decoder(Field("odometer",            3, width=3))
+tp_fr               = compile_decoder(Field("tp_fr",               3, scale=PSI_TO_KPA))
+tp_fl               = compile_decoder(Field("tp_fl",               3, scale=PSI_TO_KPA))
+tp_rr               = compile_decoder(Field("tp_rr",               3, scale=PSI_TO_KPA))
+tp_rl               = compile_decoder(Field("tp_rl",               3, scale=PSI_TO_KPA))
+# todo: fix this decoder
+range_remaining     = compile_decoder(Field("range_remaining",     3, width=2, signed=True, divisor=10))
+
+# the currents are taken as negative when bit 27 is set, not bit 31
+lbc = compile_decoder(
+    Field("state_of_charge",      33, width=3, divisor=10000),
+    Field("hv_battery_health",    30, width=2, divisor=102.4),
+    Field("hv_battery_Ah",        37, width=3, divisor=10000),
+    Field("hv_battery_current_1",  2, width=4, sign_bit=27, divisor=1024),
+    Field("hv_battery_current_2",  8, width=4, sign_bit=27, divisor=1024),
+    Field("hv_battery_voltage",   20, width=2, divisor=100),
+)
+# fmt: on
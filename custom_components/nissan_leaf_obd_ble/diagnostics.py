@@ -0,0 +1,20 @@
+"""Diagnostics support for Nissan Leaf OBD BLE."""
+
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    return {
+        "options": dict(coordinator.options),
+        "update_interval": str(coordinator.update_interval),
+        "api": coordinator.api.diagnostics(),
+    }
@@ -32,17 +32,31 @@
 
 import asyncio
 import logging
-import re
+import time
 
 from bleak.backends.device import BLEDevice
 
 from .bleserial import bleserial
+from .deadline import Deadline, bounded
 from .protocols.protocol import Message
-from .protocols.protocol_can import ISO_15765_4_11bit_500k
+from .protocols.protocol_can import (
+    ISO_15765_4_11bit_500k,
+    CompactReassembler,
+    ISOTPReassembler,
+)
+from .tokenizer import ELMTokenizer
+from .tracing import Tracer
+from .transcript import TranscriptRecorder
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
 
+# how long the adapter may take to come back from ATZ with its prompt
+RESET_TIMEOUT = 2.0
+# how long an ECU may take to answer after "response pending" (7F xx 78),
+# UDS's P2* server maximum
+RESPONSE_PENDING_TIMEOUT = 5.0
+
 
 class OBDStatus:
     """Values for the connection status flags."""
@@ -70,13 +84,42 @@ class ELM327:
         self,
         device: BLEDevice,
         timeout,
+        port=None,
+        tracer: Tracer | None = None,
+        recorder: TranscriptRecorder | None = None,
     ) -> None:
-        """Initialise."""
+        """Initialise.
+
+        port replaces the BLE transport with anything offering the same
+        interface as bleserial (e.g. the simulator). tracer collects the
+        timing of connecting, resetting and parsing. recorder, if given,
+        records all traffic with the adapter.
+        """
         self.__status = OBDStatus.NOT_CONNECTED
+        self.tracer = tracer if tracer is not None else Tracer()
         self.__low_power = False
         self.timeout = timeout
-        self.__port = bleserial(device, self.SERVICE_UUID, self.CHARACTERISTIC_UUID_READ, self.CHARACTERISTIC_UUID_WRITE)
+        if port is None:
+            port = bleserial(device, self.SERVICE_UUID, self.CHARACTERISTIC_UUID_READ, self.CHARACTERISTIC_UUID_WRITE)
+        self.__port = port
+        self.__recorder = recorder
         self.__protocol = ISO_15765_4_11bit_500k()
+        self.__tokenizer = ELMTokenizer()
+        self.__reassembler = ISOTPReassembler(self.__protocol)
+        self.__compact = CompactReassembler()
+        # set when a response was returned before the adapter printed its
+        # prompt; the adapter may still be listening for frames
+        self.__awaiting_prompt = False
+        self.__monitoring = False  # ATMA is running
+        # fastest AT command round trip this session: the latency of the
+        # BLE link itself, as the adapter answers those on its own
+        self.__link_latency = None
+        self.__written_at = 0.0  # when the last command was written
+        # longest wait for a line of the last response to a query, less
+        # the link latency (see timeouts.py)
+        self.response_latency = None
+        # the adapter kept its settings from the last session (see create())
+        self.warm_started = False
 
     @classmethod
     async def create(
@@ -86,9 +129,19 @@ class ELM327:
         timeout,
         check_voltage=True,
         start_low_power=False,
+        port=None,
+        tracer: Tracer | None = None,
+        recorder: TranscriptRecorder | None = None,
+        warm_start=False,
     ):
-        """Initialize ELM327."""
-        self = cls(device, timeout)
+        """Initialize ELM327.
+
+        With warm_start, the adapter is assumed to still have the settings
+        of a session that was closed cleanly (without ATZ, see close()).
+        One ATDPN checks that, and only if it doesn't match is the adapter
+        reset and set up again.
+        """
+        self = cls(device, timeout, port, tracer, recorder)
 
         logger.info(
             "Initializing ELM327: PROTOCOL=%s",
@@ -97,7 +150,13 @@ class ELM327:
 
         # ------------- open port -------------
         try:
-            await self.__port.open()
+            with self.tracer.span(stage="ble_connect"):
+                await self.__port.open()
+            if recorder is not None:
+                recorder.start_session()
+                self.__port.set_consumer(recorder.tap(self.__tokenizer))
+            else:
+                self.__port.set_consumer(self.__tokenizer)
         except Exception as e:
             logger.debug("An error occurred while opening port: %s", e)
             if self.__port:
@@ -110,72 +169,97 @@ class ELM327:
             await self.__write(b" ")
             await asyncio.sleep(1)
 
+        self.warm_started = warm_start and await self.__still_configured()
+        if self.warm_started:
+            logger.debug("Adapter kept its settings, skipping the reset")
+        elif not await self.__initialize():
+            return self
+
+        # by now, we've successfuly communicated with the ELM, but not the car
+        self.__status = OBDStatus.ELM_CONNECTED
+
+        # -------------------------- AT RV (read volt) ------------------------
+        if check_voltage:
+            r = await self.__send(b"AT RV")
+            if not r or len(r) != 1 or r[0] == "":
+                await self.__error("No answer from 'AT RV'")
+                return self
+            try:
+                if float(r[0].lower().replace("v", "")) < 6:
+                    logger.error("OBD2 socket disconnected")
+                    return self
+            except ValueError:
+                await self.__error("Incorrect response from 'AT RV'")
+                return self
+            # by now, we've successfuly connected to the OBD socket
+            self.__status = OBDStatus.OBD_CONNECTED
+
+        # try to communicate with the car, and load the correct protocol parser
+        self.__status = OBDStatus.CAR_CONNECTED
+        return self
+
+    async def __still_configured(self) -> bool:
+        """Return True if the adapter answers as this class left it.
+
+        A reset or power cycle brings echo back on and the protocol back
+        to automatic, so ATDPN then answers with its echo and "A0", or
+        an "A" prefix; a clean close leaves echo off and "6".
+        """
+        try:
+            return await self.__send(b"ATDPN", timeout=RESET_TIMEOUT) == ["6"]
+        except Exception as e:
+            logger.debug("No answer to the warm start probe: %s", e)
+            return False
+
+    async def __initialize(self) -> bool:
+        """Reset the adapter and set it up, returning False on failure."""
         # ---------------------------- ATZ (reset) ----------------------------
         try:
-            await self.__send(b"ATZ", delay=1)  # wait 1 second for ELM to initialize
+            with self.tracer.span(stage="reset"):
+                # the ELM prints its prompt once it has restarted
+                await self.__send(b"ATZ", timeout=RESET_TIMEOUT)
             # return data can be junk, so don't bother checking
         except Exception as e:
             await self.__error(e)
-            return self
+            return False
 
         # -------------------------- ATE0 (echo OFF) --------------------------
         r = await self.__send(b"ATE0")
         if not self.__isok(r, expectEcho=True):
             await self.__error("ATE0 did not return 'OK'")
-            return self
+            return False
 
         # ------------------------ ATSP6 (set protocol 6) ---------------------
         r = await self.__send(b"ATSP6")
         if not self.__isok(r):
             await self.__error("ATSP6 did not return 'OK'")
-            return self
+            return False
 
         # ------------------------- ATH1 (headers ON) -------------------------
         r = await self.__send(b"ATH1")
         if not self.__isok(r):
             await self.__error("ATH1 did not return 'OK', or echoing is still ON")
-            return self
+            return False
 
         # ------------------------ ATL0 (linefeeds OFF) -----------------------
         r = await self.__send(b"ATL0")
         if not self.__isok(r):
             await self.__error("ATL0 did not return 'OK'")
-            return self
+            return False
 
         # ------------------------ ATS0 (printing spaces OFF)------------------
         r = await self.__send(b"ATS0")
         if not self.__isok(r):
             await self.__error("ATS0 did not return 'OK'")
-            return self
+            return False
 
         # ----------------- ATCAF0 (CAN automatic formatting OFF)--------------
         r = await self.__send(b"ATCAF0")
         if not self.__isok(r):
             await self.__error("ATCAF0 did not return 'OK'")
-            return self
-
-        # by now, we've successfuly communicated with the ELM, but not the car
-        self.__status = OBDStatus.ELM_CONNECTED
-
-        # -------------------------- AT RV (read volt) ------------------------
-        if check_voltage:
-            r = await self.__send(b"AT RV")
-            if not r or len(r) != 1 or r[0] == "":
-                await self.__error("No answer from 'AT RV'")
-                return self
-            try:
-                if float(r[0].lower().replace("v", "")) < 6:
-                    logger.error("OBD2 socket disconnected")
-                    return self
-            except ValueError:
-                await self.__error("Incorrect response from 'AT RV'")
-                return self
-            # by now, we've successfuly connected to the OBD socket
-            self.__status = OBDStatus.OBD_CONNECTED
+            return False
 
-        # try to communicate with the car, and load the correct protocol parser
-        self.__status = OBDStatus.CAR_CONNECTED
-        return self
+        return True
 
     def __isok(self, lines, expectEcho=False):
         if not lines:
@@ -198,6 +282,16 @@ class ELM327:
         """Return the status."""
         return self.__status
 
+    def is_alive(self):
+        """Return True if the adapter link can still carry commands.
+
+        This is a cheap local check (no round trip to the adapter), used to
+        decide whether a long-lived session can be reused for the next poll.
+        """
+        if self.__status == OBDStatus.NOT_CONNECTED or self.__port is None:
+            return False
+        return self.__port.is_connected
+
     def protocol_name(self):
         """Return the protocol name."""
         return self.__protocol.ELM_NAME
@@ -260,49 +354,203 @@ class ELM327:
 
         return lines
 
-    async def close(self):
-        """Reset the device, and sets all attributes to unconnected states."""
+    async def close(self, reset=True):
+        """Reset the device, and sets all attributes to unconnected states.
+
+        Without reset, the adapter keeps its settings for a warm start of
+        the next session (see create()).
+        """
 
         self.__status = OBDStatus.NOT_CONNECTED
 
         if self.__port is not None:
             logger.info("closing port")
-            await self.__write(b"ATZ")
+            if self.__monitoring:
+                # interrupt the monitor first, so ATZ is taken as a command
+                self.__monitoring = False
+                self.__awaiting_prompt = True
+            if reset:
+                await self.__write(b"ATZ")
+            elif self.__awaiting_prompt:
+                await self.__finish_response()
             await self.__port.close()
             self.__port = None
 
     #  -> list[Message]:
-    async def send_and_parse(self, cmd) -> list[Message]:
+    async def send_and_parse(self, cmd, deadline: Deadline | None = None) -> list[Message]:
         """Send OBDCommands.
 
         Sends the given command string, and parses the
         response lines with the protocol object.
 
-        An empty command string will re-trigger the previous command
+        An empty command string will re-trigger the previous command.
+        No wait for the adapter outlasts the deadline, if given.
 
         Returns a list of Message objects
         """
 
+        if not await self.__ready_for_query():
+            return None
+
+        # reassemble the response as it arrives, so a complete message can
+        # be returned without waiting for the prompt
+        reassembler = self.__reassembler
+        reassembler.reset()
+        self.__tokenizer.on_line = self.__timed(reassembler.feed)
+        try:
+            lines = await self.__send_raw(cmd, deadline=deadline, pending=reassembler)
+        finally:
+            self.__tokenizer.on_line = None
+
+        with self.tracer.span(stage="parse"):
+            if reassembler.complete:
+                return [reassembler.message()]
+            return self.__protocol(lines)
+
+    async def send_and_parse_compact(
+        self, cmd, deadline: Deadline | None = None
+    ) -> list[Message] | None:
+        """Send a request whose response the ELM formats (ATH0, ATCAF1).
+
+        The caller sets the formatting up, and sends the request without
+        its PCI byte. Returns a list of Message objects as send_and_parse()
+        does, or None if the response is ambiguous (see CompactReassembler)
+        and should be asked for again in the raw format.
+        """
+        if not await self.__ready_for_query():
+            return None
+
+        compact = self.__compact
+        compact.reset()
+        self.__tokenizer.on_line = self.__timed(compact.feed)
+        try:
+            lines = await self.__send_raw(cmd, deadline=deadline, pending=compact)
+        finally:
+            self.__tokenizer.on_line = None
+
+        with self.tracer.span(stage="parse"):
+            if compact.complete and not compact.failed:
+                return compact.result()
+            return compact(lines)
+
+    def __timed(self, feed):
+        """Wrap a line consumer, measuring the longest wait for a line."""
+        self.response_latency = None
+        previous = None
+
+        def timed(line):
+            nonlocal previous
+            now = time.perf_counter()
+            if previous is None:
+                wait = now - self.__written_at - (self.__link_latency or 0.0)
+            else:
+                wait = now - previous
+            previous = now
+            if self.response_latency is None or wait > self.response_latency:
+                self.response_latency = wait
+            return feed(line)
+
+        return timed
+
+    async def __ready_for_query(self) -> bool:
+        """Wake the adapter up or stop its monitor, so it takes a query."""
         if self.__status == OBDStatus.NOT_CONNECTED:
             logger.info("cannot send_and_parse() when unconnected")
-            return None
+            return False
 
         # Check if we are in low power
         if self.__low_power:
             await self.normal_power()
 
-        lines = await self.__send(cmd)
-        return self.__protocol(lines)
+        if self.__monitoring:
+            await self.stop_monitor()
+        return True
+
+    @property
+    def monitoring(self) -> bool:
+        """Return True while the adapter is monitoring the bus."""
+        return self.__monitoring and not self.__tokenizer.prompt
 
-    async def __send(self, cmd, delay=None, end_marker=ELM_PROMPT):
+    async def monitor(self, on_line, receive_filter=None, receive_mask=None) -> bool:
+        """Start passing every frame seen on the bus to on_line (ATMA).
+
+        receive_filter and receive_mask (ATCF/ATCM) limit the frames the
+        adapter forwards. Monitoring continues until stop_monitor() or
+        the next command; the adapter also stops by itself if its buffer
+        fills up ("BUFFER FULL"), and monitoring is then False.
+        """
+        if self.__status == OBDStatus.NOT_CONNECTED:
+            logger.info("cannot monitor() when unconnected")
+            return False
+        if self.__low_power:
+            await self.normal_power()
+        if self.__monitoring:
+            await self.stop_monitor()
+
+        if receive_filter is not None:
+            for cmd in (
+                b"AT CF %03X" % receive_filter,
+                b"AT CM %03X" % receive_mask,
+            ):
+                if not self.__isok(await self.__send(cmd)):
+                    logger.debug("%s did not return 'OK'", cmd)
+                    return False
+
+        await self.__write(b"ATMA")
+        tokenizer = self.__tokenizer
+        tokenizer.keep_lines = False
+        tokenizer.on_line = on_line
+        self.__monitoring = True
+        return True
+
+    async def stop_monitor(self) -> None:
+        """Stop monitoring, and clear its receive filter."""
+        if not self.__monitoring:
+            return
+        self.__monitoring = False
+        tokenizer = self.__tokenizer
+        tokenizer.on_line = None
+        tokenizer.keep_lines = True
+        # any character stops the monitor, which then prints its prompt
+        self.__awaiting_prompt = True
+        await self.__finish_response()
+        # back to the default filter for responses to queries
+        if not self.__isok(await self.__send(b"AT CRA")):
+            logger.debug("AT CRA did not return 'OK'")
+
+    async def __send(self, cmd, delay=None, end_marker=ELM_PROMPT, timeout=None):
         """Unprotected send() function.
 
         will __write() the given string, no questions asked.
-        returns result of __read() (a list of line strings)
+        returns the lines read by __read_lines(), as strings,
         after an optional delay, until the end marker (by
-        default, the prompt) is seen
+        default, the prompt) is seen or timeout (by default,
+        the port's) runs out
+        """
+        start = time.perf_counter()
+        with self.tracer.span(stage="at_command"):
+            lines = await self.__send_raw(cmd, delay, end_marker, timeout)
+        if delay is None and lines:
+            elapsed = time.perf_counter() - start
+            if self.__link_latency is None or elapsed < self.__link_latency:
+                self.__link_latency = elapsed
+        return [line.decode("utf-8", "ignore") for line in lines]
+
+    async def __send_raw(
+        self,
+        cmd,
+        delay=None,
+        end_marker=ELM_PROMPT,
+        timeout=None,
+        deadline=None,
+        pending=None,
+    ):
+        """Like __send(), but return the response lines as bytes.
+
+        No wait outlasts the deadline, if given. pending is the
+        reassembler the response is fed to, if any (see __read_lines()).
         """
-        await self.__write(cmd)
+        await self.__write(cmd, deadline)
 
         delayed = 0.0
         if delay is not None:
@@ -310,16 +558,19 @@ class ELM327:
             await asyncio.sleep(delay)
             delayed += delay
 
-        r = await self.__read(end_marker=end_marker)
+        r = await self.__read_lines(end_marker, timeout, deadline, pending)
         while delayed < 1.0 and len(r) <= 0:
+            if deadline is not None and deadline.expired:
+                logger.debug("no response before the deadline")
+                break
             d = 0.1
             logger.debug("no response; wait: %f seconds", d)
             await asyncio.sleep(d)
             delayed += d
-            r = await self.__read(end_marker=end_marker)
+            r = await self.__read_lines(end_marker, timeout, deadline, pending)
         return r
 
-    async def __write(self, cmd):
+    async def __write(self, cmd, deadline=None):
         """Low-level function to write a string to the port."""
 
         if not self.__port:
@@ -336,7 +587,13 @@ class ELM327:
         cmd += b"\r"  # terminate with carriage return in accordance with ELM327 and STN11XX specifications
         logger.debug("write: " + repr(cmd))
         try:
+            if self.__awaiting_prompt:
+                await self.__finish_response(deadline)
             self.__port.reset_input_buffer()  # dump everything in the input buffer
+            self.__tokenizer.reset()
+            if self.__recorder is not None:
+                self.__recorder.write(cmd)
+            self.__written_at = time.perf_counter()
             await self.__port.write(cmd)  # turn the string into bytes and write
             # self.__port.flush()  # wait for the output buffer to finish transmitting
         except Exception as e:
@@ -346,55 +603,79 @@ class ELM327:
             self.__port = None
             return
 
-    async def __read(self, end_marker=ELM_PROMPT):
-        """Low-level read function.
+    async def __finish_response(self, deadline=None):
+        """Make sure the adapter is back at its prompt before the next command.
 
-        accumulates characters until the end marker (by
-        default, the prompt character) is seen
-        returns a list of [/r/n] delimited strings
+        The previous response was returned as soon as it was complete, or
+        given up on when its wait ran out. If the prompt has not arrived
+        since, the adapter is still listening for frames: any character
+        interrupts it, and a space is ignored should it have returned to
+        the prompt in the meantime.
+        """
+        self.__awaiting_prompt = False
+        tokenizer = self.__tokenizer
+        if tokenizer.prompt:
+            return
+        logger.debug("interrupting the previous command")
+        # the interrupted output ("STOPPED") is not part of the next response
+        on_line, tokenizer.on_line = tokenizer.on_line, None
+        try:
+            if self.__recorder is not None:
+                self.__recorder.write(b" ")
+            await self.__port.write(b" ")
+            if not await self.__port.wait_until(
+                lambda: tokenizer.prompt,
+                timeout=bounded(self.__port.timeout, deadline),
+            ):
+                logger.debug("No prompt after interrupting the previous command")
+        finally:
+            tokenizer.on_line = on_line
+
+    async def __read_lines(
+        self, end_marker=ELM_PROMPT, timeout=None, deadline=None, pending=None
+    ):
+        """Wait for the tokenizer to complete a response.
+
+        The tokenizer is fed directly by the port's notification
+        handler, so by the time the end marker is seen the response
+        has already been split into NUL-free, stripped lines. The wait
+        lasts at most timeout (by default, the port's), and never
+        beyond the deadline. While the ECU keeps answering "response
+        pending" (counted by the pending reassembler), each such frame
+        allows it up to RESPONSE_PENDING_TIMEOUT more for its answer.
+        Returns a list of lines as bytes.
         """
         if not self.__port:
-            logger.debug("cannot perform __read() when unconnected")
+            logger.debug("cannot perform __read_lines() when unconnected")
             return []
 
-        buffer = bytearray()
-
-        while True:
-            # retrieve as much data as possible
-            try:
-                data = await self.__port.read(self.__port.in_waiting or 1)
-            except Exception:
-                self.__status = OBDStatus.NOT_CONNECTED
-                await self.__port.close()
-                self.__port = None
-                logger.info("Device disconnected while reading")
-                return []
-
-            # if nothing was received
-            if not data:
-                logger.debug("Failed to read port")
-                break
-
-            buffer.extend(data)
-
-            # end on specified end-marker sequence
-            if end_marker in buffer:
-                break
-
-        # log, and remove the "bytearray(   ...   )" part
-        logger.debug("read: " + repr(buffer)[10:-1])
-
-        # clean out any null characters
-        buffer = re.sub(b"\x00", b"", buffer)
-
-        # remove the prompt character
-        if buffer.endswith(self.ELM_PROMPT):
-            buffer = buffer[:-1]
-
-        # convert bytes into a standard string
-        string = buffer.decode("utf-8", "ignore")
-
-        # splits into lines while removing empty lines and trailing spaces
-        lines = [s.strip() for s in re.split("[\r\n]", string) if bool(s)]
+        tokenizer = self.__tokenizer
+        if timeout is None:
+            timeout = self.__port.timeout
+        try:
+            done = await self.__port.wait_until(
+                lambda: tokenizer.done(end_marker), timeout=bounded(timeout, deadline)
+            )
+            seen = 0
+            while not done and pending is not None and pending.pending > seen:
+                seen = pending.pending
+                logger.debug("Response pending, waiting for the answer")
+                done = await self.__port.wait_until(
+                    lambda: tokenizer.done(end_marker),
+                    timeout=bounded(RESPONSE_PENDING_TIMEOUT, deadline),
+                )
+        except Exception:
+            self.__status = OBDStatus.NOT_CONNECTED
+            await self.__port.close()
+            self.__port = None
+            logger.info("Device disconnected while reading")
+            return []
 
+        # the adapter may still be busy: with a complete response, or
+        # one whose wait ran out
+        self.__awaiting_prompt = not tokenizer.prompt and (tokenizer.complete or not done)
+        lines = tokenizer.take_lines()
+        if not lines:
+            logger.debug("Failed to read port")
+        logger.debug("read: %s", lines)
         return lines
@@ -0,0 +1,196 @@
+"""Response decoders compiled from declarative field specs.
+
+Most Leaf responses hold a few fixed fields at fixed offsets: an
+unsigned byte times a factor, a signed 16-bit value over ten, a byte
+standing for one of a few states. A Field says where a value sits and
+how to turn it into a value; compile_decoder() turns the fields of a
+command, once at import, into a decoder function (see decoders.py).
+Adding a DID then takes a row in decoders.py, not a function.
+
+Everything that doesn't depend on the response is worked out then: the
+raw values come out of one precompiled struct.Struct, and each field
+gets a converter closing over its constants, specialised for the common
+cases (a scale, a divisor, a lookup, a flag) so that a call only does
+the steps that apply. A decoder of a single field, as most are, skips
+the loop over the fields.
+
+Values are computed with the same operations as the hand-written
+decoders they replace (multiply, then divide, then add the bias), so an
+integer field with an integer scale stays an int, and dividing by ten
+doesn't turn into multiplying by 0.1.
+"""
+
+import struct
+
+# struct codes by width and signedness (big endian, no alignment); a
+# 3-byte field is unpacked as its high byte, then the low two
+_CODES = {
+    (1, False): "B",
+    (1, True): "b",
+    (2, False): "H",
+    (2, True): "h",
+    (3, False): "BH",
+    (4, False): "I",
+    (4, True): "i",
+}
+
+
+def _identity(raw):
+    return raw
+
+
+class Field:
+    """A value at a fixed offset in a response, and how to decode it.
+
+    The raw value is the big endian integer of width bytes at offset
+    (1 to 4 bytes; 3-byte fields are unsigned). Then, in order:
+
+    - mask: only these bits are kept
+    - sign_bit: if this bit is set, the value is negative (two's
+      complement over width bytes); signed=True is the same with the
+      top bit
+    - values: the raw value is looked up, default if it isn't there
+    - otherwise: raw * scale / divisor + bias, leaving out the steps
+      that don't apply
+    """
+
+    def __init__(
+        self,
+        name,
+        offset,
+        width=1,
+        signed=False,
+        scale=1,
+        divisor=1,
+        bias=0,
+        mask=None,
+        values=None,
+        default=None,
+        sign_bit=None,
+    ) -> None:
+        """Initialise."""
+        if not 1 <= width <= 4 or (width == 3 and signed):
+            raise ValueError(f"{name}: unsupported width {width}")
+        self.name = name  # key of the value in the decoded dict
+        self.offset = offset  # first byte, counted from the service byte
+        self.width = width  # bytes
+        self.signed = signed
+        self.scale = scale
+        self.divisor = divisor
+        self.bias = bias
+        self.mask = mask
+        self.values = values  # raw value -> decoded value
+        self.default = default  # for raw values not in values
+        self.sign_bit = sign_bit
+
+    @property
+    def end(self):
+        """Return the offset just past the field."""
+        return self.offset + self.width
+
+    def converter(self):
+        """Return the function turning the raw value into the decoded value."""
+        mask, values, default = self.mask, self.values, self.default
+        scale, divisor, bias = self.scale, self.divisor, self.bias
+        if self.sign_bit is not None:
+            bit, wrap = 1 << self.sign_bit, 1 << (8 * self.width)
+        else:
+            bit = None
+        if mask is None and bit is None:
+            # the common cases, without the steps that don't apply
+            if values is not None:
+                if default is False and list(values.values()) == [True]:
+                    flag = next(iter(values))
+                    return lambda raw: raw == flag
+                return lambda raw: values.get(raw, default)
+            if divisor == 1 and not bias:
+                return _identity if scale == 1 else (lambda raw: raw * scale)
+            if scale == 1 and not bias:
+                return lambda raw: raw / divisor
+
+        def convert(raw):
+            if mask is not None:
+                raw &= mask
+            if bit is not None and raw & bit:
+                raw -= wrap
+            if values is not None:
+                return values.get(raw, default)
+            if scale != 1:
+                raw = raw * scale
+            if divisor != 1:
+                raw = raw / divisor
+            if bias:
+                raw = raw + bias
+            return raw
+
+        return convert
+
+
+def compile_decoder(*fields: Field):
+    """Return a decoder for responses holding fields.
+
+    It returns a dict of the decoded fields, in the order given, or None
+    if the response is too short to hold them. The fields are kept as
+    its fields attribute.
+    """
+    fmt = [">"]
+    position = 0
+    index = {}  # field name -> index of its raw value in the unpacked tuple
+    unpacked = 0
+    for field in sorted(fields, key=lambda f: f.offset):
+        if field.offset < position:
+            raise ValueError(f"{field.name} overlaps the previous field")
+        fmt += [f"{field.offset - position}x", _CODES[(field.width, field.signed)]]
+        index[field.name] = unpacked
+        unpacked += 2 if field.width == 3 else 1
+        position = field.end
+
+    if len(fields) == 1:
+        decode = _single(fields[0])
+    else:
+        unpack_from = struct.Struct("".join(fmt)).unpack_from
+        steps = tuple(
+            (f.name, index[f.name], f.width == 3, f.converter()) for f in fields
+        )
+
+        def decode(messages):
+            try:
+                r = unpack_from(messages[0].data)
+            except struct.error:
+                return None  # too short
+            return {
+                name: convert(r[i] << 16 | r[i + 1] if wide else r[i])
+                for name, i, wide, convert in steps
+            }
+
+    decode.__doc__ = "Decode " + ", ".join(field.name for field in fields) + "."
+    decode.fields = fields
+    return decode
+
+
+def _single(field: Field):
+    """Return a decoder for a single field."""
+    name, offset = field.name, field.offset
+    convert = field.converter()
+    if field.width == 1 and not field.signed:
+        # indexing is cheaper than unpacking
+
+        def decode(messages):
+            try:
+                return {name: convert(messages[0].data[offset])}
+            except IndexError:
+                return None  # too short
+
+        return decode
+
+    unpack_from = struct.Struct(">" + _CODES[(field.width, field.signed)]).unpack_from
+    wide = field.width == 3
+
+    def decode(messages):
+        try:
+            r = unpack_from(messages[0].data, offset)
+        except struct.error:
+            return None  # too short
+        return {name: convert(r[0] << 16 | r[1] if wide else r[0])}
+
+    return decode
@@ -0,0 +1,190 @@
+"""Passive monitoring of the Leaf's broadcast CAN frames (ATMA).
+
+The ECUs on the EV-CAN broadcast their state many times a second: the
+LBC its voltage, current, state of charge and GIDs, the ABS the vehicle
+speed. Listening to these takes no requests at all, so while the car is
+on the API monitors the bus between polling cycles (see api.py).
+
+Each broadcast ID has a decoder, looked up in a registry keyed by CAN
+ID, and an interval: frames of that ID arriving sooner than the
+interval after the last one used are dropped before they are decoded
+(decimation), so a 100 Hz frame doesn't turn into 100 state updates a
+second.
+
+The adapter only forwards the frames its receive filter (ATCF/ATCM)
+passes, so that the rest of the bus doesn't flood the BLE link and fill
+the adapter's buffer. The Leaf's broadcast IDs differ in all 11 bits:
+a filter passing all of them has a mask of 0, and passes the whole bus.
+So each window between cycles listens to a single ID, in turn (see
+CANMonitor.next_filter()).
+
+Decoders take the 8 data bytes of a frame and return a dict of values,
+like the decoders for queries in decoders.py. Bit layouts follow the
+community Leaf CAN bus documentation (as used by OVMS and LeafSpy).
+"""
+
+from collections.abc import Callable
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+CAN_ID_MASK = 0x7FF  # 11-bit identifiers
+
+
+def lbc_power(d):
+    """0x1DB: HV battery current and voltage, from the LBC."""
+    current = (d[0] << 3) | (d[1] >> 5)
+    if current & 0x400:  # 11-bit two's complement
+        current -= 0x800
+    voltage = (d[2] << 2) | (d[3] >> 6)
+    return {
+        "hv_battery_current": current / 2,  # A, positive when discharging
+        "hv_battery_voltage": voltage / 2,
+    }
+
+
+def lbc_soc(d):
+    """0x55B: HV battery state of charge, from the LBC."""
+    return {"state_of_charge": ((d[0] << 2) | (d[1] >> 6)) / 10}
+
+
+def lbc_gids(d):
+    """0x5BC: HV battery available energy, in GIDs (~80 Wh each)."""
+    gids = (d[0] << 2) | (d[1] >> 6)
+    if gids == 0x3FF:  # not yet available after wake up
+        return None
+    return {"hv_battery_gids": gids}
+
+
+def abs_speed(d):
+    """0x284: vehicle speed, from the ABS."""
+    # approximate ratio, found by comparison with the dashboard speedometer
+    return {"speed": round(int.from_bytes(d[4:6]) / 92, 1)}
+
+
+class BroadcastMessage:
+    """A broadcast CAN ID, its decoder and its decimation interval."""
+
+    def __init__(self, can_id, name, decoder, interval=1.0) -> None:
+        """Initialise."""
+        self.can_id = can_id
+        self.name = name
+        self.decoder = decoder
+        self.interval = interval  # minimum seconds between decoded frames
+
+
+# fmt: off
+broadcast_messages = {
+    0x1DB: BroadcastMessage(0x1DB, "lbc_power", lbc_power, interval=1.0),
+    0x55B: BroadcastMessage(0x55B, "lbc_soc",   lbc_soc,   interval=5.0),
+    0x5BC: BroadcastMessage(0x5BC, "lbc_gids",  lbc_gids,  interval=5.0),
+    0x284: BroadcastMessage(0x284, "abs_speed", abs_speed, interval=1.0),
+}
+# fmt: on
+
+
+def receive_filter(can_ids) -> tuple[int, int]:
+    """Return the ELM (ATCF, ATCM) pair that passes all of can_ids.
+
+    The mask keeps the bits the IDs have in common, so other IDs sharing
+    those bits get through too; they are dropped by CANMonitor. For IDs
+    with no bit in common, the mask is 0 and every ID gets through.
+    """
+    can_ids = list(can_ids)
+    differing = 0
+    for can_id in can_ids:
+        differing |= can_id ^ can_ids[0]
+    mask = ~differing & CAN_ID_MASK
+    return can_ids[0] & mask, mask
+
+
+class CANMonitor:
+    """Decodes and decimates monitored frames into the latest values.
+
+    feed_line() takes the lines printed by the ELM while monitoring
+    (ATH1/ATS0/ATCAF0: 3 hex digits of CAN ID followed by the data). Each
+    decoded frame updates values, and is passed to on_values if set.
+    """
+
+    def __init__(
+        self,
+        messages: dict[int, BroadcastMessage] | None = None,
+        on_values: Callable[[dict], None] | None = None,
+        clock=time.monotonic,
+    ) -> None:
+        """Initialise."""
+        self.messages = messages if messages is not None else broadcast_messages
+        self.on_values = on_values
+        self.values: dict = {}  # latest decoded values
+        self._clock = clock
+        self._last_used: dict[int, float] = {}  # CAN ID -> time of last decoded frame
+        self._turn = 0  # of the next ID to listen to
+        self.stats = {
+            "frames": 0,
+            "decoded": 0,
+            "decimated": 0,
+            "ignored": 0,  # other IDs let through by the adapter's filter
+            "errors": 0,
+            "buffer_full": 0,
+        }
+
+    @property
+    def can_ids(self):
+        """Return the CAN IDs with a decoder."""
+        return list(self.messages)
+
+    def next_filter(self) -> tuple[int, int]:
+        """Return the (ATCF, ATCM) pair for the next window, passing one ID.
+
+        The IDs take turns, so each is heard every len(can_ids) windows;
+        its last value is kept in between.
+        """
+        can_ids = self.can_ids
+        can_id = can_ids[self._turn % len(can_ids)]
+        self._turn += 1
+        return receive_filter([can_id])
+
+    def reset(self) -> None:
+        """Forget the values and decimation state, e.g. when the car is off."""
+        self.values = {}
+        self._last_used.clear()
+
+    def feed_line(self, line: bytes) -> None:
+        """Handle a line of monitor output."""
+        line = line.replace(b" ", b"")
+        try:
+            can_id = int(line[:3], 16)
+            data = bytes.fromhex(line[3:].decode())
+        except ValueError:
+            if line == b"BUFFERFULL":
+                # the adapter couldn't send frames fast enough, and stopped
+                self.stats["buffer_full"] += 1
+            else:
+                logger.debug("Unexpected monitor output: %s", line)
+                self.stats["errors"] += 1
+            return
+        self.stats["frames"] += 1
+
+        message = self.messages.get(can_id)
+        if message is None:
+            self.stats["ignored"] += 1
+            return
+        now = self._clock()
+        last = self._last_used.get(can_id)
+        if last is not None and now - last < message.interval:
+            self.stats["decimated"] += 1
+            return
+
+        try:
+            values = message.decoder(data)
+        except IndexError:
+            logger.debug("Short %s frame: %s", message.name, line)
+            self.stats["errors"] += 1
+            return
+        self._last_used[can_id] = now
+        self.stats["decoded"] += 1
+        if values:
+            self.values.update(values)
+            if self.on_values is not None:
+                self.on_values(values)
@@ -31,15 +31,69 @@
 ########################################################################
 
 import logging
+import time
 
 from bleak.backends.device import BLEDevice
 
 # from .commands import commands
+from .breaker import CircuitBreakers
+from .deadline import Deadline
 from .elm327 import ELM327, OBDStatus
 from .OBDResponse import OBDResponse
+from .profile import VehicleProfile
+from .protocols.protocol import Message
+from .timeouts import DEFAULT_ST, ResponseTimeouts
+from .tracing import Tracer
+from .transcript import TranscriptRecorder
+from .uds import PERMANENT_NRCS, POSITIVE, classify, is_pending, nrc_name
 
 logger = logging.getLogger(__name__)
 
+# flow control frames sent by the ELM while receiving multi-frame responses:
+# "continue to send", no block size limit, no separation time, using the
+# user supplied FC data (ATFCSM1). These are the same for every ECU.
+FLOW_CONTROL_DATA = b"30 00 00"
+FLOW_CONTROL_MODE = b"1"
+
+# the CAN ID each ECU answers from, for the adapter's receive filter
+# (ATCRA): with CAN auto formatting off the ELM otherwise passes on any
+# frame it sees while waiting for the answer, each costing BLE airtime
+RESPONSE_HEADERS = {
+    b"797": b"79A",  # VCM
+    b"743": b"763",  # meter
+    b"79B": b"7BB",  # LBC
+}
+
+# UDS ReadDataByIdentifier, and its positive response
+READ_DID = 0x22
+READ_DID_RESPONSE = 0x62
+NEGATIVE_RESPONSE = 0x7F
+# KWP2000 ReadDataByLocalIdentifier
+READ_LOCAL_ID = 0x21
+# the ELM can only send single frame requests with CAN formatting off:
+# PCI byte + service + 3 two-byte DIDs fill the 8 data bytes
+MAX_DIDS_PER_REQUEST = 3
+# negative responses refusing multi-DID requests as such, rather than for now
+MULTI_DID_REFUSED = PERMANENT_NRCS | {0x13}  # incorrect message length or format
+
+
+def _formatting(compact):
+    """Return the ELM settings for compact (ATH0, ATCAF1) or raw responses."""
+    if compact:
+        return [(b"H", b"0"), (b"CAF", b"1")]
+    return [(b"H", b"1"), (b"CAF", b"0")]
+
+
+def _strip_pci(command):
+    """Return the data of a raw single frame request, or None if it isn't one."""
+    try:
+        raw = bytes.fromhex(command.decode())
+    except ValueError:
+        return None
+    if not raw or raw[0] != len(raw) - 1:
+        return None
+    return command[2:]
+
 
 class OBD:
     """Class representing an OBD-II connection with it's assorted commands/sensors."""
@@ -49,14 +103,32 @@ class OBD:
         device: BLEDevice,
         fast=True,
         timeout=0.1,
+        profile: VehicleProfile | None = None,
+        tracer: Tracer | None = None,
+        compact=False,
+        timeouts: ResponseTimeouts | None = None,
     ) -> None:
         """Initialise."""
         self.interface = None
         self.fast = fast  # global switch for disabling optimizations
         self.timeout = timeout
+        # have the ELM format responses (ATH0, ATCAF1), see __request()
+        self.compact = compact
+        # learned frame counts, shared across sessions with the same car
+        self.profile = profile if profile is not None else VehicleProfile()
+        # timing of queries, header switches and decoding
+        self.tracer = tracer if tracer is not None else Tracer()
+        # ECU response latencies, for the ELM's response timeout
+        self.timeouts = timeouts if timeouts is not None else ResponseTimeouts()
         self.__device = device
-        self.__last_header = ()  # for comparing with the previously used header
-        self.__frame_counts = {}  # keeps track of the number of return frames for each command
+        self.__elm_settings = {}  # AT setting -> value known to be active on the ELM
+        self.at_commands_sent = 0  # settings commands actually sent
+        self.at_commands_saved = 0  # settings commands skipped as already active
+        self.__raw_headers = set()  # ECUs whose compact responses were ambiguous
+        self.compact_fallbacks = 0  # compact responses asked for again raw
+        # set by close(): the adapter was left set up for a warm start
+        self.clean_close = False
+        self.__connect_start = None  # until the first query is answered
 
     @classmethod
     async def create(
@@ -67,72 +139,185 @@ class OBD:
         timeout=0.1,
         check_voltage=True,
         start_low_power=False,
+        profile: VehicleProfile | None = None,
+        port=None,
+        tracer: Tracer | None = None,
+        recorder: TranscriptRecorder | None = None,
+        compact=False,
+        timeouts: ResponseTimeouts | None = None,
+        warm_start=False,
+        restored=True,
     ):
-        """Manufacture instance."""
-        self = cls(device, fast, timeout)
+        """Manufacture instance.
+
+        warm_start skips resetting the adapter if it still has the setup
+        of a previous session; restored tells whether that session put
+        back the settings it changed (see close()).
+        """
+        self = cls(device, fast, timeout, profile, tracer, compact, timeouts)
+        self.__connect_start = time.perf_counter()
 
         logger.debug("Connecting to BLEDevice")
         await self.__connect(
-            protocol, check_voltage, start_low_power
+            protocol, check_voltage, start_low_power, port, recorder, warm_start
         )  # initialize by connecting and loading sensors
+        if self.warm_started and not restored:
+            if not await self.__restore_settings(force=True):
+                await self.close()
         return self
 
-    async def __connect(self, protocol, check_voltage, start_low_power):
+    async def __connect(
+        self,
+        protocol,
+        check_voltage,
+        start_low_power,
+        port=None,
+        recorder=None,
+        warm_start=False,
+    ):
         """Attempt to instantiate an ELM327 connection object."""
 
         self.interface = await ELM327.create(
-            self.__device, protocol, self.timeout, check_voltage, start_low_power
+            self.__device,
+            protocol,
+            self.timeout,
+            check_voltage,
+            start_low_power,
+            port,
+            self.tracer,
+            recorder,
+            warm_start,
         )
 
         # if the connection failed, close it
         if self.status() == OBDStatus.NOT_CONNECTED:
             # the ELM327 class will report its own errors
             await self.close()
-
-    async def __set_header(self, header) -> None:
-        if header == self.__last_header:
-            return
-        r = await self.interface.send_and_parse(b"AT SH " + header + b" ")
-        if not r:
-            logger.debug("Set Header ('AT SH %s') did not return data", header)
-            return
-        if "\n".join([m.raw() for m in r]) != "OK":
-            logger.debug("Set Header ('AT SH %s') did not return 'OK'", header)
-            return
-
-        r = await self.interface.send_and_parse(b"AT FC SH " + header + b" ")
-        if not r:
-            logger.debug("Set Header ('AT FC SH %s') did not return data", header)
-            return
-        if "\n".join([m.raw() for m in r]) != "OK":
-            logger.debug("Set Header ('AT FC SH %s') did not return 'OK'", header)
-            return
-
-        r = await self.interface.send_and_parse(b"AT FC SD 30 00 00")
-        if not r:
-            logger.debug("Set Header ('AT FC SD %s') did not return data", header)
-            return
-        if "\n".join([m.raw() for m in r]) != "OK":
-            logger.debug("Set Header ('AT FC SD %s') did not return 'OK'", header)
             return
-
-        r = await self.interface.send_and_parse(b"AT FC SM 1")
+        # the raw response format set up by ELM327.create()
+        self.__elm_settings.update({b"H": b"1", b"CAF": b"0"})
+
+    async def __set_header(self, header, compact=False, deadline=None) -> None:
+        """Address the given ECU, sending only the settings that changed.
+
+        Switching ECU needs the request header (SH), the flow control
+        header (FC SH) and the receive filter (CRA, cleared for an ECU
+        whose response ID isn't known); the flow control data and mode
+        only need to be set once per session. In compact mode, headers
+        (H) and CAN formatting (CAF) follow the response format wanted.
+        The response timeout (ST) is the one learned for the ECU, or the
+        ELM's default until it is known.
+        """
+        start, sent = time.perf_counter(), self.at_commands_sent
+        settings = [
+            (b"SH", header),
+            (b"FC SH", header),
+            (b"CRA", RESPONSE_HEADERS.get(header, b"")),
+            (b"FC SD", FLOW_CONTROL_DATA),
+            (b"FC SM", FLOW_CONTROL_MODE),
+        ]
+        if self.compact:
+            settings += _formatting(compact)
+        st = self.timeouts.st(header) if self.fast else None
+        if st is None and b"ST" in self.__elm_settings:
+            st = DEFAULT_ST  # back from an ECU with a learned timeout
+        if st is not None:
+            settings.append((b"ST", b"%02X" % st))
+        for name, value in settings:
+            if not await self.__apply_setting(name, value, deadline):
+                break
+        if self.at_commands_sent != sent:
+            # only actual switches are timed
+            self.tracer.record(time.perf_counter() - start, stage="set_header")
+
+    async def __apply_setting(self, name, value, deadline=None) -> bool:
+        """Send 'AT <name> <value>', unless the ELM already has that setting."""
+        if self.__elm_settings.get(name) == value:
+            self.at_commands_saved += 1
+            return True
+
+        # until the ELM confirms, we don't know what it has active
+        self.__elm_settings.pop(name, None)
+        self.at_commands_sent += 1
+        command = b"AT " + name + b" " + value if value else b"AT " + name
+        r = await self.interface.send_and_parse(command, deadline)
         if not r:
-            logger.debug("Set Header ('AT FC SM %s') did not return data", header)
-            return
+            logger.debug("Set Header ('AT %s %s') did not return data", name, value)
+            return False
         if "\n".join([m.raw() for m in r]) != "OK":
-            logger.debug("Set Header ('AT FC SM %s') did not return 'OK'", header)
-            return
+            logger.debug("Set Header ('AT %s %s') did not return 'OK'", name, value)
+            return False
 
-        self.__last_header = header
+        self.__elm_settings[name] = value
+        return True
 
     async def close(self):
-        """Close the connection, and clears supported_commands."""
+        """Close the connection, and clears supported_commands.
+
+        If the adapter can be put back to the settings ELM327.create()
+        leaves it with, it is not reset, so that the next session can
+        start warm (clean_close).
+        """
 
         if self.interface is not None:
             logger.info("Closing connection")
-            await self.interface.close()
+            self.clean_close = await self.__restore_settings()
+            await self.interface.close(reset=not self.clean_close)
             self.interface = None
+        self.__elm_settings.clear()
+        self.__raw_headers.clear()
+
+    async def __restore_settings(self, force=False) -> bool:
+        """Undo the settings changed during the session, if still connected.
+
+        With force, also those that a session which lost its link may
+        have changed, whatever this session knows of them.
+        """
+        if not self.is_alive():
+            return False
+        await self.stop_monitor()
+        settings = _formatting(False) if self.compact or force else []
+        if force or b"ST" in self.__elm_settings:
+            settings.append((b"ST", b"%02X" % DEFAULT_ST))
+        for name, value in settings:
+            if force:
+                self.__elm_settings.pop(name, None)
+            if not await self.__apply_setting(name, value):
+                return False
+        return True
+
+    @property
+    def warm_started(self) -> bool:
+        """Return True if the adapter kept its settings from the last session."""
+        return self.interface is not None and self.interface.warm_started
+
+    @property
+    def header(self):
+        """Return the header the ELM is currently addressing, if known."""
+        return self.__elm_settings.get(b"SH")
+
+    @property
+    def monitoring(self) -> bool:
+        """Return True while the adapter is monitoring the bus."""
+        return self.interface is not None and self.interface.monitoring
+
+    async def monitor(self, on_line, receive_filter=None, receive_mask=None) -> bool:
+        """Stream broadcast frames to on_line until the next query (see ELM327.monitor)."""
+        if self.status() == OBDStatus.NOT_CONNECTED:
+            return False
+        # the monitor parses raw frames
+        if self.compact:
+            for name, value in _formatting(False):
+                if not await self.__apply_setting(name, value):
+                    return False
+        # monitoring replaces the receive filter, and clears it when stopped
+        self.__elm_settings.pop(b"CRA", None)
+        return await self.interface.monitor(on_line, receive_filter, receive_mask)
+
+    async def stop_monitor(self) -> None:
+        """Stop monitoring the bus."""
+        if self.interface is not None:
+            await self.interface.stop_monitor()
 
     def status(self):
         """Return the OBD connection status."""
@@ -140,6 +325,12 @@ class OBD:
             return OBDStatus.NOT_CONNECTED
         return self.interface.status()
 
+    def is_alive(self):
+        """Return True if the link to the adapter is still usable."""
+        if self.interface is None:
+            return False
+        return self.interface.is_alive()
+
     async def low_power(self):
         """Enter low power mode."""
         if self.interface is None:
@@ -172,49 +363,366 @@ class OBD:
         """
         return self.status() == OBDStatus.CAR_CONNECTED
 
-    async def query(self, cmd, force=False):
-        """Primary API function. Send commands to the car, and protect against sending unsupported commands."""
+    async def query(self, cmd, force=False, deadline: Deadline | None = None):
+        """Primary API function. Send commands to the car, and protect against sending unsupported commands.
+
+        With a deadline, the query gets what is left of it: once it has
+        passed, nothing more is sent and an empty response is returned.
+        An empty response carries cmd if it was sent and left unanswered
+        (see __unanswered()), and no command if it wasn't sent.
+        """
+        with self.tracer.span(command=cmd.name, header=cmd.header.decode()):
+            return await self.__query(cmd, force, deadline)
 
+    async def __query(self, cmd, force, deadline=None):
         if self.status() == OBDStatus.NOT_CONNECTED:
             logger.debug("Query failed, no connection available")
             return OBDResponse()
 
+        if deadline is not None and deadline.expired:
+            logger.debug("Deadline passed, not sending %s", cmd.name)
+            return OBDResponse()
+
         # if the user forces, skip all checks
         if not force and not self.test_cmd(cmd):
             return OBDResponse()
 
-        await self.__set_header(cmd.header)
+        if self.__unsupported(cmd):
+            return OBDResponse()
 
         logger.info("Sending command: %s", cmd)
-        cmd_string = self.__build_command_string(cmd)
-        messages = await self.interface.send_and_parse(cmd_string)
+        expected = self.__expected_frames(cmd)
+        messages = await self.__request(cmd.header, cmd.command, expected, deadline)
+        if not messages:
+            # nothing before the ELM, or the deadline, gave up waiting
+            logger.debug("No valid OBD Messages returned")
+            return self.__unanswered(cmd, deadline)
+        frames = sum([len(m.frames) for m in messages])
+        answered = all(m.parsed() for m in messages)
+        truncated = any(m.incomplete for m in messages)
+
+        if deadline is not None and deadline.expired and (truncated or not answered):
+            # cut short by the deadline rather than the ECU: nothing to learn
+            logger.debug("Deadline passed while waiting for %s", cmd.name)
+            return OBDResponse()
+
+        # nothing but "response pending": the ECU needs more time than
+        # the ELM waited for, so wait longer when asking again
+        pending = answered and all(is_pending(m.data) for m in messages)
+        if pending:
+            logger.debug("%s: no answer after response pending", cmd.name)
+            self.timeouts.back_off(cmd.header)
+
+        if answered and (pending or expected is not None and (frames != expected or truncated)):
+            # the response changed shape, so the learned count is wrong
+            logger.debug(
+                "%s returned %d frames, expected %s", cmd.name, frames, expected
+            )
+            self.profile.forget_frame_count(cmd)
+            if truncated:
+                # the ELM stopped listening too early: ask again the slow way
+                messages = await self.__request(cmd.header, cmd.command, None, deadline)
+                if not messages:
+                    logger.debug("No valid OBD Messages returned")
+                    return self.__unanswered(cmd, deadline)
+                frames = sum([len(m.frames) for m in messages])
+                answered = all(m.parsed() for m in messages)
+                truncated = any(m.incomplete for m in messages)
+
         for f in messages[0].frames:
             logger.debug("Received frame: %s", f.raw)
 
-        # if we don't already know how many frames this command returns,
-        # log it, so we can specify it next time
-        if cmd not in self.__frame_counts:
-            self.__frame_counts[cmd] = sum([len(m.frames) for m in messages])
+        # learn how many frames this command returns, so that once the
+        # count is stable we can ask the ELM to wait for just that many
+        if truncated:
+            self.timeouts.back_off(cmd.header)
+        if answered and not truncated:
+            self.__observe_latency(cmd.header)
+            if any(m.pending for m in messages):
+                # the ELM counts the response pending frames too, and there
+                # may be more or fewer of them next time
+                self.profile.forget_frame_count(cmd)
+            elif classify(messages[0].data)[0] == POSITIVE:
+                # a negative response is shorter than the answer would be
+                self.profile.observe_frame_count(cmd, frames)
+            did = self.__did(cmd)
+            if did is not None and len(messages) == 1:
+                data = messages[0].data
+                if data[:3] == bytes([READ_DID_RESPONSE]) + did:
+                    self.profile.observe_did_length(cmd.header, did, len(data) - 3)
 
-        if not messages:
-            logger.debug("No valid OBD Messages returned")
+        for m in messages:
+            if len(m.data) == 0:
+                if m.raw() == "NO DATA" or m.raw() == "CAN ERROR":
+                    logger.info("Vehicle not responding")
+                else:
+                    logger.debug("No data in response: %s", m.raw())
+                return self.__unanswered(cmd, deadline)
+
+        kind, nrc = classify(messages[0].data)
+        if kind != POSITIVE:
+            # answered, but there is nothing to decode
+            logger.info("%s: %s response (%s)", cmd.name, kind, nrc_name(nrc))
+            if nrc in PERMANENT_NRCS and self.__reads_data(cmd):
+                self.profile.set_unsupported(cmd, nrc)
+            return OBDResponse(cmd, messages)
+
+        with self.tracer.span(stage="decode"):
+            return cmd(messages)  # compute a response object
+
+    @staticmethod
+    def __unanswered(cmd, deadline=None):
+        """Return the response to cmd, sent but not answered.
+
+        Unlike the response to a command that wasn't sent, it carries
+        cmd, so that a caller can tell a failed query from a skipped one;
+        unless the deadline passed while waiting, which says nothing
+        about the ECU.
+        """
+        if deadline is not None and deadline.expired:
             return OBDResponse()
+        return OBDResponse(cmd)
 
-        for m in messages:
-            if len(m.data) == 0 & ((m.raw == "NO DATA") | (m.raw == "CAN ERROR")):
-                logger.info("Vehicle not responding")
+    async def query_batch(
+        self,
+        cmds,
+        deadline: Deadline | None = None,
+        breakers: CircuitBreakers | None = None,
+    ):
+        """Query several commands, returning their responses in order.
+
+        Runs of ReadDataByIdentifier (0x22) commands for the same ECU are
+        packed into shared multi-DID requests, once the payload length of
+        each DID is known (from answers to single queries) so the combined
+        response can be split up again. Each command is decoded from a
+        message holding exactly what a single query would have returned.
+
+        If an ECU rejects a multi-DID request, or answers it in a way that
+        can't be split, the commands are queried one by one; a refusal of
+        multi-DID requests as such (not, say, busy) is remembered in the
+        vehicle profile, until it expires. Commands left once the deadline
+        has passed get empty responses (see query()).
+
+        With breakers, the commands for an ECU that left a query
+        unanswered get empty responses without being sent (see
+        breaker.py); its open breaker also stops multi-DID requests, so
+        that a trial sends a single query.
+        """
+        responses = []
+        run = []  # batchable commands for the same ECU
+
+        async def query(c):
+            if self.__unsupported(c):
                 return OBDResponse()
+            if breakers is not None and not breakers.allow(c.header):
+                return OBDResponse()
+            response = await self.query(c, True, deadline)
+            if breakers is not None and not (deadline is not None and deadline.expired):
+                if response.messages:
+                    breakers.success(c.header)
+                else:
+                    breakers.failure(c.header)
+            return response
+
+        async def flush():
+            if len(run) > 1 and (breakers is None or not breakers.is_open(run[0].header)):
+                batched = await self.__query_dids(run, deadline)
+                if batched is not None:
+                    responses.extend(batched)
+                    run.clear()
+                    return
+            for c in run:
+                responses.append(await query(c))
+            run.clear()
+
+        for cmd in cmds:
+            if self.__batchable(cmd):
+                if run and (
+                    run[0].header != cmd.header or len(run) == MAX_DIDS_PER_REQUEST
+                ):
+                    await flush()
+                run.append(cmd)
+            else:
+                await flush()
+                responses.append(await query(cmd))
+        await flush()
+        return responses
+
+    @staticmethod
+    def __reads_data(cmd):
+        """Return True for a data read (0x21/0x22) that an ECU may not support."""
+        try:
+            raw = bytes.fromhex(cmd.command.decode())
+        except ValueError:
+            return False
+        return len(raw) >= 3 and raw[1] in (READ_DID, READ_LOCAL_ID)
+
+    def __unsupported(self, cmd):
+        """Return True if cmd is known to be unsupported (see VehicleProfile)."""
+        if self.profile.is_supported(cmd):
+            return False
+        nrc = self.profile.negative_response(cmd)
+        logger.debug(
+            "Not sending %s: %s", cmd.name, "no answer" if nrc is None else nrc_name(nrc)
+        )
+        return True
+
+    @staticmethod
+    def __did(cmd):
+        """Return the DID read by a single-DID 0x22 command, or None."""
+        try:
+            raw = bytes.fromhex(cmd.command.decode())
+        except ValueError:
+            return None
+        if len(raw) != 4 or raw[0] != 3 or raw[1] != READ_DID:
+            return None
+        return raw[2:]
+
+    def __batchable(self, cmd):
+        did = self.__did(cmd)
+        return (
+            did is not None
+            and self.profile.supports_multi_did(cmd.header) is not False
+            and self.profile.did_length(cmd.header, did) is not None
+        )
 
-        return cmd(messages)  # compute a response object
+    async def __query_dids(self, cmds, deadline=None):
+        """Read the DIDs of several commands in one request.
 
-    def __build_command_string(self, cmd):
-        """Assemble the appropriate command string."""
-        cmd_string = cmd.command
+        Returns the responses, or None if the caller should fall back to
+        single queries.
+        """
+        if self.status() == OBDStatus.NOT_CONNECTED:
+            return None
+        if deadline is not None and deadline.expired:
+            return None
+
+        header = cmds[0].header
+        dids = [self.__did(c) for c in cmds]
+        request = bytes([1 + 2 * len(dids), READ_DID]) + b"".join(dids)
+
+        start = time.perf_counter()
+        logger.info("Sending multi-DID request to %s: %s", header, request.hex())
+        messages = await self.__request(
+            header, request.hex().upper().encode(), None, deadline
+        )
+        # the request is shared, so each command is charged its share
+        per_command = (time.perf_counter() - start) / len(cmds)
+        for cmd in cmds:
+            self.tracer.record(per_command, command=cmd.name, header=header.decode())
+
+        usable = (
+            messages  # None if the link dropped
+            and len(messages) == 1
+            and messages[0].parsed()
+            and not messages[0].incomplete
+        )
+        if not usable:
+            logger.debug("No usable answer to multi-DID request")
+            if deadline is not None and deadline.expired:
+                return None  # cut short by the deadline, not the ECU
+            if messages and messages[0].incomplete:
+                self.timeouts.back_off(header)
+            return None
+        self.__observe_latency(header)
+        data = messages[0].data
+
+        if data[0] == NEGATIVE_RESPONSE and data[1] == READ_DID:
+            logger.debug("Multi-DID request rejected: %s", data.hex())
+            if len(data) > 2 and data[2] in MULTI_DID_REFUSED:
+                self.profile.set_multi_did(header, False)
+            return None
+
+        # split "62 DID1 payload1 DID2 payload2 ..." back up
+        payloads = []
+        pos = 1
+        for did in dids:
+            length = self.profile.did_length(header, did)
+            if data[pos : pos + 2] != did:
+                break
+            payloads.append(data[pos + 2 : pos + 2 + length])
+            pos += 2 + length
+        if data[0] != READ_DID_RESPONSE or len(payloads) != len(dids) or pos != len(data):
+            # not all DIDs answered, or their lengths changed
+            logger.debug("Could not split multi-DID response: %s", data.hex())
+            if data[0] == READ_DID_RESPONSE and len(payloads) < len(dids):
+                self.profile.set_multi_did(header, False)
+            return None
+
+        self.profile.set_multi_did(header, True)
+        responses = []
+        for cmd, did, payload in zip(cmds, dids, payloads, strict=True):
+            message = Message(messages[0].frames)
+            message.data = bytearray([READ_DID_RESPONSE]) + did + payload
+            with self.tracer.span(stage="decode"):
+                responses.append(cmd([message]))
+        return responses
+
+    def __observe_latency(self, header):
+        """Feed the latency of the last (complete) response to the timeouts."""
+        # only the ELM327 times its responses
+        latency = getattr(self.interface, "response_latency", None)
+        if latency is not None:
+            self.timeouts.observe(header, latency)
+
+    def __expected_frames(self, cmd):
+        """Return the learned frame count to append to cmd, if any."""
+        if not self.fast:
+            return None
+        count = self.profile.frame_count(cmd, trust_first=cmd.fast)
+        # the ELM takes a single hex digit
+        if count is None or not 0 < count <= 0xF:
+            return None
+        return count
+
+    async def __request(self, header, command, frames=None, deadline=None):
+        """Address an ECU and send it a request, returning the messages.
+
+        command is a raw single frame ("03221304"). In compact mode it is
+        sent without its PCI byte, for the ELM to format the response
+        (ATH0, ATCAF1); if that response is ambiguous, it is asked for
+        again raw, and so is everything else for that ECU this session.
+        Returns None if the link dropped.
+        """
+        compact = None
+        if self.compact and header not in self.__raw_headers:
+            compact = _strip_pci(command)
+        await self.__set_header(header, compact is not None, deadline)
+
+        if compact is not None:
+            messages = await self.interface.send_and_parse_compact(
+                self.__build_command_string(compact, frames), deadline
+            )
+            if messages is not None:
+                self.__first_answer()
+                return messages
+            if deadline is not None and deadline.expired:
+                return []  # cut short, not ambiguous
+            if self.status() == OBDStatus.NOT_CONNECTED:
+                return None  # the link dropped, not ambiguous
+            logger.debug("Ambiguous compact response from %s, using raw mode", header)
+            self.__raw_headers.add(header)
+            self.compact_fallbacks += 1
+            await self.__set_header(header, False, deadline)
+        messages = await self.interface.send_and_parse(
+            self.__build_command_string(command, frames), deadline
+        )
+        self.__first_answer()
+        return messages
 
+    def __first_answer(self):
+        """Time the session from connecting to the first answer to a query."""
+        if self.__connect_start is not None:
+            elapsed = time.perf_counter() - self.__connect_start
+            self.tracer.record(elapsed, stage="first_query")
+            self.__connect_start = None
+
+    def __build_command_string(self, cmd_string, frames=None):
+        """Assemble the appropriate command string."""
         # if we know the number of frames that this command returns,
         # only wait for exactly that number. This avoids some harsh
         # timeouts from the ELM, thus speeding up queries.
-        if self.fast and cmd.fast and (cmd in self.__frame_counts):
-            cmd_string += str(self.__frame_counts[cmd]).encode()
+        if frames is not None:
+            cmd_string += b"%X" % frames
 
         return cmd_string
@@ -0,0 +1,275 @@
+"""What has been learned about a particular car, kept across restarts."""
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class VehicleProfile:
+    """Per-vehicle knowledge learned while polling.
+
+    This holds the number of CAN frames each command's response takes.
+    Once a count has been seen STABLE_HITS times in a row it is appended
+    to the command, so the ELM returns as soon as that many frames have
+    arrived instead of waiting out its response timeout.
+
+    It also holds what is needed to read several UDS data identifiers
+    (DIDs) in one request: the payload length of each DID, and whether
+    each ECU accepts such requests at all. A refusal expires after
+    UNSUPPORTED_TTL as well.
+
+    And it holds the commands this car doesn't support, so that they are
+    not sent again: data reads an ECU answered with a negative response
+    that means it will never succeed (see uds.py), and commands that went
+    unanswered or were rejected MISSES_UNSUPPORTED cycles in a row while
+    their ECU was answering other queries. Different model years support
+    different commands. An entry expires after UNSUPPORTED_TTL, so that
+    the command is tried again, e.g. after a firmware update.
+
+    Finally, it holds what a capability probe (see capabilities.py)
+    found: the model generation, and each ECU's response latencies, to
+    start the response timeouts from (see timeouts.py).
+
+    The profile is stored with Home Assistant's storage helper (see
+    as_dict()/from_dict()); dirty is set whenever it changes and is
+    cleared by whoever saves it.
+    """
+
+    # consecutive identical observations before a frame count is relied on
+    STABLE_HITS = 3
+    # cycles in a row without an answer before a command is dropped
+    MISSES_UNSUPPORTED = 5
+    # seconds before an unsupported command, or a refused multi-DID
+    # read, is tried again
+    UNSUPPORTED_TTL = 7 * 24 * 3600
+
+    def __init__(self) -> None:
+        """Initialise."""
+        self.frame_counts: dict[str, dict[str, int]] = {}  # name -> count, hits
+        self.did_lengths: dict[str, int] = {}  # "header:DID" -> payload bytes
+        # header -> whether it accepts multi-DID reads, and since when
+        self.multi_did: dict[str, dict] = {}
+        # "header:request" -> NRC (None if unanswered) and when it was seen
+        self.unsupported: dict[str, dict] = {}
+        self._misses: dict[str, int] = {}  # "header:request" -> cycles unanswered
+        self.generation: str | None = None  # "ZE0", "AZE0" or "ZE1"
+        self.latencies: dict[str, list[float]] = {}  # header -> seconds
+        self.dirty = False
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a profile from stored data (None for a new vehicle)."""
+        self = cls()
+        if not data:
+            return self
+        for name, entry in data.get("frame_counts", {}).items():
+            try:
+                self.frame_counts[name] = {
+                    "count": int(entry["count"]),
+                    "hits": int(entry["hits"]),
+                }
+            except (KeyError, TypeError, ValueError):
+                logger.debug("Ignoring stored frame count for %s: %s", name, entry)
+        self.did_lengths = {
+            key: value
+            for key, value in data.get("did_lengths", {}).items()
+            if isinstance(value, int)
+        }
+        for header, entry in data.get("multi_did", {}).items():
+            try:
+                if not isinstance(entry["accepts"], bool):
+                    raise TypeError
+                self.multi_did[header] = {
+                    "accepts": entry["accepts"],
+                    "since": float(entry["since"]),
+                }
+            except (KeyError, TypeError, ValueError):
+                logger.debug("Ignoring stored multi-DID support of %s: %s", header, entry)
+        for key, entry in data.get("unsupported", {}).items():
+            try:
+                nrc = entry["nrc"]
+                self.unsupported[key] = {
+                    "nrc": None if nrc is None else int(nrc),
+                    "since": float(entry["since"]),
+                }
+            except (KeyError, TypeError, ValueError):
+                logger.debug("Ignoring stored unsupported command %s: %s", key, entry)
+        generation = data.get("generation")
+        self.generation = generation if isinstance(generation, str) else None
+        for header, samples in data.get("latencies", {}).items():
+            try:
+                self.latencies[header] = [float(sample) for sample in samples]
+            except (TypeError, ValueError):
+                logger.debug("Ignoring stored latencies for %s: %s", header, samples)
+        return self
+
+    def as_dict(self):
+        """Return the profile in a form suitable for storage."""
+        return {
+            "frame_counts": {
+                name: dict(entry) for name, entry in self.frame_counts.items()
+            },
+            "did_lengths": dict(self.did_lengths),
+            "multi_did": {
+                header: dict(entry) for header, entry in self.multi_did.items()
+            },
+            "unsupported": {
+                key: dict(entry) for key, entry in self.unsupported.items()
+            },
+            "generation": self.generation,
+            "latencies": {
+                header: list(samples) for header, samples in self.latencies.items()
+            },
+        }
+
+    def frame_count(self, cmd, trust_first=False):
+        """Return the learned frame count for cmd, or None if not yet stable.
+
+        With trust_first, a single observation is enough (python-OBD's
+        behaviour for commands marked fast).
+        """
+        entry = self.frame_counts.get(cmd.name)
+        if entry is None:
+            return None
+        if entry["hits"] < (1 if trust_first else self.STABLE_HITS):
+            return None
+        return entry["count"]
+
+    def observe_frame_count(self, cmd, count):
+        """Record the number of frames a complete response to cmd took."""
+        entry = self.frame_counts.get(cmd.name)
+        if entry is not None and entry["count"] == count:
+            if entry["hits"] < self.STABLE_HITS:
+                entry["hits"] += 1
+                self.dirty = True
+            return
+        self.frame_counts[cmd.name] = {"count": count, "hits": 1}
+        self.dirty = True
+
+    def forget_frame_count(self, cmd):
+        """Drop the learned frame count for cmd, e.g. after a mismatch."""
+        if self.frame_counts.pop(cmd.name, None) is not None:
+            logger.debug("Forgetting frame count for %s", cmd.name)
+            self.dirty = True
+
+    @staticmethod
+    def _did_key(header, did):
+        return f"{header.decode()}:{did.hex().upper()}"
+
+    def did_length(self, header, did):
+        """Return the payload length of a DID on an ECU, or None if unknown."""
+        return self.did_lengths.get(self._did_key(header, did))
+
+    def observe_did_length(self, header, did, length):
+        """Record the payload length of a DID from a complete response."""
+        key = self._did_key(header, did)
+        if self.did_lengths.get(key) != length:
+            self.did_lengths[key] = length
+            self.dirty = True
+
+    def supports_multi_did(self, header, now=None):
+        """Return whether an ECU accepts multi-DID reads (None if untested).
+
+        A refusal older than UNSUPPORTED_TTL is dropped, so that they are
+        tried again.
+        """
+        key = header.decode()
+        entry = self.multi_did.get(key)
+        if entry is None:
+            return None
+        if entry["accepts"]:
+            return True
+        now = time.time() if now is None else now
+        if now - entry["since"] < self.UNSUPPORTED_TTL:
+            return False
+        logger.debug("Trying multi-DID reads on %s again", key)
+        del self.multi_did[key]
+        self.dirty = True
+        return None
+
+    def set_multi_did(self, header, supported, now=None):
+        """Record whether an ECU accepted a multi-DID read."""
+        key = header.decode()
+        entry = self.multi_did.get(key)
+        if entry is None or entry["accepts"] != supported:
+            logger.debug(
+                "ECU %s %s multi-DID reads",
+                key,
+                "accepts" if supported else "rejects",
+            )
+            self.multi_did[key] = {
+                "accepts": supported,
+                "since": time.time() if now is None else now,
+            }
+            self.dirty = True
+
+    @staticmethod
+    def _request_key(cmd):
+        # the request without its PCI byte: service and identifier
+        return f"{cmd.header.decode()}:{cmd.command[2:].decode().upper()}"
+
+    def is_supported(self, cmd, now=None):
+        """Return False while cmd is known to be unsupported.
+
+        An entry older than UNSUPPORTED_TTL is dropped, so that the
+        command is tried again.
+        """
+        key = self._request_key(cmd)
+        entry = self.unsupported.get(key)
+        if entry is None:
+            return True
+        now = time.time() if now is None else now
+        if now - entry["since"] < self.UNSUPPORTED_TTL:
+            return False
+        logger.debug("Trying %s again", key)
+        del self.unsupported[key]
+        self.dirty = True
+        return True
+
+    def negative_response(self, cmd):
+        """Return the NRC cmd was rejected with, if it is unsupported."""
+        entry = self.unsupported.get(self._request_key(cmd))
+        return entry["nrc"] if entry is not None else None
+
+    def set_unsupported(self, cmd, nrc=None, now=None):
+        """Record that the ECU will not answer cmd (negative response nrc, if any)."""
+        key = self._request_key(cmd)
+        self._misses.pop(key, None)
+        if key not in self.unsupported:
+            if nrc is None:
+                logger.debug("%s is not supported (no answer)", key)
+            else:
+                logger.debug("%s is not supported (NRC 0x%02X)", key, nrc)
+            self.unsupported[key] = {
+                "nrc": nrc,
+                "since": time.time() if now is None else now,
+            }
+            self.dirty = True
+
+    def forget_unsupported(self, cmd):
+        """Drop what is known about cmd being unsupported, to try it again."""
+        key = self._request_key(cmd)
+        self._misses.pop(key, None)
+        if self.unsupported.pop(key, None) is not None:
+            self.dirty = True
+
+    def observe_missing(self, cmd, nrc=None, now=None):
+        """Record a cycle in which cmd got no answer, or negative response nrc.
+
+        After MISSES_UNSUPPORTED such cycles in a row, cmd is unsupported.
+        """
+        key = self._request_key(cmd)
+        misses = self._misses.get(key, 0) + 1
+        if misses < self.MISSES_UNSUPPORTED:
+            self._misses[key] = misses
+        else:
+            self.set_unsupported(cmd, nrc, now)
+
+    def misses(self, cmd):
+        """Return the cycles in a row cmd has gone unanswered."""
+        return self._misses.get(self._request_key(cmd), 0)
+
+    def observe_answer(self, cmd):
+        """Record an answer to cmd."""
+        self._misses.pop(self._request_key(cmd), None)
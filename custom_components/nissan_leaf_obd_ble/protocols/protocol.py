@@ -31,8 +31,7 @@
 
 from binascii import hexlify
 import logging
-
-from ..utils import isHex
+import string
 
 logger = logging.getLogger(__name__)
 
@@ -43,12 +42,16 @@ Basic data models for all protocols to use
 """
 
 
+HEX_DIGITS = string.hexdigits.encode()
+
+
 class Frame:
     """Represent a single parsed line of OBD output."""
 
     def __init__(self, raw) -> None:
         """Initialise."""
-        self.raw = raw
+        # keep the line as bytes; the str form is only built when asked for
+        self.raw_bytes = raw.encode() if isinstance(raw, str) else raw
         self.data = bytearray()
         self.priority = None
         self.addr_mode = None
@@ -58,6 +61,11 @@ class Frame:
         self.seq_index = 0  # only used when type = CF
         self.data_len = None
 
+    @property
+    def raw(self):
+        """Return the original line from the adapter as a string."""
+        return self.raw_bytes.decode("utf-8", "ignore")
+
 
 class Message:
     """Represent a fully parsed OBD message of one or more Frames (lines)."""
@@ -66,6 +74,10 @@ class Message:
         """Initialise."""
         self.frames = frames
         self.data = bytearray()
+        # True if the answer was cut short: fewer bytes arrived than were
+        # announced, or nothing but "response pending" (see uds.py)
+        self.incomplete = False
+        self.pending = 0  # response pending frames (7F xx 78) before the answer
 
     @property
     def tx_id(self):
@@ -121,7 +133,7 @@ class Protocol:
     def __call__(self, lines):
         """Perform main function.
 
-        accepts a list of raw strings from the car, split by lines
+        accepts a list of raw lines from the car (bytes, or str)
         """
 
         # ---------------------------- preprocess ----------------------------
@@ -133,9 +145,12 @@ class Protocol:
         non_obd_lines = []
 
         for line in lines:
-            line_no_spaces = line.replace(" ", "")
+            if isinstance(line, str):
+                line = line.encode()
+            line_no_spaces = line.replace(b" ", b"")
 
-            if isHex(line_no_spaces):
+            # all hex digits <=> nothing left after deleting them
+            if not line_no_spaces.translate(None, HEX_DIGITS):
                 obd_lines.append(line_no_spaces)
             else:
                 non_obd_lines.append(line)  # pass the original, un-scrubbed line
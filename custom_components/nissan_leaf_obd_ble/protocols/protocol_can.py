@@ -32,8 +32,9 @@
 from binascii import unhexlify
 import logging
 
+from ..uds import is_pending
 from ..utils import contiguous
-from .protocol import Protocol
+from .protocol import HEX_DIGITS, Frame, Message, Protocol
 
 logger = logging.getLogger(__name__)
 
@@ -56,7 +57,7 @@ class CANProtocol(Protocol):
         Protocol.__init__(self)
 
     def _parse_frame(self, frame):
-        raw = frame.raw
+        raw = frame.raw_bytes
 
         # pad 11-bit CAN headers out to 32 bits for consistency,
         # since ELM already does this for 29-bit CAN headers
@@ -66,7 +67,7 @@ class CANProtocol(Protocol):
         # 00 00 07 E8 06 41 00 BE 7F B8 13
 
         if self.id_bits == 11:
-            raw = "00000" + raw
+            raw = b"00000" + raw
 
         # Handle odd size frames and drop
         if len(raw) & 1:
@@ -166,11 +167,30 @@ class CANProtocol(Protocol):
         return True
 
     def _parse_message(self, message):
+        # an ECU that needs more time answers "response pending" (7F xx 78)
+        # single frames first: the answer is whatever follows them
+        pending = [f for f in message.frames if self._is_pending(f)]
+        if pending:
+            message.pending = len(pending)
+            if len(pending) < len(message.frames):
+                message.frames = [f for f in message.frames if f not in pending]
+            else:
+                # the ELM stopped listening before the answer arrived
+                message.frames = pending[-1:]
+                message.incomplete = True
         frames = message.frames
 
         if len(frames) == 1:
             frame = frames[0]
 
+            if frame.type == self.FRAME_TYPE_FF:
+                # the ELM stopped listening after the first frame (e.g. it
+                # was told to expect a single frame): keep what we have
+                logger.debug("Recieved first frame without consecutive frames")
+                message.data = frame.data[2 : 2 + frame.data_len]
+                message.incomplete = True
+                return True
+
             if frame.type != self.FRAME_TYPE_SF:
                 logger.debug("Recieved lone frame not marked as single frame")
                 return False
@@ -259,7 +279,19 @@ class CANProtocol(Protocol):
 
             # chop to the correct size (as specified in the first frame)
             message.data = message.data[: ff[0].data_len]
+            if len(message.data) < ff[0].data_len:
+                logger.debug("Recieved multiline response shorter than announced")
+                message.incomplete = True
+
+        self._trim_dtc(message)
+        return True
+
+    def _is_pending(self, frame):
+        return frame.type == self.FRAME_TYPE_SF and is_pending(
+            frame.data[1 : 1 + frame.data_len]
+        )
 
+    def _trim_dtc(self, message):
         # trim DTC requests based on DTC count
         # this ISN'T in the decoder because the legacy protocols
         # don't provide a DTC_count bytes, and instead, insert a 0x00
@@ -275,7 +307,236 @@ class CANProtocol(Protocol):
                 : (num_dtc_bytes + 2)
             ]  # add 2 to account for mode/DTC_count bytes
 
-        return True
+
+class ISOTPReassembler:
+    """Reassemble a CAN response frame by frame, as the lines arrive.
+
+    CANProtocol only sees a response once the ELM prompt is in, and then
+    groups, sorts and concatenates the frames. The ELM, however, prints
+    the prompt only after it stops listening for further frames, which
+    without a frame count hint means waiting out its own timeout.
+
+    The reassembler is fed each line by the ELMTokenizer. The First Frame
+    declares the payload length, so the payload is preallocated and every
+    Consecutive Frame is written into place. feed() returns True once the
+    declared length is reached (or on a Single Frame), so the caller can
+    return the message without waiting for the prompt.
+
+    Anything unexpected (a non-hex line such as NO DATA, frames out of
+    sequence, a second sender) marks the reassembler as failed; the
+    complete response is then parsed by the protocol as before. Response
+    pending frames (7F xx 78) are counted in pending and skipped: the
+    answer follows them.
+    """
+
+    def __init__(self, protocol: CANProtocol) -> None:
+        """Initialise."""
+        self.protocol = protocol
+        self.reset()
+
+    def reset(self):
+        """Forget the current response."""
+        self.frames = []
+        self.payload = None
+        self.length = 0  # declared payload length
+        self.filled = 0  # payload bytes received so far
+        self.next_seq = 1
+        self.tx_id = None
+        self.pending = 0  # response pending frames seen
+        self.complete = False
+        self.failed = False
+
+    def feed(self, line):
+        """Consume one line of adapter output. Returns True once complete."""
+        if self.complete or self.failed:
+            return self.complete
+
+        if b" " in line:
+            line = line.replace(b" ", b"")
+        if line.translate(None, HEX_DIGITS):
+            # a message from the ELM, leave it to the full parser
+            self.failed = True
+            return False
+
+        frame = Frame(line)
+        if not self.protocol._parse_frame(frame):
+            return False  # the full parser would drop it as well
+        protocol = self.protocol
+        if self.payload is None and protocol._is_pending(frame):
+            self.pending += 1
+            return False
+        self.frames.append(frame)
+
+        if frame.type == protocol.FRAME_TYPE_SF:
+            if self.payload is not None:
+                self.failed = True
+                return False
+            self.payload = frame.data[1 : 1 + frame.data_len]
+            self.complete = True
+
+        elif frame.type == protocol.FRAME_TYPE_FF:
+            if self.payload is not None:
+                self.failed = True
+                return False
+            self.tx_id = frame.tx_id
+            self.length = frame.data_len
+            self.payload = bytearray(self.length)
+            chunk = frame.data[2 : 2 + self.length]
+            self.payload[: len(chunk)] = chunk
+            self.filled = len(chunk)
+            self.complete = self.filled >= self.length
+
+        else:  # FRAME_TYPE_CF
+            if (
+                self.payload is None
+                or frame.tx_id != self.tx_id
+                or frame.seq_index != self.next_seq & 0x0F
+            ):
+                self.failed = True
+                return False
+            frame.seq_index = self.next_seq
+            self.next_seq += 1
+            # chop off the PCI byte, and any padding past the declared length
+            chunk = frame.data[1 : 1 + self.length - self.filled]
+            self.payload[self.filled : self.filled + len(chunk)] = chunk
+            self.filled += len(chunk)
+            self.complete = self.filled >= self.length
+
+        return self.complete
+
+    def message(self):
+        """Return the reassembled Message, or None if it is not complete."""
+        if not self.complete:
+            return None
+        message = Message(self.frames)
+        message.data = self.payload
+        message.pending = self.pending
+        self.protocol._trim_dtc(message)
+        return message
+
+
+class CompactReassembler:
+    """Assemble a response formatted by the ELM itself (ATH0, ATCAF1).
+
+    With headers off and CAN auto formatting on, the ELM strips the CAN
+    ID and the PCI bytes: a Single Frame arrives as its data bytes, and a
+    multi-frame response as its payload length (3 hex digits) followed by
+    numbered lines ("0:", "1:", ...) of data. That is fewer bytes over
+    BLE and less to parse, but nothing says which ECU sent a line, so
+    anything but one clean response (a second Single Frame, a line out of
+    sequence, data after the end) makes the response ambiguous, and the
+    caller asks again in the raw ATH1/ATCAF0 format.
+
+    Like ISOTPReassembler, it is fed line by line as the response
+    arrives, and feed() returns True once the response is complete;
+    response pending lines (7F xx 78) before the answer are counted in
+    pending and skipped.
+    """
+
+    def __init__(self) -> None:
+        """Initialise."""
+        self.reset()
+
+    def reset(self):
+        """Forget the current response."""
+        self.frames = []  # one per CAN frame, as in the raw format
+        self.messages = []  # lines from the ELM, such as NO DATA
+        self.payload = None
+        self.length = None  # declared payload length, for multi-frame
+        self.next_seq = 0
+        self.pending = 0  # response pending lines seen
+        self.pending_line = None  # the last one
+        self.complete = False
+        self.failed = False
+
+    def feed(self, line):
+        """Consume one line of adapter output. Returns True once complete."""
+        if self.failed:
+            return False
+        original = line
+        if b" " in line:
+            line = line.replace(b" ", b"")
+        if not line:
+            return self.complete
+        if self.complete:
+            self.failed = True  # more than one response
+            return False
+
+        data = line
+        seq = None
+        if line[1:2] == b":" or line[2:3] == b":":
+            seq, _, data = line.partition(b":")
+        if ((seq or b"") + data).translate(None, HEX_DIGITS):
+            # a message from the ELM (NO DATA, CAN ERROR, ...)
+            if self.payload is not None:
+                self.failed = True
+            else:
+                self.messages.append(Message([Frame(original)]))
+            return False
+        if self.messages:
+            self.failed = True  # data mixed with ELM messages
+            return False
+
+        if seq is None and len(line) == 3 and self.payload is None:
+            self.length = int(line, 16)
+            self.payload = bytearray()
+            return False
+        if seq is None:
+            if self.payload is not None or len(line) % 2:
+                self.failed = True
+                return False
+            if is_pending(unhexlify(line)):
+                self.pending += 1
+                self.pending_line = original
+                return False
+            self.payload = bytearray(unhexlify(line))
+            self.frames.append(Frame(line))
+            self.complete = True
+            return True
+
+        if (
+            self.length is None
+            or len(data) % 2
+            or int(seq, 16) != self.next_seq & 0x0F
+        ):
+            self.failed = True
+            return False
+        self.next_seq += 1
+        self.payload += unhexlify(data)
+        self.frames.append(Frame(line))
+        if len(self.payload) >= self.length:
+            del self.payload[self.length :]  # the padding of the last frame
+            self.complete = True
+        return self.complete
+
+    def __call__(self, lines):
+        """Parse a whole response. Returns a list of Messages, or None if ambiguous."""
+        self.reset()
+        for line in lines:
+            self.feed(line)
+        return self.result()
+
+    def result(self):
+        """Return what was fed as a list of Messages, or None if ambiguous."""
+        if self.failed:
+            return None
+        if self.payload is None and self.pending:
+            # the ELM stopped listening before the answer arrived
+            message = Message([Frame(self.pending_line)])
+            message.data = bytearray(unhexlify(self.pending_line.replace(b" ", b"")))
+            message.pending = self.pending
+            message.incomplete = True
+            return [message]
+        if self.payload is None:
+            return self.messages  # nothing but messages from the ELM
+        if not self.frames:
+            return None
+        message = Message(self.frames)
+        message.data = self.payload
+        message.pending = self.pending
+        # fewer frames than announced, e.g. the frame count hint was too low
+        message.incomplete = not self.complete
+        return [message]
 
 
 ##############################################
@@ -0,0 +1,159 @@
+"""Replay recorded ELM327 transcripts (see transcript.py) to the stack.
+
+ReplaySerial can be handed to ELM327/OBD (port=...) in place of the BLE
+serial port, and replay_transport() builds one per recorded session for
+the API client (transport=...). Each write from the stack is matched to
+the next identical write in the transcript, and the notifications that
+followed it are delivered with their recorded timing multiplied by
+time_scale (1.0 for the original timing, 0.0 for as fast as possible).
+
+A write that doesn't match (e.g. after a change to the query order) is
+answered with what followed the first identical write anywhere in the
+session, without moving the replay position; a write that was never
+recorded gets "?", as the ELM gives for commands it doesn't know.
+
+Whether the stack interrupts the adapter (a write without a carriage
+return, see ELM327.__finish_response) depends on timing. An interrupt
+that isn't in the transcript just completes the answer being replayed.
+"""
+
+import asyncio
+from collections import deque
+import logging
+
+from .bleserial import bleserial
+from .transcript import READ, WRITE, load_transcript
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_RESPONSE = b"?\r\r>"
+
+
+class _ReplayClient:
+    """Stands in for the BleakClient of a connected port."""
+
+    def __init__(self) -> None:
+        self.is_connected = True
+
+
+class ReplaySerial(bleserial):
+    """A bleserial that answers with a recorded session."""
+
+    def __init__(self, events, time_scale=0.0, timeout=2.0) -> None:
+        """Initialise with one session's events (time, direction, data)."""
+        super().__init__("replay", None, None, None)
+        self.events = list(events)
+        self.time_scale = time_scale
+        self.timeout = timeout
+        self._position = 0  # index of the next event to match
+        self._task: asyncio.Task | None = None
+        self._answer: deque[tuple[float, bytes]] = deque()  # still to deliver
+        self.stats = {
+            "writes": 0,
+            "matched": 0,
+            "out_of_order": 0,
+            "unknown": 0,
+            "interrupts": 0,
+        }
+
+    async def open(self):
+        """Open the port."""
+        self.client = _ReplayClient()
+
+    async def close(self):
+        """Close the port."""
+        if self._task is not None:
+            self._task.cancel()
+        if self.client is not None:
+            self.client.is_connected = False
+
+    def _find_write(self, data, start):
+        for i in range(start, len(self.events)):
+            _, direction, recorded = self.events[i]
+            if direction == WRITE and recorded == data:
+                return i
+        return None
+
+    async def write(self, data):
+        """Answer a write with the notifications recorded after it."""
+        if isinstance(data, str):
+            data = data.encode()
+        self.stats["writes"] += 1
+
+        index = self._find_write(data, self._position)
+        if index is None and b"\r" not in data:
+            # an unrecorded interrupt: let the current answer finish now
+            self.stats["interrupts"] += 1
+            self._stop_delivery()
+            while self._answer:
+                self._notification_handler(None, self._answer.popleft()[1])
+            return
+        # the stack moved on before the previous answer was complete
+        self._stop_delivery()
+        self._answer.clear()
+
+        if index is not None:
+            self.stats["matched"] += 1
+            self._position = index + 1
+        else:
+            index = self._find_write(data, 0)
+            if index is None:
+                logger.debug("No recorded answer for %s", data)
+                self.stats["unknown"] += 1
+                self._start_delivery([(0.0, UNKNOWN_RESPONSE)])
+                return
+            logger.debug("Replaying %s out of order", data)
+            self.stats["out_of_order"] += 1
+
+        written_at = self.events[index][0]
+        answer = []
+        for elapsed, direction, recorded in self.events[index + 1 :]:
+            if direction != READ:
+                break
+            answer.append((elapsed - written_at, recorded))
+        self._start_delivery(answer)
+
+    def _stop_delivery(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    def _start_delivery(self, answer):
+        self._answer.extend(answer)
+        self._task = asyncio.get_running_loop().create_task(self._deliver())
+
+    async def _deliver(self):
+        delivered = 0.0
+        while self._answer:
+            delay = self._answer[0][0]
+            await asyncio.sleep(max(delay - delivered, 0.0) * self.time_scale)
+            delivered = max(delay, delivered)
+            if self._answer:
+                self._notification_handler(None, self._answer.popleft()[1])
+
+
+def replay_transport(path, time_scale=0.0, timeout=2.0):
+    """Return a transport factory serving a transcript's sessions in turn.
+
+    Once every recorded session has been used, further sessions fail to
+    connect, as if the adapter was out of range.
+    """
+    sessions = iter(load_transcript(path))
+
+    def transport():
+        events = next(sessions, None)
+        if events is None:
+            return _ExhaustedSerial()
+        return ReplaySerial(events, time_scale, timeout)
+
+    return transport
+
+
+class _ExhaustedSerial(ReplaySerial):
+    """Port for a session beyond the end of the transcript."""
+
+    def __init__(self) -> None:
+        super().__init__([])
+
+    async def open(self):
+        raise ConnectionError("No more recorded sessions")
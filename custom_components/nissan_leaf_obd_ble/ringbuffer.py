@@ -0,0 +1,170 @@
+"""Fixed-capacity byte ring buffer for the BLE receive path."""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """Byte ring buffer with O(1) consume and incremental delimiter search.
+
+    Bytes are written into a preallocated bytearray, so neither appending a
+    notification nor consuming a line moves the remaining data. Delimiter
+    searches remember how far they have already scanned, so repeatedly
+    asking "is there a newline yet?" after every 20-byte notification only
+    looks at the new bytes.
+
+    Positions are tracked as absolute stream offsets (head/tail) and only
+    mapped into the array modulo the capacity when touching memory. The
+    common cases (no wrap-around) are handled inline; the wrap-around paths
+    are kept out of line.
+    """
+
+    def __init__(self, capacity=4096) -> None:
+        """Initialise."""
+        self._capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._head = 0  # stream offset of the first unread byte
+        self._tail = 0  # stream offset one past the last written byte
+        self._scanned = {}  # delimiter -> stream offset where the next search starts
+
+    def __len__(self):
+        """Return the number of unread bytes."""
+        return self._tail - self._head
+
+    def __bool__(self):
+        """Return True if there are unread bytes."""
+        return self._tail != self._head
+
+    @property
+    def capacity(self):
+        """Return the current capacity in bytes."""
+        return self._capacity
+
+    def clear(self):
+        """Discard all unread bytes."""
+        self._head = self._tail = 0
+        self._scanned.clear()
+
+    def extend(self, data):
+        """Append bytes to the buffer, growing it if it would overflow."""
+        n = len(data)
+        tail = self._tail
+        if tail - self._head + n > self._capacity:
+            self._grow(tail - self._head + n)
+            tail = self._tail
+        start = tail % self._capacity
+        end = start + n
+        if end <= self._capacity:
+            self._view[start:end] = data
+        else:
+            self._write_wrapped(start, data)
+        self._tail = tail + n
+
+    def consume(self, size):
+        """Drop size bytes from the front of the buffer in O(1)."""
+        head = self._head + size
+        if head >= self._tail:
+            # empty: rewind so the next write starts at offset 0
+            self._head = self._tail = 0
+            self._scanned.clear()
+        else:
+            self._head = head
+
+    def peek(self, size=None):
+        """Return up to size bytes from the front without consuming them."""
+        available = self._tail - self._head
+        if size is None or size > available:
+            size = available
+        start = self._head % self._capacity
+        end = start + size
+        if end <= self._capacity:
+            return self._view[start:end].tobytes()
+        return self._view[start:].tobytes() + self._view[: end - self._capacity].tobytes()
+
+    def read(self, size=None):
+        """Return and consume up to size bytes from the front of the buffer."""
+        data = self.peek(size)
+        self.consume(len(data))
+        return data
+
+    def find(self, delimiter):
+        """Return the offset (from the front) of delimiter, or -1.
+
+        Bytes already searched for this delimiter are not searched again.
+        """
+        head = self._head
+        tail = self._tail
+        pos = self._scanned.get(delimiter, head)
+        if pos < head:
+            pos = head
+        start = pos % self._capacity
+        end = start + (tail - pos)
+        if end <= self._capacity:
+            i = self._buf.find(delimiter, start, end)
+            found = -1 if i < 0 else pos + (i - start)
+        else:
+            found = self._find_wrapped(pos, delimiter)
+        if found < 0:
+            # next time, only look at bytes that could begin a new match
+            pos = tail - len(delimiter) + 1
+            self._scanned[delimiter] = pos if pos > head else head
+            return -1
+        self._scanned[delimiter] = found
+        return found - head
+
+    def index(self, delimiter):
+        """Like find(), but raise ValueError if the delimiter is missing."""
+        offset = self.find(delimiter)
+        if offset < 0:
+            raise ValueError("delimiter not found")
+        return offset
+
+    def __contains__(self, delimiter):
+        """Return True if the delimiter is in the unread bytes."""
+        return self.find(delimiter) >= 0
+
+    def _write_wrapped(self, start, data):
+        """Copy data in two pieces, wrapping at the end of the array."""
+        src = memoryview(data)
+        first = self._capacity - start
+        self._view[start:] = src[:first]
+        self._view[: len(src) - first] = src[first:]
+
+    def _find_wrapped(self, pos, delimiter):
+        """Search the stream range [pos, tail) that wraps the end of the array."""
+        start = pos % self._capacity
+        i = self._buf.find(delimiter, start)
+        if i >= 0:
+            return pos + (i - start)
+        wrap = pos + (self._capacity - start)  # stream offset stored at index 0
+        if len(delimiter) > 1:
+            # a multi-byte delimiter may straddle the wrap point
+            window_start = max(wrap - len(delimiter) + 1, self._head)
+            window_end = min(wrap + len(delimiter) - 1, self._tail)
+            window = self._view[window_start % self._capacity :].tobytes()
+            window += self._view[: window_end - wrap].tobytes()
+            i = window.find(delimiter)
+            if i >= 0:
+                return window_start + i
+        i = self._buf.find(delimiter, 0, self._tail - wrap)
+        if i >= 0:
+            return wrap + i
+        return -1
+
+    def _grow(self, needed):
+        """Reallocate to at least needed bytes, keeping unread data in order."""
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        logger.debug("Growing receive buffer from %d to %d bytes", self._capacity, capacity)
+        data = self.peek()
+        offset = self._head
+        self._capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._view[: len(data)] = data
+        self._head = 0
+        self._tail = len(data)
+        self._scanned = {k: max(v - offset, 0) for k, v in self._scanned.items()}
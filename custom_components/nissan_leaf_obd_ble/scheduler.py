@@ -0,0 +1,115 @@
+"""Order the commands of a polling cycle to keep ECU switches to a minimum."""
+
+import logging
+
+from .OBDCommand import OBDCommand
+
+logger = logging.getLogger(__name__)
+
+
+class QueryScheduler:
+    """Plan the order in which a cycle's commands are sent.
+
+    Every change of header costs AT round trips (see OBD.__set_header), so
+    commands are grouped by header and each group is sent in one run. The
+    group for the header that is already active goes first, so a cycle
+    that follows on from the previous one does not pay for a switch. The
+    remaining groups are ordered by their expected latency, measured from
+    previous cycles, so that quick ECUs are not held up by slow ones.
+
+    An optional probe command is always sent first: it tells whether the
+    car is awake at all, and the rest of the cycle is skipped if it gets
+    no answer.
+
+    Commands with a refresh interval are only due once that long has
+    passed since they last returned a value (see due() and polled()).
+    """
+
+    # weight of the newest sample in the per-header latency average
+    LATENCY_SMOOTHING = 0.3
+    # a command is due this much before its interval is up, so that timing
+    # jitter doesn't push it back by a whole polling cycle
+    DUE_TOLERANCE = 1.0
+
+    def __init__(self, probe: OBDCommand | None = None) -> None:
+        """Initialise."""
+        self.probe = probe
+        self._latency: dict[bytes, float] = {}  # header -> seconds per query
+        self._polled: dict[str, float] = {}  # command name -> time of last value
+
+    def expected_latency(self, header) -> float | None:
+        """Return the smoothed seconds per query for a header, if known."""
+        return self._latency.get(header)
+
+    def record(self, cmd: OBDCommand, seconds: float) -> None:
+        """Feed back how long a query took."""
+        previous = self._latency.get(cmd.header)
+        if previous is None:
+            self._latency[cmd.header] = seconds
+        else:
+            a = self.LATENCY_SMOOTHING
+            self._latency[cmd.header] = a * seconds + (1 - a) * previous
+
+    def due(self, commands, now) -> list[OBDCommand]:
+        """Return the commands whose refresh interval has elapsed at time now."""
+        due = []
+        for cmd in commands:
+            last = self._polled.get(cmd.name)
+            if (
+                cmd.interval is None
+                or last is None
+                or now - last + self.DUE_TOLERANCE >= cmd.interval
+            ):
+                due.append(cmd)
+        return due
+
+    def polled(self, cmd: OBDCommand, now) -> None:
+        """Record that cmd returned a value at time now."""
+        self._polled[cmd.name] = now
+
+    def reset_due(self) -> None:
+        """Make every command due again, e.g. after the car was off."""
+        self._polled.clear()
+
+    def plan(self, commands, active_header=None) -> list[OBDCommand]:
+        """Return the commands in the order they should be sent.
+
+        active_header is the header the adapter is currently set to, if
+        any. Within a header, commands keep the order they were given in.
+        """
+        plan = []
+        groups: dict[bytes, list[OBDCommand]] = {}
+        for cmd in commands:
+            if cmd == self.probe:
+                plan.append(cmd)
+            else:
+                groups.setdefault(cmd.header, []).append(cmd)
+
+        if plan:
+            active_header = self.probe.header
+
+        def cost(item):
+            position, header = item
+            latency = self._latency.get(header)
+            # the active header costs nothing to switch to; unmeasured
+            # headers keep their relative order after the measured ones
+            return (
+                header != active_header,
+                latency is None,
+                latency or 0.0,
+                position,
+            )
+
+        for _, header in sorted(enumerate(groups), key=cost):
+            plan.extend(groups[header])
+        return plan
+
+    @staticmethod
+    def header_switches(commands, active_header=None) -> int:
+        """Return how many times the header changes when sending commands in order."""
+        switches = 0
+        for cmd in commands:
+            if cmd.header != active_header:
+                switches += 1
+                active_header = cmd.header
+        return switches
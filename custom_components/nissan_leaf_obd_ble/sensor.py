@@ -7,6 +7,7 @@ from homeassistant.components.sensor import (
     SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory
 from homeassistant.core import HomeAssistant
 
 from .const import DOMAIN, NAME
@@ -232,6 +233,23 @@ SENSOR_TYPES: dict[str, SensorEntityDescription] = {
         device_class=SensorDeviceClass.CURRENT,
         state_class=SensorStateClass.MEASUREMENT,
     ),
+    "hv_battery_current": SensorEntityDescription(
+        key="hv_battery_current",
+        name="HV battery current",
+        native_unit_of_measurement="A",
+        suggested_display_precision=1,
+        device_class=SensorDeviceClass.CURRENT,
+        state_class=SensorStateClass.MEASUREMENT,
+        # only reported by monitoring broadcasts (see monitor.py)
+        entity_registry_enabled_default=False,
+    ),
+    "hv_battery_gids": SensorEntityDescription(
+        key="hv_battery_gids",
+        icon="mdi:battery-high",
+        name="HV battery GIDs",
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_registry_enabled_default=False,
+    ),
     "hv_battery_voltage": SensorEntityDescription(
         key="hv_battery_voltage",
         # icon="mdi:ev-station",
@@ -243,6 +261,44 @@ SENSOR_TYPES: dict[str, SensorEntityDescription] = {
     ),
 }
 
+# timing of the integration itself, from the api's tracer (see tracing.py);
+# keyed by the traced stage, and disabled unless the user turns them on
+TIMING_SENSOR_TYPES: dict[str, SensorEntityDescription] = {
+    "cycle": SensorEntityDescription(
+        key="last_cycle_duration",
+        icon="mdi:timer-outline",
+        name="Last cycle duration",
+        native_unit_of_measurement="ms",
+        suggested_display_precision=0,
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+    ),
+    "ble_connect": SensorEntityDescription(
+        key="ble_connect_time",
+        icon="mdi:bluetooth-connect",
+        name="BLE connect time",
+        native_unit_of_measurement="ms",
+        suggested_display_precision=0,
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+    ),
+    "first_query": SensorEntityDescription(
+        key="connect_to_first_query_time",
+        icon="mdi:timer-play-outline",
+        name="Connect to first query time",
+        native_unit_of_measurement="ms",
+        suggested_display_precision=0,
+        device_class=SensorDeviceClass.DURATION,
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+    ),
+}
+
 
 async def async_setup_entry(
     hass: HomeAssistant, entry: ConfigEntry, async_add_entities
@@ -253,6 +309,10 @@ async def async_setup_entry(
         NissanLeafObdBleSensor(coordinator, entry, sensor_desc)
         for sensor_desc in SENSOR_TYPES
     ]
+    entities += [
+        NissanLeafObdBleTimingSensor(coordinator, entry, stage)
+        for stage in TIMING_SENSOR_TYPES
+    ]
     async_add_entities(entities)
 
     # async_add_devices([NissanLeafObdBleSensor(coordinator, entry)])
@@ -276,6 +336,9 @@ class NissanLeafObdBleSensor(NissanLeafObdBleEntity, SensorEntity):
         self._attr_native_unit_of_measurement = SENSOR_TYPES[
             sensor
         ].native_unit_of_measurement
+        self._attr_entity_registry_enabled_default = SENSOR_TYPES[
+            sensor
+        ].entity_registry_enabled_default
 
     @property
     def native_value(self):
@@ -289,3 +352,25 @@ class NissanLeafObdBleSensor(NissanLeafObdBleEntity, SensorEntity):
     def icon(self):
         """Return the icon of the sensor."""
         return SENSOR_TYPES[self._sensor].icon
+
+
+class NissanLeafObdBleTimingSensor(NissanLeafObdBleEntity, SensorEntity):
+    """Diagnostic sensor for how long a stage of polling last took."""
+
+    def __init__(
+        self,
+        coordinator,
+        config_entry,
+        stage: str,
+    ) -> None:
+        """Initialize the sensor."""
+        super().__init__(coordinator, config_entry)
+        self._stage = stage
+        self.entity_description = TIMING_SENSOR_TYPES[stage]
+        self._attr_name = f"{NAME} {self.entity_description.name}"
+
+    @property
+    def native_value(self):
+        """Return the last duration of the stage, in milliseconds."""
+        seconds = self.coordinator.api.tracer.last("stage", self._stage)
+        return None if seconds is None else seconds * 1000
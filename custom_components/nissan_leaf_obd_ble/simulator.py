@@ -0,0 +1,556 @@
+"""In-process ELM327 and Nissan Leaf simulator, for running without a dongle.
+
+ELMSimulator can be handed to ELM327/OBD (port=...) or to the API client
+(transport=...) in place of the BLE serial port. It models the parts of an
+ELM327 that this integration relies on, and the Leaf ECUs answering the
+commands in commands.py:
+
+- AT commands: echo, headers, spaces, linefeeds, CAN auto formatting,
+  protocol, headers and flow control settings, response timeout, voltage
+- requests sent as raw CAN frames (CAF0) or as data bytes (CAF1), with an
+  optional trailing digit for the number of frames to wait for
+- ISO-TP responses split into frames, which with CAF0 are only sent past
+  the First Frame once flow control has been set up (FC SH/SD/SM 1)
+- the response timeout (ATST) the ELM waits out after the last frame,
+  and gives up after when a frame is slower than that to arrive
+- ECUs that answer "response pending" (7F xx 78) before the answer,
+  which the ELM counts as frames like any other
+- interrupting a busy ELM with any character ("STOPPED")
+- monitoring the bus (ATMA) for the broadcast frames of a parked Leaf,
+  through the receive filters (ATCRA, ATCF/ATCM), which also apply to
+  responses to requests
+- optionally (bus_traffic), the broadcast frames the ELM passes on with
+  CAN auto formatting off while it waits for an answer, unless a receive
+  filter keeps them out
+
+Output is delivered as notifications of chunk_size bytes through the
+same notification handler as bleserial, optionally after a delay per
+command and per CAN frame, and with notifications dropped or garbled at
+random. All delays are multiplied by time_scale.
+"""
+
+import asyncio
+import logging
+import random
+
+from .bleserial import bleserial
+
+logger = logging.getLogger(__name__)
+
+ELM_VERSION = b"ELM327 v1.5"
+ELM_PROMPT = b">"
+DEFAULT_TIMEOUT = 0x32  # ATST units of 4.096 ms
+
+# bus time, for the broadcast frames overheard while waiting for an answer
+ECU_RESPONSE_TIME = 0.005  # seconds from a request to the first frame
+FRAME_TIME = 0.001  # seconds between the frames of a response
+
+
+class SimulatedECU:
+    """An ECU answering UDS/KWP requests from tables of data identifiers.
+
+    dids maps 2-byte DIDs (service 0x22) and local_ids maps 1-byte local
+    identifiers (service 0x21) to their payloads.
+    """
+
+    def __init__(
+        self,
+        request_id,
+        response_id,
+        dids=None,
+        local_ids=None,
+        multi_did=True,
+    ) -> None:
+        """Initialise."""
+        self.request_id = request_id
+        self.response_id = response_id
+        self.dids = dict(dids or {})
+        self.local_ids = dict(local_ids or {})
+        self.multi_did = multi_did  # accepts several DIDs in one 0x22 request
+        # DIDs it ignores instead of rejecting, as some ECUs do
+        self.silent: set[bytes] = set()
+        self.awake = True
+        # "response pending" (7F xx 78) replies before each answer, and the
+        # seconds between them
+        self.pending = 0
+        self.pending_time = 0.05
+
+    def handle(self, request: bytes):
+        """Return the response payload for a request, or None for silence."""
+        if not self.awake or not request:
+            return None
+        service = request[0]
+        if service == 0x10 and len(request) == 2:
+            # DiagnosticSessionControl
+            return bytes([0x50, request[1]])
+        if service == 0x21 and len(request) == 2:
+            payload = self.local_ids.get(request[1])
+            if payload is None:
+                return bytes([0x7F, 0x21, 0x31])
+            return bytes([0x61, request[1]]) + payload
+        if service == 0x22 and len(request) >= 3 and len(request) % 2 == 1:
+            dids = [request[i : i + 2] for i in range(1, len(request), 2)]
+            if self.silent.intersection(dids):
+                return None
+            if len(dids) > 1 and not self.multi_did:
+                return bytes([0x7F, 0x22, 0x13])
+            response = bytearray([0x62])
+            for did in dids:
+                payload = self.dids.get(did)
+                if payload is None:
+                    return bytes([0x7F, 0x22, 0x31])
+                response += did + payload
+            return bytes(response)
+        return bytes([0x7F, service, 0x11])
+
+
+def lbc_payload(length=0x35):
+    """Return an lbc (21 01) response payload of the given total length.
+
+    The default is the AZE0 layout decoded by decoders.lbc; shorter or
+    longer lengths (ZE0, ZE1) are zero padded or truncated.
+    """
+    d = bytearray(max(length, 40))
+    d[0:2] = b"\x61\x01"
+    d[20:22] = (36000).to_bytes(2, "big")  # 360.00 V
+    d[30:32] = (9216).to_bytes(2, "big")  # 90 % health
+    d[33:36] = (800000).to_bytes(3, "big")  # 80 % state of charge
+    d[37:40] = (560000).to_bytes(3, "big")  # 56 Ah
+    return bytes(d[2:length])
+
+
+def leaf_ecus(lbc_length=0x35, multi_did=True):
+    """Return the VCM (797), meter (743) and LBC (79B) of a parked Leaf."""
+    vcm = SimulatedECU(
+        0x797,
+        0x79A,
+        {
+            b"\x13\x04": b"\x80\x00",  # power switch on
+            b"\x11\x56": b"\x01",  # park
+            b"\x11\x03": b"\x9d",  # 12.56 V
+            b"\x11\x83": b"\x02\x00",  # 2 A
+            b"\x12\x03": b"\x00\x2a",  # quick charges
+            b"\x12\x05": b"\x01\x2c",  # L1/L2 charges
+            b"\x11\x5d": b"\x64",  # 10 C
+            b"\x12\x61": b"\x00",
+            b"\x12\x62": b"\x00",
+            b"\x11\x52": b"\x03",  # 300 W
+            b"\x11\x51": b"\x00",
+            b"\x12\x34": b"\x00",  # not plugged
+            b"\x11\x4e": b"\x00",  # not charging
+            b"\x12\x55": b"\x00\x00",
+            b"\x12\x36": b"\x00\x00",
+            b"\x11\x46": b"\x00\x00",
+            b"\x12\x1a": b"\x00\x00",
+            b"\x11\x06": b"\x00\x00",
+            b"\x11\x0f": b"\x00",
+            b"\x13\x18": b"\x00\x00",
+            b"\x13\x1a": b"\x00\x00",
+        },
+        multi_did=multi_did,
+    )
+    meter = SimulatedECU(
+        0x743,
+        0x763,
+        {
+            b"\x0e\x01": (12345).to_bytes(3, "big"),  # odometer, km
+            b"\x0e\x25": b"\x8b",  # ~240 kPa
+            b"\x0e\x26": b"\x8b",
+            b"\x0e\x27": b"\x8b",
+            b"\x0e\x28": b"\x8b",
+            b"\x0e\x24": (1350).to_bytes(2, "big") + bytes(8),  # 135.0 km
+        },
+        multi_did=multi_did,
+    )
+    lbc = SimulatedECU(0x79B, 0x7BB, local_ids={0x01: lbc_payload(lbc_length)})
+    return {ecu.request_id: ecu for ecu in (vcm, meter, lbc)}
+
+
+def leaf_broadcasts():
+    """Return {CAN ID: (period in seconds, data)} broadcast by a parked Leaf."""
+    return {
+        0x1DB: (0.01, bytes.fromhex("0280B40000000000")),  # 10 A, 360 V
+        0x55B: (0.1, bytes.fromhex("C800000000000000")),  # 80.0 %
+        0x5BC: (0.1, bytes.fromhex("3200000000000000")),  # 200 GIDs
+        0x284: (0.02, bytes(8)),  # stationary
+    }
+
+
+def isotp_frames(payload, padding=b"\xff"):
+    """Split a payload into ISO-TP single, first and consecutive frames."""
+    if len(payload) <= 7:
+        return [bytes([len(payload)]) + payload]
+    frames = [bytes([0x10 | (len(payload) >> 8), len(payload) & 0xFF]) + payload[:6]]
+    for seq, i in enumerate(range(6, len(payload), 7), start=1):
+        chunk = payload[i : i + 7]
+        frames.append(bytes([0x20 | (seq & 0x0F)]) + chunk.ljust(7, padding))
+    return frames
+
+
+class _SimulatedClient:
+    """Stands in for the BleakClient of a connected port."""
+
+    def __init__(self) -> None:
+        self.is_connected = True
+
+
+class ELMSimulator(bleserial):
+    """A bleserial whose far end is a simulated ELM327 on a simulated Leaf."""
+
+    def __init__(
+        self,
+        ecus=None,
+        broadcasts=None,
+        chunk_size=20,
+        command_latency=0.0,
+        frame_latency=0.0,
+        drop_rate=0.0,
+        garble_rate=0.0,
+        time_scale=1.0,
+        seed=None,
+        timeout=2.0,
+        bus_traffic=False,
+    ) -> None:
+        """Initialise."""
+        super().__init__("simulator", None, None, None)
+        self.ecus = ecus if ecus is not None else leaf_ecus()
+        self.broadcasts = broadcasts if broadcasts is not None else leaf_broadcasts()
+        self.chunk_size = chunk_size
+        self.command_latency = command_latency  # seconds before a reply starts
+        self.frame_latency = frame_latency  # seconds per CAN frame
+        self.drop_rate = drop_rate  # probability a notification is lost
+        self.garble_rate = garble_rate  # probability a notification is corrupted
+        self.time_scale = time_scale
+        self.timeout = timeout
+        self.bus_traffic = bus_traffic  # broadcasts interleave with answers
+        self.voltage = 12.6
+        self._random = random.Random(seed)
+        self._line = bytearray()  # command being typed
+        self._last_command = b""
+        self._task: asyncio.Task | None = None
+        self._low_power = False
+        self._bus_time = 0.0  # seconds of bus time spent waiting for answers
+        self._bus_due = dict.fromkeys(self.broadcasts, 0.0)
+        # counters, from the host's point of view
+        self.stats = {
+            "commands": 0,
+            "bytes_written": 0,
+            "bytes_received": 0,
+            "notifications": 0,
+            "can_frames": 0,
+        }
+        self._reset()
+
+    # ------------------------------ transport ------------------------------
+
+    async def open(self):
+        """Open the port."""
+        self.client = _SimulatedClient()
+
+    async def close(self):
+        """Close the port."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.client is not None:
+            self.client.is_connected = False
+
+    async def write(self, data):
+        """Write bytes to the simulated ELM."""
+        if isinstance(data, str):
+            data = data.encode()
+        self.stats["bytes_written"] += len(data)
+        for byte in data:
+            self._receive(bytes([byte]))
+
+    def _receive(self, char):
+        if self._low_power:
+            # any character wakes the ELM up, and is otherwise ignored
+            self._low_power = False
+            self._last_command = b""
+            return
+        if self._task is not None and not self._task.done():
+            # any character interrupts a command in progress
+            self._task.cancel()
+            self._task = None
+            self._notify(b"STOPPED" + self._eol() + self._eol() + ELM_PROMPT)
+            return
+        if char == b"\r":
+            line = bytes(self._line)
+            self._line.clear()
+            self._task = asyncio.get_running_loop().create_task(self._process(line))
+        else:
+            self._line += char
+
+    def _notify(self, data):
+        """Deliver output to the host in notification sized chunks."""
+        for i in range(0, len(data), self.chunk_size):
+            chunk = data[i : i + self.chunk_size]
+            if self.drop_rate and self._random.random() < self.drop_rate:
+                logger.debug("Dropping notification: %s", chunk)
+                continue
+            if self.garble_rate and self._random.random() < self.garble_rate:
+                n = self._random.randrange(len(chunk))
+                chunk = chunk[:n] + bytes([self._random.randrange(0x20, 0x7F)]) + chunk[n + 1 :]
+            self.stats["notifications"] += 1
+            self.stats["bytes_received"] += len(chunk)
+            self._notification_handler(None, chunk)
+
+    async def _sleep(self, seconds):
+        if seconds > 0:
+            await asyncio.sleep(seconds * self.time_scale)
+
+    # ------------------------------ ELM327 ---------------------------------
+
+    def _reset(self):
+        """Power-on defaults."""
+        self.echo = True
+        self.headers = False
+        self.spaces = True
+        self.linefeeds = False
+        self.caf = True
+        self.protocol = b"0"
+        self.header = None  # request CAN ID
+        self.fc_header = None
+        self.fc_data = None
+        self.fc_mode = 0
+        self.response_timeout = DEFAULT_TIMEOUT
+        self.receive_filter = None  # (filter, mask) from ATCRA or ATCF/ATCM
+
+    def _eol(self):
+        return b"\r\n" if self.linefeeds else b"\r"
+
+    async def _process(self, line):
+        self.stats["commands"] += 1
+        out = bytearray()
+        if self.echo:
+            out += line + self._eol()
+        command = line.replace(b" ", b"").upper()
+        if not command:
+            command = self._last_command  # repeat the last command
+        self._last_command = command
+        await self._sleep(self.command_latency)
+
+        if not command:
+            pass
+        elif command == b"ATMA":
+            self._notify(bytes(out))
+            await self._monitor()  # until interrupted
+        elif command.startswith(b"AT"):
+            for reply in self._at(command[2:]):
+                out += reply + self._eol()
+        else:
+            self._notify(bytes(out))
+            out.clear()
+            for reply in await self._request(command):
+                out += reply + self._eol()
+        self._notify(bytes(out) + self._eol() + ELM_PROMPT)
+
+    def _at(self, cmd):  # noqa: C901
+        """Apply an AT command, returning the reply lines."""
+        flags = {b"E": "echo", b"H": "headers", b"S": "spaces", b"L": "linefeeds", b"CAF": "caf"}
+        for name, attr in flags.items():
+            if cmd in (name + b"0", name + b"1"):
+                setattr(self, attr, cmd.endswith(b"1"))
+                return [b"OK"]
+        if cmd in (b"Z", b"WS"):
+            self._reset()
+            return [b"", ELM_VERSION]
+        if cmd == b"D":
+            self._reset()
+            return [b"OK"]
+        if cmd == b"I":
+            return [ELM_VERSION]
+        if cmd == b"@1":
+            return [b"OBDII to RS232 Interpreter"]
+        if cmd == b"RV":
+            return [b"%.1fV" % self.voltage]
+        if cmd == b"DPN":
+            return [self.protocol if self.protocol != b"0" else b"A0"]
+        if cmd == b"LP":
+            self._low_power = True
+            return [b"OK"]
+        if cmd.startswith(b"SP") and len(cmd) in (3, 4):
+            self.protocol = cmd[-1:]
+            return [b"OK"]
+        if cmd in (b"AT0", b"AT1", b"AT2"):
+            return [b"OK"]
+        try:
+            if cmd.startswith(b"SH") and len(cmd) in (5, 8, 10):
+                self.header = int(cmd[2:], 16)
+                return [b"OK"]
+            if cmd.startswith(b"FCSH") and len(cmd) in (7, 10, 12):
+                self.fc_header = int(cmd[4:], 16)
+                return [b"OK"]
+            if cmd.startswith(b"FCSD") and 6 <= len(cmd) <= 14 and len(cmd) % 2 == 0:
+                self.fc_data = bytes.fromhex(cmd[4:].decode())
+                return [b"OK"]
+            if cmd.startswith(b"FCSM") and len(cmd) == 5:
+                self.fc_mode = int(cmd[4:], 16)
+                return [b"OK"]
+            if cmd.startswith(b"ST") and len(cmd) == 4:
+                value = int(cmd[2:], 16)
+                self.response_timeout = value if value else DEFAULT_TIMEOUT
+                return [b"OK"]
+            if cmd == b"CRA":
+                self.receive_filter = None
+                return [b"OK"]
+            if cmd.startswith(b"CRA") and len(cmd) == 6:
+                digits = cmd[3:].decode()
+                mask = int("".join("0" if c == "X" else "F" for c in digits), 16)
+                self.receive_filter = (int(digits.replace("X", "0"), 16), mask)
+                return [b"OK"]
+            if cmd.startswith(b"CF") and len(cmd) == 5:
+                mask = self.receive_filter[1] if self.receive_filter else 0x7FF
+                self.receive_filter = (int(cmd[2:], 16), mask)
+                return [b"OK"]
+            if cmd.startswith(b"CM") and len(cmd) == 5:
+                value = self.receive_filter[0] if self.receive_filter else 0
+                self.receive_filter = (value, int(cmd[2:], 16))
+                return [b"OK"]
+        except ValueError:
+            pass
+        return [b"?"]
+
+    async def _request(self, command):
+        """Send a request on the bus and return the reply lines."""
+        try:
+            data = bytes.fromhex(command[: len(command) & ~1].decode())
+        except ValueError:
+            return [b"?"]
+        # a single extra digit is the number of frames to wait for
+        max_frames = int(command[-1:], 16) if len(command) & 1 else None
+
+        if self.caf:
+            if not 0 < len(data) <= 7:
+                return [b"?"]
+            request = data
+        else:
+            if not 0 < len(data) <= 8 or data[0] >> 4 != 0:
+                return [b"?"]  # only single frame requests
+            request = data[1 : 1 + (data[0] & 0x0F)]
+
+        ecu = self.ecus.get(self.header)
+        response = ecu.handle(request) if ecu is not None else None
+        if ecu is not None and not self._passes(ecu.response_id):
+            response = None  # the adapter filters the answer out
+        if response is None or self.frame_latency > self.response_timeout * 0.004096:
+            await self._sleep(self.response_timeout * 0.004096)
+            return self._overheard(self.response_timeout * 0.004096) or [b"NO DATA"]
+
+        frames = isotp_frames(response)
+        flow_control = self.caf or (
+            self.fc_mode == 1 and self.fc_header == ecu.request_id and self.fc_data
+        )
+        if not flow_control:
+            frames = frames[:1]  # the ECU waits for a flow control frame
+
+        lines = []
+        timeout = self.response_timeout * 0.004096
+        for n in range(ecu.pending):
+            await self._sleep(self.frame_latency)
+            self.stats["can_frames"] += 1
+            frame = bytes([3, 0x7F, request[0], 0x78])
+            lines.append(self._format(ecu.response_id, frame, 0, False))
+            if max_frames is not None and n + 1 >= max_frames:
+                return lines
+            self._flush(lines)
+            if ecu.pending_time > timeout:
+                # the ELM stopped listening before the answer
+                await self._sleep(timeout)
+                return lines
+            await self._sleep(ecu.pending_time)
+        if max_frames is not None:
+            max_frames -= ecu.pending
+
+        if self.caf and not self.headers and len(frames) > 1:
+            lines.append(b"%03X" % len(response))
+        for n, frame in enumerate(frames):
+            if n and self.frame_latency > self.response_timeout * 0.004096:
+                break  # the ELM stopped listening before the next frame
+            if n:
+                self._flush(lines)
+            await self._sleep(self.frame_latency)
+            lines += self._overheard(FRAME_TIME if n else ECU_RESPONSE_TIME)
+            self.stats["can_frames"] += 1
+            lines.append(self._format(ecu.response_id, frame, n, len(frames) > 1))
+            if max_frames is not None and n + 1 >= max_frames:
+                return lines
+        # the ELM keeps listening for more frames until its timeout
+        self._flush(lines)
+        await self._sleep(self.response_timeout * 0.004096)
+        return lines + self._overheard(self.response_timeout * 0.004096)
+
+    def _flush(self, lines):
+        """Print the lines so far, as the ELM does while it keeps listening."""
+        if lines and self.time_scale:
+            self._notify(b"".join(line + self._eol() for line in lines))
+            lines.clear()
+
+    def _overheard(self, duration):
+        """Return the broadcast frames passed on during duration of listening."""
+        if not self.bus_traffic or self.caf:
+            return []  # with CAN formatting on, the ELM only passes answers
+        end = self._bus_time + duration
+        frames = []
+        for can_id, (period, data) in self.broadcasts.items():
+            due = self._bus_due.get(can_id, self._bus_time)
+            while due < end:
+                frames.append((due, can_id, data))
+                due += period
+            self._bus_due[can_id] = due
+        self._bus_time = end
+        lines = []
+        for _, can_id, data in sorted(frames):
+            if self._passes(can_id):
+                self.stats["can_frames"] += 1
+                lines.append(self._broadcast_line(can_id, data))
+        return lines
+
+    def _passes(self, can_id):
+        """Return whether the receive filter lets a CAN ID through."""
+        if self.receive_filter is None:
+            return True
+        value, mask = self.receive_filter
+        return can_id & mask == value & mask
+
+    async def _monitor(self):
+        """Print the broadcast frames that pass the filter (ATMA)."""
+        # paced in real time even when replies are not, to avoid a flood
+        scale = self.time_scale or 1.0
+        now = 0.0
+        due = dict.fromkeys(self.broadcasts, 0.0)
+        while True:
+            can_id = min(due, key=due.get)
+            if due[can_id] > now:
+                await asyncio.sleep((due[can_id] - now) * scale)
+                now = due[can_id]
+            period, data = self.broadcasts[can_id]
+            due[can_id] += period
+            if self._passes(can_id):
+                self.stats["can_frames"] += 1
+                self._notify(self._broadcast_line(can_id, data) + self._eol())
+
+    def _broadcast_line(self, can_id, data):
+        """Format a broadcast frame the way the ELM prints it."""
+        sep = b" " if self.spaces else b""
+        text = sep.join(b"%02X" % b for b in data)
+        if self.headers:
+            return b"%03X" % can_id + sep + text
+        return text
+
+    def _format(self, can_id, frame, n, multi_frame):
+        """Format a CAN frame the way the ELM prints it."""
+        sep = b" " if self.spaces else b""
+        if self.headers or not self.caf:
+            data = frame
+        elif multi_frame:
+            # CAF1 without headers: "0: 61 01 ..." lines without the PCI
+            data = frame[2:] if n == 0 else frame[1:]
+            return b"%X:" % (n & 0x0F) + sep + sep.join(b"%02X" % b for b in data)
+        else:
+            data = frame[1 : 1 + frame[0]]
+        text = sep.join(b"%02X" % b for b in data)
+        if self.headers:
+            return b"%03X" % can_id + sep + text
+        return text
@@ -0,0 +1,111 @@
+"""Response timeouts (ATST) adapted to how fast each ECU actually answers.
+
+After the last frame of a response, the ELM keeps listening until its
+response timeout runs out, and a request nobody answers only gets its
+"NO DATA" after the same wait. The default (ATST 32, about 205 ms) is
+meant for slow ECUs on any car; the Leaf's ECUs answer within a few tens
+of milliseconds.
+
+ResponseTimeouts collects the latency of each ECU's answers: the wait
+for the first frame (less the round trip of the BLE link, measured with
+AT commands, which the adapter answers itself) and the gaps between
+frames, which are what the ELM's timeout applies to. Once enough have
+been seen, the timeout for that ECU is a margin above their 99th
+percentile. A truncated response means the ELM gave up too early: the
+timeout for that ECU is then doubled (from the default, if it hasn't
+been learned yet), and eases back with every good response.
+"""
+
+from collections import deque
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+ST_UNIT = 0.004096  # seconds per ATST step
+DEFAULT_ST = 0x32  # the ELM's own default, about 205 ms
+
+WINDOW = 100  # latencies kept per ECU
+MIN_SAMPLES = 10  # before the timeout is adapted
+MARGIN_FACTOR = 1.5  # times the 99th percentile...
+MARGIN = 0.020  # ...plus this many seconds
+MIN_TIMEOUT = 0.040
+MAX_BACKOFF = 8.0
+BACKOFF_DECAY = 0.9  # per good response, down to no backoff
+
+
+class ResponseTimeouts:
+    """Per-ECU response latencies, and the ATST value they call for."""
+
+    def __init__(self) -> None:
+        """Initialise."""
+        self._latencies: dict[bytes, deque[float]] = {}  # header -> seconds
+        self._backoff: dict[bytes, float] = {}  # header -> timeout multiplier
+
+    def observe(self, header: bytes, latency: float) -> None:
+        """Record the longest wait for a frame in a complete response."""
+        samples = self._latencies.get(header)
+        if samples is None:
+            samples = self._latencies[header] = deque(maxlen=WINDOW)
+        samples.append(max(latency, 0.0))
+        backoff = self._backoff.get(header)
+        if backoff is not None:
+            backoff *= BACKOFF_DECAY
+            if backoff <= 1.0:
+                del self._backoff[header]
+            else:
+                self._backoff[header] = backoff
+
+    def samples(self, header: bytes) -> list[float]:
+        """Return the latencies collected for an ECU, oldest first."""
+        return list(self._latencies.get(header, ()))
+
+    def seed(self, header: bytes, samples) -> None:
+        """Start an ECU's latencies from stored ones, unless some were seen."""
+        if header not in self._latencies:
+            self._latencies[header] = deque(samples, maxlen=WINDOW)
+
+    def back_off(self, header: bytes) -> None:
+        """Lengthen an ECU's timeout after a response was cut short."""
+        backoff = min(self._backoff.get(header, 1.0) * 2, MAX_BACKOFF)
+        logger.debug("Response from %s truncated, timeout x%.1f", header, backoff)
+        self._backoff[header] = backoff
+
+    def p99(self, header: bytes) -> float | None:
+        """Return the 99th percentile latency of an ECU, once known."""
+        samples = self._latencies.get(header)
+        if samples is None or len(samples) < MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+    def timeout(self, header: bytes) -> float | None:
+        """Return the response timeout for an ECU in seconds, or None if unknown."""
+        p99 = self.p99(header)
+        if p99 is not None:
+            timeout = max(p99 * MARGIN_FACTOR + MARGIN, MIN_TIMEOUT)
+        elif header in self._backoff:
+            timeout = DEFAULT_ST * ST_UNIT  # backed off before it was learned
+        else:
+            return None
+        return timeout * self._backoff.get(header, 1.0)
+
+    def st(self, header: bytes) -> int | None:
+        """Return the ATST value for an ECU, or None to keep the default."""
+        timeout = self.timeout(header)
+        if timeout is None:
+            return None
+        return min(max(math.ceil(timeout / ST_UNIT), 1), 0xFF)
+
+    def summary(self) -> dict:
+        """Return each ECU's p99 latency and timeout, in milliseconds."""
+        summary = {}
+        for header in sorted(self._latencies):
+            p99, timeout = self.p99(header), self.timeout(header)
+            summary[header.decode()] = {
+                "samples": len(self._latencies[header]),
+                "p99": round(p99 * 1000, 1) if p99 is not None else None,
+                "timeout": round(timeout * 1000, 1) if timeout is not None else None,
+                "backoff": self._backoff.get(header, 1.0),
+            }
+        return summary
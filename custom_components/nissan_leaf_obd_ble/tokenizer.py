@@ -0,0 +1,96 @@
+"""Streaming line tokenizer for ELM327 output."""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ELMTokenizer:
+    """Split ELM327 output into lines as notifications arrive.
+
+    The tokenizer is fed raw bytes straight from the BLE notification
+    handler. Completed lines are stripped of NULs and surrounding
+    whitespace and kept as bytes, so the protocol parser can unhexlify
+    them without a bytes -> str -> bytes round trip. Seeing the ELM prompt
+    character ends the response: the pending partial line is flushed and
+    anything after the prompt is ignored until the next reset().
+
+    An optional on_line callback sees each completed line as it is
+    emitted; if it returns True the response is treated as complete
+    without waiting for the prompt (see ISOTPReassembler). With
+    keep_lines off, lines are only passed to on_line, for output that
+    doesn't end (monitoring).
+    """
+
+    ELM_PROMPT = b">"
+
+    def __init__(self) -> None:
+        """Initialise."""
+        self.lines: list[bytes] = []  # completed lines of the current response
+        self.prompt = False  # True once the prompt character was seen
+        self.received = 0  # raw bytes fed since the last reset
+        self.complete = False  # True once on_line reported a complete response
+        self.on_line = None
+        self.keep_lines = True
+        self._partial = b""
+
+    def reset(self):
+        """Forget the current response, ready for the next command."""
+        self.lines = []
+        self.prompt = False
+        self.received = 0
+        self.complete = False
+        self._partial = b""
+
+    def feed(self, data):
+        """Consume a chunk of raw adapter output."""
+        if self.prompt:
+            return
+        self.received += len(data)
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        if b"\x00" in data:
+            data = data.translate(None, b"\x00")
+        if self._partial:
+            data = self._partial + data
+        end = data.find(self.ELM_PROMPT)
+        if end >= 0:
+            data = data[:end]
+            self.prompt = True
+        if b"\n" in data:
+            data = data.replace(b"\n", b"\r")
+        parts = data.split(b"\r")
+        # the last piece is an unterminated line, unless the prompt closed it
+        self._partial = b"" if self.prompt else parts.pop()
+        for part in parts:
+            if part:
+                line = part.strip()
+                if line:
+                    self._emit(line)
+
+    def _emit(self, line):
+        if self.keep_lines:
+            self.lines.append(line)
+        if self.on_line is not None and self.on_line(line):
+            self.complete = True
+
+    def contains(self, marker):
+        """Return True if marker appears in the output received so far."""
+        return any(marker in line for line in self.lines) or marker in self._partial
+
+    def done(self, end_marker=ELM_PROMPT):
+        """Return True once the response is complete for the given end marker."""
+        if self.prompt or self.complete:
+            return True
+        if end_marker == self.ELM_PROMPT:
+            return False
+        return self.contains(end_marker)
+
+    def take_lines(self):
+        """Return the lines received so far, flushing any partial line."""
+        lines = self.lines
+        partial = self._partial.strip()
+        if partial:
+            lines.append(partial)
+        self.reset()
+        return lines
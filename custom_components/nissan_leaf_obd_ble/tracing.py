@@ -0,0 +1,100 @@
+"""Lightweight timing of the poll path, for diagnostics."""
+
+from collections import deque
+import time
+
+# samples kept per histogram: the percentiles cover recent behaviour only
+WINDOW = 100
+
+
+class RollingHistogram:
+    """Durations of the most recent WINDOW occurrences of something."""
+
+    def __init__(self, size=WINDOW) -> None:
+        """Initialise."""
+        self._samples: deque[float] = deque(maxlen=size)
+        self.count = 0  # all time, not just the window
+
+    def add(self, seconds: float) -> None:
+        """Record a duration."""
+        self._samples.append(seconds)
+        self.count += 1
+
+    @property
+    def last(self) -> float | None:
+        """Return the most recent duration, in seconds."""
+        return self._samples[-1] if self._samples else None
+
+    def summary(self) -> dict:
+        """Return count, last, p50, p95 and max, in milliseconds."""
+        samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count}
+
+        def ms(seconds):
+            return round(seconds * 1000, 2)
+
+        return {
+            "count": self.count,
+            "last": ms(self._samples[-1]),
+            "p50": ms(samples[(len(samples) - 1) // 2]),
+            "p95": ms(samples[min(len(samples) - 1, int(len(samples) * 0.95))]),
+            "max": ms(samples[-1]),
+        }
+
+
+class _Span:
+    """Times a with block into the tracer's histograms."""
+
+    __slots__ = ("_groups", "_start", "_tracer")
+
+    def __init__(self, tracer, groups) -> None:
+        self._tracer = tracer
+        self._groups = groups
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._tracer.record(time.perf_counter() - self._start, **self._groups)
+
+
+class Tracer:
+    """Collects timing spans into rolling histograms.
+
+    Each span is filed under one or more groups, given as keyword
+    arguments: e.g. span(command="speed", header="797") feeds both the
+    histogram for that command and the one for that ECU header. The
+    "stage" group holds the steps of a cycle (BLE connect, ATZ, header
+    switches, parsing, decoding, the cycle itself).
+    """
+
+    def __init__(self) -> None:
+        """Initialise."""
+        self._histograms: dict[str, dict[str, RollingHistogram]] = {}
+
+    def span(self, **groups) -> _Span:
+        """Return a context manager timing its block under the given groups."""
+        return _Span(self, groups)
+
+    def record(self, seconds: float, **groups) -> None:
+        """Record a duration under the given groups."""
+        for group, key in groups.items():
+            histograms = self._histograms.setdefault(group, {})
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = RollingHistogram()
+            histogram.add(seconds)
+
+    def last(self, group: str, key: str) -> float | None:
+        """Return the most recent duration recorded under a group, in seconds."""
+        histogram = self._histograms.get(group, {}).get(key)
+        return histogram.last if histogram is not None else None
+
+    def summary(self) -> dict:
+        """Return every histogram's summary, by group and key."""
+        return {
+            group: {key: h.summary() for key, h in sorted(histograms.items())}
+            for group, histograms in sorted(self._histograms.items())
+        }
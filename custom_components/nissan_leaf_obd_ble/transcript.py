@@ -0,0 +1,145 @@
+"""Recording of the raw traffic with the ELM327, for replay (see replay.py).
+
+A transcript is a text file, gzip compressed if its name ends in .gz,
+with one event per line:
+
+    # nissan_leaf_obd_ble transcript 1
+    S 2026-10-17T09:30:00+00:00
+    0.000 W ATZ\\r
+    1.012 R \\r\\rELM327 v1.5\\r\\r>
+
+"S" starts a session (one connection to the adapter). Other lines are
+the seconds since the session started, W for bytes written to the
+adapter or R for a notification received from it, and the bytes with
+non-printable characters backslash escaped.
+"""
+
+from datetime import UTC, datetime
+import gzip
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_HEADER = "# nissan_leaf_obd_ble transcript 1"
+WRITE = "W"
+READ = "R"
+SESSION = "S"
+
+# events kept in memory between flushes; beyond this they are dropped
+MAX_PENDING = 20000
+
+
+def _escape(data: bytes) -> str:
+    return data.decode("latin-1").encode("unicode_escape").decode("ascii")
+
+
+def _unescape(text: str) -> bytes:
+    return text.encode("ascii").decode("unicode_escape").encode("latin-1")
+
+
+def _open(path, mode):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="ascii")
+    return open(path, mode, encoding="ascii")
+
+
+class _Tap:
+    """Notification consumer that records data before passing it on."""
+
+    __slots__ = ("_consumer", "_recorder")
+
+    def __init__(self, recorder, consumer) -> None:
+        self._recorder = recorder
+        self._consumer = consumer
+
+    def feed(self, data):
+        self._recorder.read(data)
+        self._consumer.feed(data)
+
+
+class TranscriptRecorder:
+    """Collects the traffic of ELM327 sessions and appends it to a file.
+
+    ELM327 reports every write and every received notification. Events
+    are kept in memory, and flush() (which blocks, so run it in an
+    executor) appends them to the file.
+    """
+
+    def __init__(self, path, max_pending=MAX_PENDING) -> None:
+        """Initialise."""
+        self.path = path
+        self.max_pending = max_pending
+        self.dropped = 0  # events lost because flush() wasn't called in time
+        self._pending: list[str] = []
+        self._start = time.monotonic()
+
+    @property
+    def pending(self) -> bool:
+        """Return whether there are events waiting to be flushed."""
+        return bool(self._pending)
+
+    def _add(self, line):
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(line)
+
+    def start_session(self) -> None:
+        """Mark the start of a connection to the adapter."""
+        self._start = time.monotonic()
+        self._add(f"{SESSION} {datetime.now(UTC).isoformat(timespec='seconds')}")
+
+    def _event(self, direction, data):
+        elapsed = time.monotonic() - self._start
+        self._add(f"{elapsed:.3f} {direction} {_escape(bytes(data))}")
+
+    def write(self, data) -> None:
+        """Record bytes written to the adapter."""
+        self._event(WRITE, data)
+
+    def read(self, data) -> None:
+        """Record a notification received from the adapter."""
+        self._event(READ, data)
+
+    def tap(self, consumer) -> _Tap:
+        """Return a consumer recording notifications before feeding consumer."""
+        return _Tap(self, consumer)
+
+    def flush(self) -> None:
+        """Append the pending events to the file (blocking)."""
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        new = not os.path.exists(self.path)
+        with _open(self.path, "a") as f:
+            if new:
+                f.write(TRANSCRIPT_HEADER + "\n")
+            f.write("\n".join(lines) + "\n")
+        if self.dropped:
+            logger.warning("%d transcript events were dropped", self.dropped)
+            self.dropped = 0
+
+
+def load_transcript(path) -> list[list[tuple[float, str, bytes]]]:
+    """Read a transcript file, returning the events of each session."""
+    sessions: list[list[tuple[float, str, bytes]]] = []
+    with _open(path, "r") as f:
+        for number, line in enumerate(f, start=1):
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith(SESSION):
+                sessions.append([])
+                continue
+            try:
+                elapsed, direction, text = line.split(" ", 2)
+                event = (float(elapsed), direction, _unescape(text))
+            except ValueError:
+                logger.warning("Ignoring malformed transcript line %d", number)
+                continue
+            if not sessions:
+                sessions.append([])  # events before any session marker
+            sessions[-1].append(event)
+    return sessions
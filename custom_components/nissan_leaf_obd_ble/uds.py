@@ -0,0 +1,61 @@
+"""Classify UDS/KWP responses: positive, negative, or pending.
+
+An ECU that can't answer a request replies with a negative response,
+"7F <service> <NRC>", instead of the service's positive response
+(service + 0x40). Two kinds of negative response need more than
+discarding:
+
+- 0x78 (response pending): the ECU needs more time, and the real
+  answer follows. It is not the answer.
+- those saying the request can never succeed on this ECU (service or
+  identifier not supported, out of range): asking again is a wasted
+  round trip, so they are remembered (see VehicleProfile).
+
+Anything else (busy, conditions not correct, ...) may well succeed on
+a later attempt.
+"""
+
+NEGATIVE_RESPONSE = 0x7F
+POSITIVE_OFFSET = 0x40
+
+# negative response codes (ISO 14229-1)
+RESPONSE_PENDING = 0x78
+NRC_NAMES = {
+    0x10: "general reject",
+    0x11: "service not supported",
+    0x12: "sub-function not supported",
+    0x13: "incorrect message length or format",
+    0x21: "busy, repeat request",
+    0x22: "conditions not correct",
+    0x31: "request out of range",
+    0x33: "security access denied",
+    RESPONSE_PENDING: "response pending",
+    0x7E: "sub-function not supported in active session",
+    0x7F: "service not supported in active session",
+}
+# the request will never succeed on this ECU
+PERMANENT_NRCS = frozenset({0x11, 0x12, 0x31})
+
+POSITIVE = "positive"
+NEGATIVE = "negative"
+PENDING = "pending"
+
+
+def classify(data) -> tuple[str, int | None]:
+    """Return the kind of a response payload, and its NRC if negative."""
+    if len(data) >= 3 and data[0] == NEGATIVE_RESPONSE:
+        nrc = data[2]
+        return (PENDING if nrc == RESPONSE_PENDING else NEGATIVE), nrc
+    return POSITIVE, None
+
+
+def is_pending(data) -> bool:
+    """Return True for a response pending (7F xx 78) payload."""
+    return (
+        len(data) == 3 and data[0] == NEGATIVE_RESPONSE and data[2] == RESPONSE_PENDING
+    )
+
+
+def nrc_name(nrc: int) -> str:
+    """Return a readable name for a negative response code."""
+    return NRC_NAMES.get(nrc, f"NRC 0x{nrc:02X}")
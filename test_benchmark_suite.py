@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Test that the benchmark suite runs and produces comparable JSON results."""
+
+import json
+import sys
+
+import pytest
+
+from benchmarks import suite
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+
+
+def test_suite_results_are_json():
+    """A short run covers every section and every decoder, and round-trips as JSON."""
+    results = json.loads(json.dumps(suite.run(iterations=20, cycles=2)))
+    sections = results["results"]
+    assert set(sections) == {
+        "buffer",
+        "line_splitting",
+        "protocol",
+        "decoders",
+        "cycle",
+    }
+    assert set(sections["decoders"]) == set(leaf_commands)
+    full, steady = sections["cycle"]["full"], sections["cycle"]["steady"]
+    assert full["values"] == steady["values"] == 33
+    assert steady["commands"] < full["commands"]
+    print(f"  ✓ full cycle {full['wall_ms']['best']:.2f} ms on the simulator")
+
+    ratios = suite.compare(results, results)
+    assert ratios["cycle.full.cpu_ms"][2] == 1.0
+    print(f"  ✓ {len(ratios)} metrics comparable between runs")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
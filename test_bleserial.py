@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Test the event-driven receive path of bleserial (no BLE hardware needed)."""
+
+import asyncio
+import sys
+
+from bleak import BleakError
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.bleserial import bleserial
+
+
+def _port(timeout=None):
+    port = bleserial("test", None, None, None)
+    port.timeout = timeout
+    return port
+
+
+def _feed_later(port, *chunks, delay=0.001):
+    loop = asyncio.get_running_loop()
+    for n, chunk in enumerate(chunks):
+        loop.call_later(delay * (n + 1), port._notification_handler, None, chunk)
+
+
+def test_read_until_wakes_on_marker():
+    """read_until returns as soon as the marker arrives, keeping the rest buffered."""
+
+    async def run():
+        port = _port(timeout=1)
+        _feed_later(port, b"7BB1029", b"6101\r\r>")
+        data = await port.read_until(b">")
+        waiting = port.in_waiting
+        # what arrives after the reader returned stays buffered
+        port._notification_handler(None, b"extra")
+        return port, data, waiting
+
+    port, data, waiting = asyncio.run(run())
+    assert data == b"7BB10296101\r\r>"
+    assert waiting == 0
+    assert port.in_waiting == len(b"extra")
+    print("  ✓ read_until woken by notification")
+
+
+def test_read_returns_exact_size():
+    """read(size) resolves once exactly size bytes are available."""
+
+    async def run():
+        port = _port(timeout=1)
+        _feed_later(port, b"ab", b"cd", b"ef")
+        first = await port.read(3)
+        second = await port.read(3)
+        return first, second
+
+    assert asyncio.run(run()) == (b"abc", b"def")
+    print("  ✓ read woken on exact byte count")
+
+
+def test_read_honours_timeout():
+    """On timeout, read returns what has arrived so far (like pyserial)."""
+
+    async def run():
+        port = _port(timeout=0.05)
+        _feed_later(port, b"OK")
+        return await port.read(10)
+
+    assert asyncio.run(run()) == b"OK"
+    print("  ✓ read timeout honoured")
+
+
+def test_readline_timeout_raises():
+    """Readline keeps raising BleakError on timeout."""
+
+    async def run():
+        port = _port(timeout=0.02)
+        _feed_later(port, b"no newline")
+        await port.readline()
+
+    with pytest.raises(BleakError):
+        asyncio.run(run())
+    print("  ✓ readline timeout raises")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Test the per-ECU circuit breakers."""
+
+import asyncio
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.api import NissanLeafObdBleApiClient
+from custom_components.nissan_leaf_obd_ble.breaker import CircuitBreakers
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.simulator import ELMSimulator
+
+METER = [c.name for c in leaf_commands.values() if c.header == b"743"]
+
+
+def test_breaker_states():
+    """Open on silence, half-open on a later cycle, backing off when still silent."""
+    breakers = CircuitBreakers()
+    breakers.start_cycle()
+    assert breakers.allow(b"743")
+    breakers.failure(b"743")
+    assert not breakers.allow(b"743")  # rest of the cycle
+
+    breakers.start_cycle()
+    assert breakers.allow(b"743")  # trial
+    breakers.failure(b"743")
+    assert not breakers.allow(b"743")
+    breakers.start_cycle()
+    assert not breakers.allow(b"743")  # two cycles until the next trial
+    breakers.start_cycle()
+    assert breakers.allow(b"743")
+    breakers.success(b"743")
+    assert breakers.allow(b"743") and not breakers.is_open(b"743")
+    assert breakers.summary()["743"] == {"open": False, "retry_in": None, "skipped": 3}
+
+    # an ECU that answered this cycle is awake: one unanswered DID doesn't trip it
+    breakers.start_cycle()
+    breakers.success(b"797")
+    breakers.failure(b"797")
+    assert breakers.allow(b"797")
+    print("  ✓ closed -> open -> half-open -> closed")
+
+
+def test_silent_ecu_costs_one_query():
+    """With the meter asleep, only one of its queries is sent per trial."""
+    sim = ELMSimulator(time_scale=0.0)
+    client = NissanLeafObdBleApiClient("simulator", transport=lambda: sim)
+
+    async def cycle():
+        client._scheduler.reset_due()
+        before = sim.stats["commands"]
+        data = await client.async_get_data()
+        return data, sim.stats["commands"] - before
+
+    async def run():
+        full, awake = await cycle()
+        sim.ecus[0x743].awake = False
+        tripped, asleep = await cycle()
+        trial, _ = await cycle()
+        _, skipped = await cycle()
+        sim.ecus[0x743].awake = True
+        await cycle()
+        again, _ = await cycle()
+        await client.async_disconnect()
+        return full, tripped, trial, again, awake, asleep, skipped
+
+    full, tripped, trial, again, awake, asleep, skipped = asyncio.run(run())
+    # values read before the meter went quiet are carried forward, but
+    # not that of the query it left unanswered
+    stale = {"odometer"}  # the meter's first query
+    assert tripped == trial == {k: v for k, v in full.items() if k not in stale}
+    assert again == full
+    summary = client.diagnostics()["circuit_breakers"]["743"]
+    # all but one query in the tripping and the trial cycle, all in between
+    assert summary["skipped"] == 2 * (len(METER) - 1) + len(METER)
+    assert not summary["open"]
+    # the meter's queries are batched three to a request once awake
+    assert asleep < awake and skipped < asleep
+    print(f"  ✓ {awake} commands awake, {asleep} with the meter asleep, {skipped} between trials")
+
+
+def test_unanswered_ecu_trips_breaker(monkeypatch):
+    """An ECU the dongle gets nothing at all from trips its breaker, and only its."""
+    sim = ELMSimulator(time_scale=0.0, timeout=0.05)
+    client = NissanLeafObdBleApiClient("simulator", transport=lambda: sim)
+    request = sim._request
+
+    async def silent_meter(command):
+        # not even NO DATA: only the prompt comes back
+        return [] if sim.header == 0x743 else await request(command)
+
+    async def run():
+        full = await client.async_get_data()
+        client._scheduler.reset_due()
+        monkeypatch.setattr(sim, "_request", silent_meter)
+        before = sim.stats["commands"]
+        data = await client.async_get_data()
+        sent = sim.stats["commands"] - before
+        connected = client.connected
+        summary = client.diagnostics()["circuit_breakers"]["743"]
+        await client.async_disconnect()
+        return full, data, sent, connected, summary
+
+    full, data, sent, connected, summary = asyncio.run(run())
+    assert connected
+    # the rest was read, and the values of the meter's skipped queries
+    # carried forward
+    assert data == {k: v for k, v in full.items() if k != "odometer"}
+    assert summary["open"]
+    assert summary["skipped"] == len(METER) - 1
+    print(f"  ✓ meter skipped after one unanswered query, {sent} commands sent")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Test the capability probe that fills in a vehicle profile up front."""
+
+import asyncio
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.api import NissanLeafObdBleApiClient
+from custom_components.nissan_leaf_obd_ble.capabilities import generation
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.profile import VehicleProfile
+from custom_components.nissan_leaf_obd_ble.simulator import ELMSimulator, leaf_ecus
+
+
+def _probe(sim):
+    client = NissanLeafObdBleApiClient("simulator", transport=lambda: sim)
+
+    async def run():
+        summary = await client.async_probe()
+        await client.async_disconnect()
+        return summary
+
+    return client, asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    ("lbc_length", "expected"), [(0x29, "ZE0"), (0x35, "AZE0"), (0x3D, "ZE1")]
+)
+def test_generation_detected(lbc_length, expected):
+    """The model generation is told from the length of the lbc response."""
+    assert generation(lbc_length) == expected
+    client, summary = _probe(ELMSimulator(leaf_ecus(lbc_length), time_scale=0.0))
+    assert summary["generation"] == client.profile.generation == expected
+    assert summary["ecus"] == {"743": True, "797": True, "79B": True}
+    print(f"  ✓ {lbc_length:#x} byte lbc response: {expected}")
+
+
+def test_probe_fills_profile():
+    """Frame counts, unsupported commands and latencies are known from the start."""
+    sim = ELMSimulator(leaf_ecus(0x29), time_scale=0.0)
+    sim.ecus[0x797].silent.add(b"\x13\x1a")  # no e-Pedal before the ZE1
+    client, summary = _probe(sim)
+    profile = client.profile
+
+    assert summary["unsupported"] == ["e_pedal_mode"]
+    assert not profile.is_supported(leaf_commands["e_pedal_mode"])
+    assert "e_pedal_mode" not in summary["supported"]
+    assert all(count is not None for count in summary["frame_counts"].values())
+    assert len(summary["frame_counts"]) == len(leaf_commands) - 2  # probe, e-Pedal
+    assert set(profile.latencies) == {"743", "797", "79B"}
+
+    # a new client with the stored profile starts with learned timeouts
+    stored = VehicleProfile.from_dict(profile.as_dict())
+    fresh = NissanLeafObdBleApiClient("simulator", transport=lambda: sim)
+    fresh.profile = stored
+
+    async def run():
+        data = await fresh.async_get_data()
+        await fresh.async_disconnect()
+        return data
+
+    data = asyncio.run(run())
+    assert data["state_of_charge"] == 80.0
+    assert fresh.timeouts.st(b"797") is not None
+    assert "e_pedal_mode" not in data
+    print(f"  ✓ {len(summary['supported'])} commands supported, timeouts learned")
+
+
+def test_probe_car_off():
+    """Nothing is probed, or forgotten, while the car is off."""
+    sim = ELMSimulator(time_scale=0.0)
+    for ecu in sim.ecus.values():
+        ecu.awake = False
+    client = NissanLeafObdBleApiClient("simulator", transport=lambda: sim)
+    client.profile.set_unsupported(leaf_commands["e_pedal_mode"])
+    client.profile.dirty = False
+
+    async def run():
+        summary = await client.async_probe()
+        await client.async_disconnect()
+        return summary
+
+    assert asyncio.run(run()) is None
+    assert not client.profile.is_supported(leaf_commands["e_pedal_mode"])
+    assert not client.profile.dirty
+    print("  ✓ car off: nothing probed")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
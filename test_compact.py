@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Test compact responses (ATH0/ATCAF1) and the fallback to raw responses."""
+
+import asyncio
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.api import NissanLeafObdBleApiClient
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.elm327 import OBDStatus
+from custom_components.nissan_leaf_obd_ble.obd import OBD
+from custom_components.nissan_leaf_obd_ble.protocols.protocol import Frame, Message
+from custom_components.nissan_leaf_obd_ble.protocols.protocol_can import (
+    CompactReassembler,
+)
+from custom_components.nissan_leaf_obd_ble.simulator import ELMSimulator
+
+
+def test_compact_parsing():
+    """Single and multi-frame responses parse; anything unclear is ambiguous."""
+    parse = CompactReassembler()
+
+    (single,) = parse([b"6211039D"])
+    assert single.data == bytes.fromhex("6211039D")
+    assert len(single.frames) == 1
+
+    lines = [b"00A", b"0:610102030405", b"1:060708FFFFFFFF"]
+    (multi,) = parse(lines)
+    assert multi.data == bytes.fromhex("610102030405060708FF")  # 10 bytes
+    assert len(multi.frames) == 2  # CAN frames, not counting the length line
+    assert not multi.incomplete
+
+    (short,) = parse(lines[:2])
+    assert short.incomplete
+
+    (no_data,) = parse([b"NO DATA"])
+    assert no_data.raw() == "NO DATA" and not no_data.parsed()
+
+    for ambiguous in (
+        [b"6211039D", b"62110380"],  # two ECUs answered
+        [b"00A", b"1:060708FFFFFFFF"],  # out of sequence
+        [b"0:610102030405"],  # no length line
+        [b"6211039D", b"NO DATA"],
+    ):
+        assert parse(ambiguous) is None, ambiguous
+    print("  ✓ compact responses parsed, ambiguous ones rejected")
+
+
+def test_compact_cycle_matches_raw():
+    """A cycle in compact mode decodes the same values with fewer bytes."""
+
+    async def cycle(compact):
+        port = ELMSimulator(time_scale=0.0)
+        client = NissanLeafObdBleApiClient("simulator", transport=lambda: port)
+        client.compact = compact
+        await client.async_get_data()
+        client._scheduler.reset_due()
+        before = port.stats["bytes_received"]
+        data = await client.async_get_data()
+        received = port.stats["bytes_received"] - before
+        assert client.diagnostics()["compact_fallbacks"] == 0
+        await client.async_disconnect()
+        return data, received
+
+    raw, raw_bytes = asyncio.run(cycle(False))
+    compact, compact_bytes = asyncio.run(cycle(True))
+    assert compact == raw
+    assert compact_bytes < raw_bytes
+    print(f"  ✓ same values, {raw_bytes} -> {compact_bytes} bytes received")
+
+
+class AmbiguousInterface:
+    """ELM stand-in whose compact responses are always ambiguous."""
+
+    def __init__(self):
+        self.sent = []
+
+    def status(self):
+        return OBDStatus.CAR_CONNECTED
+
+    async def send_and_parse(self, cmd, deadline=None):
+        self.sent.append(cmd)
+        if cmd.startswith(b"AT"):
+            return [Message([Frame("OK")])]
+        message = Message([Frame("79A046211039D")])
+        message.data = bytearray.fromhex("6211039D")
+        return [message]
+
+    async def send_and_parse_compact(self, cmd, deadline=None):
+        self.sent.append(cmd)
+        return None
+
+
+def test_ambiguous_response_falls_back_to_raw():
+    """The ECU is asked again raw, and stays raw for the rest of the session."""
+    obd = OBD("test", compact=True)
+    obd.interface = AmbiguousInterface()
+    cmd = leaf_commands["bat_12v_voltage"]
+
+    async def run():
+        first = await obd.query(cmd, force=True)
+        sent = list(obd.interface.sent)
+        obd.interface.sent.clear()
+        second = await obd.query(cmd, force=True)
+        return first, second, sent
+
+    first, second, sent = asyncio.run(run())
+    assert first.value == second.value
+    assert sent[-4:] == [b"221103", b"AT H 1", b"AT CAF 0", b"03221103"]
+    assert b"AT H 0" in sent and b"AT CAF 1" in sent
+    # raw from now on: no formatting switches, no compact attempt
+    assert obd.interface.sent == [b"03221103"]
+    assert obd.compact_fallbacks == 1
+    print("  ✓ ambiguous compact response asked again raw")
+
+
+class DroppingInterface(AmbiguousInterface):
+    """ELM stand-in whose link drops while it waits for a compact response."""
+
+    def __init__(self):
+        super().__init__()
+        self.connected = True
+
+    def status(self):
+        return OBDStatus.CAR_CONNECTED if self.connected else OBDStatus.NOT_CONNECTED
+
+    async def send_and_parse_compact(self, cmd, deadline=None):
+        self.sent.append(cmd)
+        self.connected = False
+        return None
+
+
+def test_dropped_link_not_ambiguous():
+    """A link lost during a compact query doesn't switch the ECU to raw."""
+    obd = OBD("test", compact=True)
+    obd.interface = DroppingInterface()
+    cmd = leaf_commands["bat_12v_voltage"]
+
+    response = asyncio.run(obd.query(cmd, force=True))
+    assert response.value is None and not response.messages
+    assert obd.interface.sent[-1] == b"221103"  # not asked again raw
+    assert obd.compact_fallbacks == 0
+
+    obd.interface.connected = True
+    obd.interface.sent.clear()
+    asyncio.run(obd.query(cmd, force=True))
+    assert obd.interface.sent[0] == b"221103"  # still compact
+    print("  ✓ dropped link: no fallback to raw")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
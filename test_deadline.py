@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Test that a polling cycle is bounded by its deadline."""
+
+import asyncio
+import sys
+import time
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble import api as api_module
+from custom_components.nissan_leaf_obd_ble.api import NissanLeafObdBleApiClient
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.deadline import Deadline, bounded
+from custom_components.nissan_leaf_obd_ble.obd import OBD
+from custom_components.nissan_leaf_obd_ble.simulator import ELMSimulator
+
+
+def test_deadline_bounds_timeouts():
+    """Each wait gets the lesser of its own timeout and the budget left."""
+    deadline = Deadline(10.0)
+    assert not deadline.expired
+    assert deadline.timeout(1.0) == 1.0
+    assert 9.0 < deadline.timeout(None) <= 10.0
+    assert bounded(1.0, None) == 1.0
+    assert bounded(None, None) is None
+
+    deadline = Deadline(0.0)
+    assert deadline.expired
+    assert deadline.remaining() == 0.0
+    assert deadline.timeout(1.0) == 0.0
+    print("  ✓ timeouts cut down to the remaining budget")
+
+
+def test_silent_dongle_cut_off_at_deadline():
+    """A dongle that stops answering costs the budget, and no more."""
+    commands = [leaf_commands[name] for name in ("bat_12v_voltage", "odometer", "lbc")]
+
+    async def run():
+        sim = ELMSimulator(time_scale=0.0, timeout=0.5)
+        obd = await OBD.create("simulator", protocol="6", port=sim)
+        sim.drop_rate = 1.0  # every notification lost
+        start = time.perf_counter()
+        responses = await obd.query_batch(commands, Deadline(0.2))
+        elapsed = time.perf_counter() - start
+
+        sim.drop_rate = 0.0
+        response = await obd.query(commands[0], force=True, deadline=Deadline(2.0))
+        alive = obd.is_alive()
+        await obd.close()
+        return responses, elapsed, response, alive
+
+    responses, elapsed, response, alive = asyncio.run(run())
+    assert all(r.value is None for r in responses)
+    assert elapsed < 0.3
+    assert response.value is not None and alive
+    print(f"  ✓ gave up after {elapsed * 1000:.0f} ms, session still usable")
+
+
+def test_unanswered_query_keeps_session(monkeypatch):
+    """A query the dongle answers with nothing at all returns an empty response."""
+    odometer, voltage = leaf_commands["odometer"], leaf_commands["bat_12v_voltage"]
+
+    async def run():
+        sim = ELMSimulator(time_scale=0.0, timeout=0.05)
+        obd = await OBD.create("simulator", protocol="6", port=sim)
+        request = sim._request
+
+        async def silent_meter(command):
+            # not even NO DATA: only the prompt comes back
+            return [] if sim.header == 0x743 else await request(command)
+
+        monkeypatch.setattr(sim, "_request", silent_meter)
+        response = await obd.query(odometer, force=True)
+        alive = obd.is_alive()
+        other = await obd.query(voltage, force=True)
+        monkeypatch.setattr(sim, "_request", request)
+        sim.ecus[0x743].awake = False  # NO DATA
+        no_data = await obd.query(odometer, force=True)
+        await obd.close()
+        return response, alive, other, no_data
+
+    response, alive, other, no_data = asyncio.run(run())
+    assert response.value is None and not response.messages
+    assert alive
+    assert other.value is not None
+    assert no_data.value is None and not no_data.messages
+    print("  ✓ no answer: empty response, session still usable")
+
+
+def test_cycle_deadline_keeps_session(monkeypatch):
+    """A cycle that runs out of time is counted, and the next one reads all."""
+    monkeypatch.setattr(api_module, "CYCLE_BUDGET", 0.2)
+    sim = ELMSimulator(time_scale=0.0, timeout=0.5)
+    client = NissanLeafObdBleApiClient("simulator", transport=lambda: sim)
+
+    async def run():
+        full = await client.async_get_data()
+        client._scheduler.reset_due()
+        sim.drop_rate = 1.0
+        start = time.perf_counter()
+        cut = await client.async_get_data()
+        elapsed = time.perf_counter() - start
+        connected = client.connected
+        sim.drop_rate = 0.0
+        monkeypatch.setattr(api_module, "CYCLE_BUDGET", 8.0)
+        again = await client.async_get_data()
+        await client.async_disconnect()
+        return full, cut, elapsed, connected, again
+
+    full, cut, elapsed, connected, again = asyncio.run(run())
+    assert cut == {} and elapsed < 0.3
+    assert connected
+    assert again == full
+    assert client.stats["deadlines_exceeded"] == 1
+    print(f"  ✓ cycle cut off after {elapsed * 1000:.0f} ms, next cycle complete")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
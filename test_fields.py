@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Test decoders compiled from field specs against the hand-written ones."""
+
+import random
+import sys
+
+import pytest
+
+from benchmarks.bench_decoders import LEGACY
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.fields import Field, compile_decoder
+from custom_components.nissan_leaf_obd_ble.protocols.protocol import Message
+
+
+def _messages(data):
+    message = Message([])
+    message.data = bytearray(data)
+    return [message]
+
+
+@pytest.mark.parametrize("name", sorted(LEGACY))
+def test_same_values_as_hand_written(name):
+    """Every command decodes random responses to the same values, of the same types."""
+    cmd = leaf_commands[name]
+    assert cmd.fields is not None
+    rng = random.Random(name)
+    responses = [rng.randbytes(cmd.bytes) for _ in range(500)]
+    # every value of the byte most decoders read, too
+    responses += [bytes(3) + bytes([b]) + bytes(cmd.bytes - 4) for b in range(256)]
+    for data in responses:
+        expected = LEGACY[name](_messages(data))
+        value = cmd.decode(_messages(data))
+        assert value == expected, data.hex()
+        assert [type(v) for v in value.values()] == [
+            type(v) for v in expected.values()
+        ]
+    print(f"  ✓ {name}: {cmd.decode.__doc__}")
+
+
+def test_quirks_kept():
+    """The odd tests of the hand-written decoders are kept."""
+    eco_mode = leaf_commands["eco_mode"].decode
+    assert eco_mode(_messages(b"\x62\x13\x18\x11\x00")) == {"eco_mode": True}
+    assert eco_mode(_messages(b"\x62\x13\x18\x10\x00")) == {"eco_mode": False}
+
+    lbc = leaf_commands["lbc"].decode
+    data = bytearray(53)
+    data[2:6] = (0x08000000).to_bytes(4, "big")  # bit 27: negative
+    data[8:12] = (0x80000000).to_bytes(4, "big")  # bit 31 alone: positive
+    value = lbc(_messages(data))
+    assert value["hv_battery_current_1"] == (0x08000000 - 0x100000000) / 1024
+    assert value["hv_battery_current_2"] == 0x80000000 / 1024
+    assert lbc(_messages(b"")) is None
+    print("  ✓ eco mode and lbc current quirks kept")
+
+
+def test_compile_decoder():
+    """Fields are unpacked in one struct, in the order given, bounds checked."""
+    decode = compile_decoder(
+        Field("b", 4, width=2, signed=True, divisor=10),
+        Field("a", 1, values={1: "one"}, default="other"),
+        Field("c", 6, width=3, scale=2, bias=1),
+    )
+    data = b"\x00\x01\x00\x00\xff\xf6\x01\x00\x00"
+    assert list(decode(_messages(data)).items()) == [
+        ("b", -1.0),
+        ("a", "one"),
+        ("c", 0x20001),
+    ]
+    assert decode(_messages(data[:-1])) is None
+    assert decode.fields[1].name == "a"
+
+    # single fields, indexed or unpacked
+    byte = compile_decoder(Field("a", 1, mask=0x0F, scale=2, bias=1))
+    assert byte(_messages(b"\x00\xf3")) == {"a": 7}
+    assert byte(_messages(b"\x00")) is None
+    wide = compile_decoder(Field("a", 1, width=3))
+    assert wide(_messages(b"\x00\x01\x02\x03")) == {"a": 0x010203}
+    assert wide(_messages(b"\x00\x01\x02")) is None
+
+    with pytest.raises(ValueError, match="overlaps"):
+        compile_decoder(Field("a", 3, width=2), Field("b", 4))
+    with pytest.raises(ValueError, match="width"):
+        Field("a", 3, width=3, signed=True)
+    print("  ✓ fields compiled into one decoder")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
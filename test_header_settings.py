@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Test that switching ECU header only sends the ELM settings that changed."""
+
+import asyncio
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble import diagnostics
+from custom_components.nissan_leaf_obd_ble.api import NissanLeafObdBleApiClient
+from custom_components.nissan_leaf_obd_ble.const import DOMAIN
+from custom_components.nissan_leaf_obd_ble.elm327 import OBDStatus
+from custom_components.nissan_leaf_obd_ble.obd import OBD
+from custom_components.nissan_leaf_obd_ble.protocols.protocol import Frame, Message
+
+
+class FakeInterface:
+    """ELM stand-in that records AT commands and answers OK (or a reply)."""
+
+    def __init__(self, reply="OK"):
+        self.sent = []
+        self.reply = reply
+
+    def status(self):
+        return OBDStatus.CAR_CONNECTED
+
+    async def send_and_parse(self, cmd, deadline=None):
+        self.sent.append(cmd)
+        return [Message([Frame(self.reply)])]
+
+
+def _obd(reply="OK"):
+    obd = OBD("test")
+    obd.interface = FakeInterface(reply)
+    return obd
+
+
+def test_header_switch_sends_deltas():
+    """Flow control data/mode are sent once; a switch sends SH, FC SH and CRA."""
+    obd = _obd()
+
+    async def run():
+        for header in (b"797", b"797", b"79B", b"797"):
+            await obd._OBD__set_header(header)
+
+    asyncio.run(run())
+    assert obd.interface.sent == [
+        b"AT SH 797",
+        b"AT FC SH 797",
+        b"AT CRA 79A",
+        b"AT FC SD 30 00 00",
+        b"AT FC SM 1",
+        b"AT SH 79B",
+        b"AT FC SH 79B",
+        b"AT CRA 7BB",
+        b"AT SH 797",
+        b"AT FC SH 797",
+        b"AT CRA 79A",
+    ]
+    assert obd.at_commands_sent == 11
+    assert obd.at_commands_saved == 9
+    print("  ✓ only changed settings are sent")
+
+
+def test_rejected_setting_is_retried():
+    """A setting the ELM did not acknowledge is sent again next time."""
+    obd = _obd(reply="?")
+
+    async def run():
+        await obd._OBD__set_header(b"797")
+        obd.interface.reply = "OK"
+        await obd._OBD__set_header(b"797")
+
+    asyncio.run(run())
+    assert obd.interface.sent == [
+        b"AT SH 797",
+        b"AT SH 797",
+        b"AT FC SH 797",
+        b"AT CRA 79A",
+        b"AT FC SD 30 00 00",
+        b"AT FC SM 1",
+    ]
+    print("  ✓ unacknowledged setting retried")
+
+
+def test_receive_filter_follows_header():
+    """The receive filter is cleared for unknown ECUs and after monitoring."""
+    obd = _obd()
+
+    async def monitor(on_line, receive_filter, receive_mask):
+        return True
+
+    obd.interface.monitor = monitor
+
+    async def run():
+        await obd._OBD__set_header(b"743")
+        await obd._OBD__set_header(b"7E0")  # no known response ID
+        await obd._OBD__set_header(b"743")
+        switches = [c for c in obd.interface.sent if c.startswith(b"AT CRA")]
+        obd.interface.sent.clear()
+        await obd.monitor(print)  # ATMA replaces the filter
+        await obd._OBD__set_header(b"743")
+        return switches
+
+    switches = asyncio.run(run())
+    assert switches == [b"AT CRA 763", b"AT CRA", b"AT CRA 763"]
+    assert obd.interface.sent == [b"AT CRA 763"]
+    print("  ✓ receive filter reset for unknown headers and after monitoring")
+
+
+def test_diagnostics_report_saved_commands():
+    """The per-cycle counters are exposed through the diagnostics platform."""
+    api = NissanLeafObdBleApiClient(object())
+    obd = _obd()
+    obd.at_commands_sent, obd.at_commands_saved = 10, 4
+    api._update_stats(obd, sent=4, saved=1)
+    coordinator = SimpleNamespace(
+        api=api, options={"fast_poll": 10}, update_interval=None
+    )
+    entry = SimpleNamespace(entry_id="abc")
+    hass = SimpleNamespace(data={DOMAIN: {"abc": coordinator}})
+
+    result = asyncio.run(diagnostics.async_get_config_entry_diagnostics(hass, entry))
+    assert result["api"]["at_commands_sent"] == 6
+    assert result["api"]["at_commands_saved"] == 3
+    assert result["api"]["at_commands_saved_total"] == 3
+    assert result["api"]["connected"] is False
+    print("  ✓ diagnostics expose AT commands saved")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
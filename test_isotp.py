@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Test streaming ISO-TP reassembly and early return before the ELM prompt."""
+
+import asyncio
+import sys
+
+import pytest
+
+from benchmarks.bench_ringbuffer import lbc_response
+from custom_components.nissan_leaf_obd_ble.elm327 import ELM327, OBDStatus
+from custom_components.nissan_leaf_obd_ble.protocols.protocol_can import (
+    ISO_15765_4_11bit_500k,
+    ISOTPReassembler,
+)
+
+
+def _lines(response):
+    return [line for line in response.rstrip(b">").split(b"\r") if line]
+
+
+def test_matches_full_parser():
+    """The streamed payload equals what the protocol builds after the prompt."""
+    protocol = ISO_15765_4_11bit_500k()
+    reassembler = ISOTPReassembler(protocol)
+    lines = _lines(lbc_response())
+    results = [reassembler.feed(line) for line in lines]
+    assert results == [False] * (len(lines) - 1) + [True]
+
+    streamed = reassembler.message()
+    parsed = protocol(lines)[0]
+    assert streamed.data == parsed.data
+    assert len(streamed.data) == 53
+    assert [f.raw for f in streamed.frames] == [f.raw for f in parsed.frames]
+    print("  ✓ streamed payload matches the full parser")
+
+
+def test_single_frame():
+    """A single frame completes immediately."""
+    reassembler = ISOTPReassembler(ISO_15765_4_11bit_500k())
+    assert reassembler.feed(b"79A0562110300A3")
+    assert reassembler.message().data == bytearray(b"\x62\x11\x03\x00\xa3")
+    print("  ✓ single frame")
+
+
+def test_unexpected_input_falls_back():
+    """Gaps in the sequence or ELM messages leave parsing to the protocol."""
+    lines = _lines(lbc_response())
+    reassembler = ISOTPReassembler(ISO_15765_4_11bit_500k())
+    reassembler.feed(lines[0])
+    assert not reassembler.feed(lines[2])  # CF 2 before CF 1
+    assert reassembler.failed
+    assert not reassembler.feed(lines[1])
+    assert reassembler.message() is None
+
+    reassembler.reset()
+    assert not reassembler.feed(b"NO DATA")
+    assert reassembler.failed
+    print("  ✓ falls back on unexpected input")
+
+
+class FakePort:
+    """Adapter that sends frames but holds back the prompt, like an ELM
+    that is still listening for more frames."""
+
+    timeout = 1
+    client = True
+
+    def __init__(self):
+        self.consumer = None
+        self.writes = []
+        self.listening = False
+
+    def set_consumer(self, consumer):
+        self.consumer = consumer
+
+    def reset_input_buffer(self):
+        pass
+
+    async def write(self, data):
+        self.writes.append(data)
+        if data == b" ":
+            if self.listening:
+                self.listening = False
+                self.consumer.feed(b"STOPPED\r\r>")
+            return
+        response = lbc_response()
+        self.consumer.feed(response[: response.index(b"\r\r>")] + b"\r")
+        self.listening = True
+
+    async def wait_until(self, predicate, timeout=None):
+        return predicate()
+
+
+def test_returns_before_prompt():
+    """A complete response is returned without the prompt, and the adapter
+    is interrupted before the next command."""
+
+    async def run():
+        elm = ELM327("test", timeout=1)
+        port = FakePort()
+        elm._ELM327__port = port
+        elm._ELM327__status = OBDStatus.CAR_CONNECTED
+        port.set_consumer(elm._ELM327__tokenizer)
+        first = await elm.send_and_parse(b"022101")
+        second = await elm.send_and_parse(b"022101")
+        return port, first, second
+
+    port, first, second = asyncio.run(run())
+    assert len(first) == 1
+    assert len(first[0].data) == 53
+    assert second[0].data == first[0].data
+    assert port.writes == [b"022101\r", b" ", b"022101\r"]
+    print("  ✓ early return, then interrupt before the next command")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
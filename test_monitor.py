@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Test passive monitoring of broadcast frames."""
+
+import asyncio
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.api import NissanLeafObdBleApiClient
+from custom_components.nissan_leaf_obd_ble.monitor import (
+    CANMonitor,
+    broadcast_messages,
+    receive_filter,
+)
+from custom_components.nissan_leaf_obd_ble.simulator import ELMSimulator
+
+
+class FakeClock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_decoders():
+    """Broadcast layouts decode to the same units as the queried values."""
+    monitor = CANMonitor()
+    monitor.feed_line(b"1DB0280B40000000000")
+    monitor.feed_line(b"1DBFF60B40000000000")  # decimated
+    monitor.feed_line(b"55BC800000000000000")
+    monitor.feed_line(b"5BC3200000000000000")
+    monitor.feed_line(b"2840000000011F80000")
+    assert monitor.values == {
+        "hv_battery_current": 10,
+        "hv_battery_voltage": 360,
+        "state_of_charge": 80,
+        "hv_battery_gids": 200,
+        "speed": 50,
+    }
+    monitor.reset()
+    monitor.feed_line(b"1DBFFE0B40000000000")
+    assert monitor.values["hv_battery_current"] == -0.5  # charging
+    print("  ✓ 0x1DB, 0x55B, 0x5BC and 0x284 decoded")
+
+
+def test_decimation_and_noise():
+    """Frames closer than the ID's interval are dropped before decoding."""
+    clock = FakeClock()
+    pushed = []
+    monitor = CANMonitor(on_values=pushed.append, clock=clock)
+    for n in range(100):  # one second of 0x1DB at 100 Hz
+        clock.now = n / 100
+        monitor.feed_line(b"1DB0280B40000000000")
+    clock.now = 1.0
+    monitor.feed_line(b"1DB0280B40000000000")
+    monitor.feed_line(b"7BB0123")  # let through by the mask, not registered
+    monitor.feed_line(b"BUFFER FULL")
+    clock.now = 2.0
+    monitor.feed_line(b"1DB02")  # short
+    assert len(pushed) == 2
+    assert monitor.stats["decimated"] == 99
+    assert monitor.stats["errors"] == 1
+    assert monitor.stats["ignored"] == 1
+    assert monitor.stats["buffer_full"] == 1
+    print(f"  ✓ {monitor.stats['frames']} frames -> {len(pushed)} updates")
+
+
+def _passes(can_filter, can_id):
+    value, mask = can_filter
+    return can_id & mask == value & mask
+
+
+def test_receive_filter():
+    """Each window's filter passes one registered ID, and nothing unrelated."""
+    # the Leaf's IDs have no bit in common: one filter would pass the bus
+    assert receive_filter(broadcast_messages) == (0x000, 0x000)
+    assert receive_filter([0x1DB]) == (0x1DB, 0x7FF)
+
+    monitor = CANMonitor()
+    filters = [monitor.next_filter() for _ in broadcast_messages]
+    for can_filter in filters:
+        assert can_filter[1] != 0
+        assert sum(_passes(can_filter, i) for i in broadcast_messages) == 1
+        assert not any(_passes(can_filter, i) for i in (0x7BB, 0x5C5, 0x1DA))
+    heard = {i for i in broadcast_messages for f in filters if _passes(f, i)}
+    assert heard == set(broadcast_messages)
+    assert monitor.next_filter() == filters[0]  # and round again
+    print(f"  ✓ {len(filters)} windows, one ID each")
+
+
+def test_monitor_between_cycles():
+    """Broadcasts are heard between polls and queries still work after."""
+    pushed = []
+
+    async def run():
+        client = NissanLeafObdBleApiClient(
+            "simulator", transport=lambda: ELMSimulator(time_scale=0.1)
+        )
+        client.monitor = CANMonitor(on_values=pushed.append)
+        first = await client.async_get_data()
+        assert client._api.monitoring
+        await asyncio.sleep(0.3)  # listening to 0x1DB
+        second = await client.async_get_data()
+        heard = {k for values in pushed for k in values}
+        pushed.clear()
+        await asyncio.sleep(0.3)  # then to 0x55B
+        await client.async_get_data()
+        await client.async_disconnect()
+        return first, second, heard, client.monitor
+
+    first, second, heard, monitor = asyncio.run(run())
+    assert first["state_of_charge"] == 80
+    assert second["hv_battery_current"] == 10
+    assert heard == {"hv_battery_current", "hv_battery_voltage"}
+    assert {k for values in pushed for k in values} == {"state_of_charge"}
+    assert monitor.stats["ignored"] == 0  # the adapter passed nothing else
+    assert monitor.stats["decimated"] > monitor.stats["decoded"]
+    print(f"  ✓ {monitor.stats['frames']} frames heard between two polls")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
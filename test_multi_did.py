@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Test packing several 0x22 DIDs into one request, and the fallback."""
+
+import asyncio
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.elm327 import OBDStatus
+from custom_components.nissan_leaf_obd_ble.obd import OBD
+from custom_components.nissan_leaf_obd_ble.profile import VehicleProfile
+from custom_components.nissan_leaf_obd_ble.protocols.protocol_can import (
+    ISO_15765_4_11bit_500k,
+)
+
+VCM = [c for c in leaf_commands.values() if c.header == b"797" and c.name != "unknown"]
+
+
+def _isotp(rx_id, payload):
+    """Return ATH1/ATS0/ATCAF0 lines for a payload."""
+    if len(payload) <= 7:
+        return [rx_id + b"%02X" % len(payload) + payload.hex().upper().encode()]
+    lines = [rx_id + b"1%03X" % len(payload) + payload[:6].hex().upper().encode()]
+    for seq, i in enumerate(range(6, len(payload), 7), start=1):
+        chunk = payload[i : i + 7].ljust(7, b"\xaa")
+        lines.append(rx_id + b"2%X" % (seq & 0x0F) + chunk.hex().upper().encode())
+    return lines
+
+
+class FakeVCM:
+    """ELM + VCM stand-in answering single and (optionally) multi-DID reads."""
+
+    def __init__(self, multi_did=True, nrc=0x13):
+        self.multi_did = multi_did
+        self.nrc = nrc  # rejecting multi-DID reads
+        self.requests = []
+        self.connected = True
+        self.drop = False  # the link drops at the next request
+        self.protocol = ISO_15765_4_11bit_500k()
+        # a distinct payload per DID, as long as the command expects
+        self.values = {
+            bytes.fromhex(c.command.decode())[2:]: bytes(
+                (n + k) & 0xFF for k in range(c.bytes - 3)
+            )
+            for n, c in enumerate(VCM)
+        }
+
+    def status(self):
+        return OBDStatus.CAR_CONNECTED if self.connected else OBDStatus.NOT_CONNECTED
+
+    async def send_and_parse(self, cmd, deadline=None):
+        if cmd.startswith(b"AT"):
+            return self.protocol([b"OK"])
+        if self.drop:
+            self.connected = False
+        if not self.connected:
+            return None
+        self.requests.append(cmd)
+        request = bytes.fromhex(cmd.decode())
+        dids = [request[i : i + 2] for i in range(2, len(request), 2)]
+        if len(dids) > 1 and not self.multi_did:
+            payload = bytes([0x7F, 0x22, self.nrc])
+        else:
+            payload = b"\x62" + b"".join(d + self.values[d] for d in dids)
+        return self.protocol(_isotp(b"79A", payload))
+
+
+def _cycle(obd):
+    async def run():
+        return [r.value for r in await obd.query_batch(VCM)]
+
+    return asyncio.run(run())
+
+
+def test_dids_batched_after_lengths_learned():
+    """The second cycle packs three DIDs per request and decodes the same."""
+    obd = OBD("test")
+    obd.interface = FakeVCM()
+    first = _cycle(obd)
+    assert len(obd.interface.requests) == len(VCM)
+
+    obd.interface.requests.clear()
+    second = _cycle(obd)
+    assert second == first
+    assert len(obd.interface.requests) == -(-len(VCM) // 3)
+    assert obd.interface.requests[0].startswith(b"0722")
+    assert obd.profile.supports_multi_did(b"797") is True
+    print(f"  ✓ {len(VCM)} DIDs read in {len(obd.interface.requests)} requests")
+
+
+def test_rejecting_ecu_is_remembered():
+    """An ECU that rejects multi-DID reads falls back to single queries for good."""
+    obd = OBD("test")
+    obd.interface = FakeVCM(multi_did=False)
+    first = _cycle(obd)
+    second = _cycle(obd)
+    assert second == first
+    assert obd.profile.supports_multi_did(b"797") is False
+
+    obd.interface.requests.clear()
+    assert _cycle(obd) == first
+    assert len(obd.interface.requests) == len(VCM)
+    assert all(r.startswith(b"0322") for r in obd.interface.requests)
+
+    # until it expires
+    stored = VehicleProfile.from_dict(obd.profile.as_dict())
+    since = stored.multi_did["797"]["since"]
+    assert stored.supports_multi_did(b"797", now=since + 1) is False
+    expired = since + VehicleProfile.UNSUPPORTED_TTL
+    assert stored.supports_multi_did(b"797", now=expired) is None
+    assert stored.multi_did == {} and stored.dirty
+    print("  ✓ rejection remembered, single queries used until it expires")
+
+
+@pytest.mark.parametrize("nrc", [0x21, 0x22])
+def test_transient_rejection_not_remembered(nrc):
+    """Busy or conditions not correct: single queries this time, multi-DID next."""
+    obd = OBD("test")
+    obd.interface = FakeVCM(multi_did=False, nrc=nrc)
+    first = _cycle(obd)
+    assert _cycle(obd) == first
+    assert obd.profile.supports_multi_did(b"797") is None
+
+    obd.interface.multi_did = True
+    obd.interface.requests.clear()
+    assert _cycle(obd) == first
+    assert obd.interface.requests[0].startswith(b"0722")
+    print(f"  ✓ NRC 0x{nrc:02X} not remembered")
+
+
+def test_stored_multi_did_validated():
+    """Malformed or old (bare boolean) stored entries are ignored."""
+    profile = VehicleProfile.from_dict(
+        {"multi_did": {"797": False, "743": {"accepts": True, "since": 5}}}
+    )
+    assert profile.multi_did == {"743": {"accepts": True, "since": 5.0}}
+    print("  ✓ malformed entries ignored")
+
+
+def test_link_dropped_before_batch():
+    """A link lost once the header is set leaves empty responses, not an error."""
+    obd = OBD("test")
+    obd.interface = FakeVCM()
+    _cycle(obd)
+    obd.interface.drop = True  # the header is already set: the request is next
+    assert _cycle(obd) == [None] * len(VCM)
+    assert not obd.interface.requests[len(VCM) :]
+    assert obd.profile.supports_multi_did(b"797") is None
+    print("  ✓ dropped link: empty responses")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Test that each cycle only reads the commands that are due."""
+
+import asyncio
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble import api as api_module
+from custom_components.nissan_leaf_obd_ble.api import NissanLeafObdBleApiClient
+from custom_components.nissan_leaf_obd_ble.commands import MINUTE, leaf_commands
+from custom_components.nissan_leaf_obd_ble.elm327 import OBDStatus
+from custom_components.nissan_leaf_obd_ble.OBDResponse import OBDResponse
+
+EVERY_CYCLE = {c.name for c in leaf_commands.values() if c.interval is None}
+ALL = set(leaf_commands)
+
+
+class FakeClock:
+    """Stand-in for the time module."""
+
+    now = 1000.0
+
+    @classmethod
+    def monotonic(cls):
+        return cls.now
+
+
+class RecordingOBD:
+    """OBD stand-in that answers every command and records what was read."""
+
+    header = None
+    at_commands_sent = 0
+    at_commands_saved = 0
+    warm_started = False
+    clean_close = False
+
+    def __init__(self):
+        self.read = []
+        self.unanswered = set()  # sent, but left unanswered
+        self.skipped = set()  # not sent (e.g. breaker open)
+
+    @classmethod
+    async def create(cls, device, **kwargs):
+        return cls()
+
+    def status(self):
+        return OBDStatus.CAR_CONNECTED
+
+    def is_alive(self):
+        return True
+
+    async def close(self):
+        pass
+
+    async def query_batch(self, cmds, deadline=None, breakers=None):
+        responses = []
+        for cmd in cmds:
+            if cmd.name in self.skipped:
+                responses.append(OBDResponse())
+                continue
+            self.read.append(cmd.name)
+            if cmd.name in self.unanswered:
+                responses.append(OBDResponse(cmd))
+                continue
+            response = OBDResponse(cmd, ["frame"])
+            response.value = {cmd.name: FakeClock.now}
+            responses.append(response)
+        return responses
+
+    async def query(self, cmd, force=False, deadline=None):
+        return (await self.query_batch([cmd]))[0]
+
+
+def _poll(client, at):
+    FakeClock.now = at
+    if client._api is not None:
+        client._api.read.clear()
+    data = asyncio.run(client.async_get_data())
+    return set(client._api.read), data
+
+
+def test_slow_commands_skipped_and_carried(monkeypatch):
+    """Between refreshes, slow values are not read but are still reported."""
+    monkeypatch.setattr(api_module, "OBD", RecordingOBD)
+    monkeypatch.setattr(api_module, "time", FakeClock)
+    client = NissanLeafObdBleApiClient(object())
+
+    read, data = _poll(client, 1000)
+    assert read == ALL
+    read, data = _poll(client, 1010)
+    assert read == EVERY_CYCLE
+    assert set(data) == ALL
+    assert data["odometer"] == 1000  # carried forward
+    assert data["speed"] == 1010
+
+    read, _ = _poll(client, 1000 + MINUTE)
+    assert {"bat_12v_voltage", "range_remaining"} <= read
+    assert "odometer" not in read
+    print(f"  ✓ {len(EVERY_CYCLE)} of {len(ALL)} commands read between refreshes")
+
+
+def test_unanswered_values_dropped(monkeypatch):
+    """A due command left unanswered loses its value; a skipped one keeps it."""
+    monkeypatch.setattr(api_module, "OBD", RecordingOBD)
+    monkeypatch.setattr(api_module, "time", FakeClock)
+    client = NissanLeafObdBleApiClient(object())
+
+    _poll(client, 1000)
+    client._api.unanswered = {"speed"}
+    client._api.skipped = {"motor_power"}
+    _, data = _poll(client, 1010)
+    assert "speed" not in data
+    assert data["motor_power"] == 1000  # not sent: carried forward
+    assert data["odometer"] == 1000  # not due
+    assert data["gear_position"] == 1010
+    print("  ✓ stale values of unanswered commands dropped")
+
+
+def test_disconnect_forces_full_read(monkeypatch):
+    """After the session is closed (car off), the next cycle reads everything."""
+    monkeypatch.setattr(api_module, "OBD", RecordingOBD)
+    monkeypatch.setattr(api_module, "time", FakeClock)
+    client = NissanLeafObdBleApiClient(object())
+
+    _poll(client, 1000)
+    asyncio.run(client.async_disconnect())
+    read, _ = _poll(client, 1010)
+    assert read == ALL
+    print("  ✓ full read after reconnect")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Test learned frame counts: learning, early return, fallback and storage."""
+
+import asyncio
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.elm327 import OBDStatus
+from custom_components.nissan_leaf_obd_ble.obd import OBD
+from custom_components.nissan_leaf_obd_ble.profile import VehicleProfile
+from custom_components.nissan_leaf_obd_ble.protocols.protocol_can import (
+    ISO_15765_4_11bit_500k,
+)
+
+CMD = leaf_commands["bat_12v_voltage"]
+SINGLE = [b"79A056211039A"]
+DOUBLE = [b"79A10086211030102", b"79A210304AAAAAAAAAA"]
+
+
+class FakeInterface:
+    """ELM stand-in that stops after the requested number of frames."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.sent = []
+        self.protocol = ISO_15765_4_11bit_500k()
+
+    def status(self):
+        return OBDStatus.CAR_CONNECTED
+
+    async def send_and_parse(self, cmd, deadline=None):
+        if cmd.startswith(b"AT"):
+            return self.protocol([b"OK"])
+        self.sent.append(cmd)
+        lines = self.lines
+        if cmd != CMD.command:
+            lines = lines[: int(cmd[len(CMD.command) :], 16)]
+        return self.protocol(lines)
+
+
+def _query(obd, times=1):
+    async def run():
+        return [await obd.query(CMD, force=True) for _ in range(times)]
+
+    return asyncio.run(run())
+
+
+def test_count_used_once_stable():
+    """The count is appended only after it has been seen STABLE_HITS times."""
+    obd = OBD("test")
+    obd.interface = FakeInterface(SINGLE)
+    responses = _query(obd, VehicleProfile.STABLE_HITS + 1)
+    assert obd.interface.sent == [CMD.command] * VehicleProfile.STABLE_HITS + [
+        CMD.command + b"1"
+    ]
+    assert responses[-1].value == responses[0].value
+    assert obd.profile.dirty
+    print("  ✓ stable frame count appended")
+
+
+def test_truncated_response_falls_back():
+    """A longer response than learned is re-queried without the count."""
+    profile = VehicleProfile()
+    for _ in range(VehicleProfile.STABLE_HITS):
+        profile.observe_frame_count(CMD, 1)
+    obd = OBD("test", profile=profile)
+    obd.interface = FakeInterface(DOUBLE)
+    response = _query(obd)[0]
+    assert obd.interface.sent == [CMD.command + b"1", CMD.command]
+    assert response.messages[0].data[:4] == bytearray(b"\x62\x11\x03\x01")
+    assert profile.frame_counts[CMD.name] == {"count": 2, "hits": 1}
+    print("  ✓ truncated response re-queried the slow way")
+
+
+def test_no_data_keeps_count():
+    """A car that does not answer does not unlearn the count."""
+    profile = VehicleProfile()
+    for _ in range(VehicleProfile.STABLE_HITS):
+        profile.observe_frame_count(CMD, 1)
+    obd = OBD("test", profile=profile)
+    obd.interface = FakeInterface([b"NO DATA"])
+    _query(obd)
+    assert obd.interface.sent == [CMD.command + b"1"]
+    assert profile.frame_count(CMD) == 1
+    print("  ✓ NO DATA leaves the learned count alone")
+
+
+def test_storage_round_trip():
+    """The profile survives as_dict()/from_dict(), ignoring bad entries."""
+    profile = VehicleProfile()
+    profile.observe_frame_count(CMD, 8)
+    data = profile.as_dict()
+    data["frame_counts"]["bogus"] = {"count": "x"}
+    restored = VehicleProfile.from_dict(data)
+    assert restored.frame_counts == {CMD.name: {"count": 8, "hits": 1}}
+    assert not restored.dirty
+    assert VehicleProfile.from_dict(None).frame_counts == {}
+    print("  ✓ profile round trip through storage")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
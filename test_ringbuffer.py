@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Test the bleserial receive ring buffer."""
+
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.ringbuffer import RingBuffer
+
+
+def test_read_and_consume():
+    """Bytes come out in order and consume drops them."""
+    buf = RingBuffer(16)
+    buf.extend(b"hello ")
+    buf.extend(b"world")
+    assert len(buf) == 11
+    assert buf.read(6) == b"hello "
+    assert buf.peek() == b"world"
+    buf.consume(5)
+    assert len(buf) == 0
+    assert not buf
+
+
+def test_wraparound():
+    """Writes and reads that cross the end of the array stay in order."""
+    buf = RingBuffer(8)
+    buf.extend(b"abcdef")
+    assert buf.read(5) == b"abcde"
+    buf.extend(b"ghijk")  # wraps
+    assert buf.capacity == 8
+    assert buf.find(b"j") == 4
+    assert buf.read() == b"fghijk"
+
+
+def test_find_straddling_wrap():
+    """A multi-byte delimiter split by the wrap point is still found."""
+    buf = RingBuffer(8)
+    buf.extend(b"xxxxxx")
+    buf.consume(5)
+    buf.extend(b"aOKb")  # "O" at index 7, "K" at index 0
+    assert buf.find(b"OK") == 2
+
+
+def test_incremental_find():
+    """A delimiter search does not rescan bytes already checked."""
+    buf = RingBuffer(64)
+    buf.extend(b"7BB1035610100010203")
+    assert buf.find(b"\r") == -1
+    assert buf._scanned[b"\r"] == 19
+    buf.extend(b"\r7BB21")
+    assert buf.find(b"\r") == 19
+    assert buf.read(20) == b"7BB1035610100010203\r"
+    assert buf.find(b"\r") == -1
+
+
+def test_grow_keeps_order():
+    """Overflowing the capacity grows the buffer without losing data."""
+    buf = RingBuffer(8)
+    buf.extend(b"0123")
+    buf.consume(2)
+    buf.extend(b"456789AB")
+    assert buf.capacity == 16
+    assert buf.find(b"9") == 7
+    assert buf.read() == b"23456789AB"
+
+
+def test_index_missing_raises():
+    """index() behaves like bytearray.index when the delimiter is absent."""
+    buf = RingBuffer()
+    buf.extend(b"NO DATA")
+    with pytest.raises(ValueError):
+        buf.index(b">")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
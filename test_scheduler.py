@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Test the query scheduler and the AT traffic its plans generate."""
+
+import asyncio
+import random
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.elm327 import OBDStatus
+from custom_components.nissan_leaf_obd_ble.obd import OBD
+from custom_components.nissan_leaf_obd_ble.protocols.protocol import Frame, Message
+from custom_components.nissan_leaf_obd_ble.scheduler import QueryScheduler
+
+PROBE = leaf_commands["unknown"]
+
+
+class CountingInterface:
+    """ELM stand-in that answers OK to everything and counts AT commands."""
+
+    def __init__(self):
+        self.at_commands = 0
+
+    def status(self):
+        return OBDStatus.CAR_CONNECTED
+
+    async def send_and_parse(self, cmd, deadline=None):
+        if cmd.startswith(b"AT"):
+            self.at_commands += 1
+        return [Message([Frame("OK")])]
+
+
+def _at_traffic(obd, plan):
+    """Run the planned headers through OBD and return the AT commands sent."""
+    before = obd.interface.at_commands
+
+    async def run():
+        for cmd in plan:
+            await obd._OBD__set_header(cmd.header)
+
+    asyncio.run(run())
+    return obd.interface.at_commands - before
+
+
+def _obd():
+    obd = OBD("test")
+    obd.interface = CountingInterface()
+    return obd
+
+
+def test_interleaved_table_is_grouped():
+    """However the table is ordered, each header is switched to once."""
+    commands = list(leaf_commands.values())
+    random.Random(1).shuffle(commands)
+    scheduler = QueryScheduler(probe=PROBE)
+    plan = scheduler.plan(commands)
+
+    assert plan[0] == PROBE
+    assert sorted(plan, key=lambda c: c.name) == sorted(commands, key=lambda c: c.name)
+    assert QueryScheduler.header_switches(plan) == 3
+    # 5 settings on the first header, then SH + FC SH + CRA per switch
+    assert _at_traffic(_obd(), plan) == 11
+    assert _at_traffic(_obd(), commands) > 20  # unsorted: a switch every few commands
+    print("  ✓ shuffled table grouped into three header runs")
+
+
+def test_active_header_goes_first():
+    """Without a probe, the header left active by the last cycle is reused."""
+    commands = [c for c in leaf_commands.values() if c != PROBE]
+    plan = QueryScheduler().plan(commands, active_header=b"79B")
+    assert plan[0].header == b"79B"
+
+    obd = _obd()
+    _at_traffic(obd, [leaf_commands["lbc"]])  # previous cycle ended on 79B
+    assert obd.header == b"79B"
+    assert _at_traffic(obd, plan) == 6  # two switches, no settings for 79B
+    print("  ✓ active header reused across cycles")
+
+
+def test_probe_header_first_then_by_latency():
+    """After the probe, its header's group runs; then faster ECUs go first."""
+    scheduler = QueryScheduler(probe=PROBE)
+    scheduler.record(leaf_commands["lbc"], 0.05)
+    scheduler.record(leaf_commands["odometer"], 0.20)
+    plan = scheduler.plan(leaf_commands.values(), active_header=b"743")
+    headers = [c.header for c in plan]
+    assert headers[0] == b"797"
+    first_79b = headers.index(b"79B")
+    first_743 = headers.index(b"743")
+    assert headers[1:first_79b] == [b"797"] * (first_79b - 1)
+    assert first_79b < first_743
+    print("  ✓ probe, then active group, then by expected latency")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Test that the API client keeps one OBD session open across polls."""
+
+import asyncio
+import sys
+
+from custom_components.nissan_leaf_obd_ble import api as api_module
+from custom_components.nissan_leaf_obd_ble.api import NissanLeafObdBleApiClient
+from custom_components.nissan_leaf_obd_ble.elm327 import OBDStatus
+from custom_components.nissan_leaf_obd_ble.OBDResponse import OBDResponse
+
+
+class MockOBD:
+    """Stand-in for an OBD session that counts connects and closes."""
+
+    created = 0
+    at_commands_sent = 0
+    at_commands_saved = 0
+    header = None
+    warm_started = False
+    clean_close = False
+
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.queries = 0
+
+    @classmethod
+    async def create(cls, device, **kwargs):
+        cls.created += 1
+        return cls()
+
+    def status(self):
+        return OBDStatus.CAR_CONNECTED if self.alive else OBDStatus.NOT_CONNECTED
+
+    def is_alive(self):
+        return self.alive and not self.closed
+
+    async def close(self):
+        self.closed = True
+
+    async def query(self, cmd, force=False, deadline=None):
+        self.queries += 1
+        response = OBDResponse(cmd, ["frame"])
+        response.value = {cmd.name: 1}
+        return response
+
+    async def query_batch(self, cmds, deadline=None, breakers=None):
+        return [await self.query(cmd, force=True) for cmd in cmds]
+
+
+def _client(monkeypatch):
+    MockOBD.created = 0
+    monkeypatch.setattr(api_module, "OBD", MockOBD)
+    return NissanLeafObdBleApiClient(object())
+
+
+def test_session_reused_between_polls(monkeypatch):
+    """Two polls in a row should only connect once."""
+    client = _client(monkeypatch)
+
+    async def run():
+        await client.async_get_data()
+        await client.async_get_data()
+
+    asyncio.run(run())
+    assert MockOBD.created == 1
+    assert client.connected
+    print("  ✓ Session reused across polls")
+
+
+def test_session_reconnects_after_link_loss(monkeypatch):
+    """A dead link should be closed and replaced on the next poll."""
+    client = _client(monkeypatch)
+
+    async def run():
+        await client.async_get_data()
+        client._api.alive = False
+        await client.async_get_data()
+
+    asyncio.run(run())
+    assert MockOBD.created == 2
+    print("  ✓ Session re-established after link loss")
+
+
+def test_disconnect_closes_session(monkeypatch):
+    """async_disconnect should close the session and allow a fresh connect."""
+    client = _client(monkeypatch)
+
+    async def run():
+        await client.async_get_data()
+        session = client._api
+        await client.async_disconnect()
+        assert session.closed
+        assert not client.connected
+        await client.async_get_data()
+
+    asyncio.run(run())
+    assert MockOBD.created == 2
+    print("  ✓ Disconnect tears the session down")
+
+
+def main():
+    """Run all tests."""
+    import pytest
+
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
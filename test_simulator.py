@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Test the in-process ELM327/Leaf simulator, and the stack running on it."""
+
+import asyncio
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.api import NissanLeafObdBleApiClient
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.elm327 import OBDStatus
+from custom_components.nissan_leaf_obd_ble.obd import OBD
+from custom_components.nissan_leaf_obd_ble.simulator import ELMSimulator
+
+
+class Recorder:
+    """Consumer collecting the simulator's notifications."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def feed(self, data):
+        self.chunks.append(bytes(data))
+
+    @property
+    def text(self):
+        return b"".join(self.chunks)
+
+
+async def _exchange(sim, recorder, line):
+    """Send a line and wait for the prompt."""
+    recorder.chunks.clear()
+    await sim.write(line + b"\r")
+    assert await sim.wait_until(lambda: recorder.text.endswith(b">"), timeout=2)
+    return recorder.text
+
+
+def _port(**kwargs):
+    sim = ELMSimulator(**kwargs)
+    recorder = Recorder()
+    sim.set_consumer(recorder)
+    return sim, recorder
+
+
+def test_at_semantics():
+    """Echo, spaces, headers and CAF change the output like a real ELM."""
+
+    async def run():
+        sim, rec = _port(chunk_size=4)
+        await sim.open()
+        assert await _exchange(sim, rec, b"ATI") == b"ATI\rELM327 v1.5\r\r>"
+        assert all(len(c) <= 4 for c in rec.chunks)
+        assert await _exchange(sim, rec, b"ATE0") == b"ATE0\rOK\r\r>"
+        assert await _exchange(sim, rec, b"AT SH 797") == b"OK\r\r>"
+        assert await _exchange(sim, rec, b"AT FOO") == b"?\r\r>"
+        assert await _exchange(sim, rec, b"221103") == b"62 11 03 9D\r\r>"
+        await _exchange(sim, rec, b"ATH1")
+        await _exchange(sim, rec, b"ATS0")
+        assert await _exchange(sim, rec, b"2211031") == b"79A046211039D\r\r>"
+        assert await _exchange(sim, rec, b"") == b"79A046211039D\r\r>"  # repeat
+        await _exchange(sim, rec, b"ATSH79B")
+        lines = (await _exchange(sim, rec, b"2101")).split(b"\r")
+        assert lines[0].startswith(b"7BB1035")  # FF of 53 bytes
+        assert len([x for x in lines if x.startswith(b"7BB")]) == 8
+        await _exchange(sim, rec, b"ATSH 7E0")
+        assert await _exchange(sim, rec, b"0100") == b"NO DATA\r\r>"
+
+    asyncio.run(run())
+    print("  ✓ AT settings and formatting")
+
+
+def test_caf0_needs_flow_control():
+    """With CAF0 the ECU stops after the First Frame until flow control is set."""
+
+    async def run():
+        sim, rec = _port()
+        await sim.open()
+        for cmd in (b"ATE0", b"ATH1", b"ATS0", b"ATCAF0", b"ATSH79B"):
+            await _exchange(sim, rec, cmd)
+        assert len((await _exchange(sim, rec, b"0221011")).split(b"\r")) == 3
+        for cmd in (b"ATFCSH79B", b"ATFCSD300000", b"ATFCSM1"):
+            await _exchange(sim, rec, cmd)
+        lines = (await _exchange(sim, rec, b"022101")).split(b"\r")
+        assert lines[-3].startswith(b"7BB27")
+
+    asyncio.run(run())
+    print("  ✓ flow control required for multi-frame responses")
+
+
+def test_bus_traffic_through_receive_filter():
+    """With CAF0, broadcasts seen while waiting are passed on unless filtered."""
+
+    async def run():
+        sim, rec = _port(time_scale=0.0, bus_traffic=True)
+        await sim.open()
+        for cmd in (b"ATE0", b"ATH1", b"ATS0", b"ATCAF0", b"ATSH797"):
+            await _exchange(sim, rec, cmd)
+        lines = (await _exchange(sim, rec, b"03221103")).split(b"\r")
+        assert b"79A046211039D" in lines
+        assert any(line.startswith(b"1DB") for line in lines)
+        unfiltered = len(rec.text)
+
+        await _exchange(sim, rec, b"ATCRA79A")
+        text = await _exchange(sim, rec, b"03221103")
+        assert text == b"79A046211039D\r\r>"
+        assert len(text) < unfiltered / 5
+
+    asyncio.run(run())
+    print("  ✓ receive filter keeps broadcasts off the link")
+
+
+def test_interrupt():
+    """Any character sent while the ELM is busy stops it."""
+
+    async def run():
+        sim, rec = _port(frame_latency=0.2)
+        await sim.open()
+        await _exchange(sim, rec, b"ATE0")
+        await _exchange(sim, rec, b"ATSH79B")
+        rec.chunks.clear()
+        await sim.write(b"2101\r")
+        await asyncio.sleep(0.05)
+        await sim.write(b" ")
+        assert await sim.wait_until(lambda: rec.text.endswith(b">"), timeout=1)
+        assert rec.text == b"STOPPED\r\r>"
+
+    asyncio.run(run())
+    print("  ✓ STOPPED on interrupt")
+
+
+def test_obd_session_on_simulator():
+    """The whole OBD stack connects and decodes without hardware."""
+
+    async def run():
+        obd = await OBD.create("simulator", protocol="6", port=ELMSimulator())
+        assert obd.status() == OBDStatus.CAR_CONNECTED
+        lbc = await obd.query(leaf_commands["lbc"], force=True)
+        assert lbc.value["state_of_charge"] == 80
+        assert lbc.value["hv_battery_voltage"] == 360
+        odometer = await obd.query(leaf_commands["odometer"], force=True)
+        assert odometer.value == {"odometer": 12345}
+        await obd.close()
+
+    asyncio.run(run())
+    print("  ✓ lbc and odometer decoded over the simulator")
+
+
+def test_api_cycle_with_faults():
+    """A full poll cycle runs on the simulator, and lost notifications don't crash it."""
+
+    async def run(**kwargs):
+        client = NissanLeafObdBleApiClient(
+            "simulator",
+            transport=lambda: ELMSimulator(time_scale=0.1, timeout=0.2, **kwargs),
+        )
+        try:
+            return await client.async_get_data()
+        finally:
+            await client.async_disconnect()
+
+    data = asyncio.run(run())
+    assert data["bat_12v_voltage"] == pytest.approx(12.56)
+    assert data["state_of_charge"] == 80
+    assert data["range_remaining"] == 135
+
+    data = asyncio.run(run(drop_rate=0.05, garble_rate=0.05, seed=1))
+    assert isinstance(data, dict)
+    print("  ✓ API cycle on the simulator, with and without faults")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Test the response timeouts (ATST) learned from ECU latency."""
+
+import asyncio
+import sys
+import time
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.elm327 import OBDStatus
+from custom_components.nissan_leaf_obd_ble.obd import OBD
+from custom_components.nissan_leaf_obd_ble.protocols.protocol import Frame, Message
+from custom_components.nissan_leaf_obd_ble.simulator import ELMSimulator
+from custom_components.nissan_leaf_obd_ble.timeouts import (
+    DEFAULT_ST,
+    MIN_SAMPLES,
+    ResponseTimeouts,
+)
+
+
+def test_timeout_from_latency():
+    """The timeout is a margin above the p99, doubled on truncation."""
+    timeouts = ResponseTimeouts()
+    for _ in range(MIN_SAMPLES - 1):
+        timeouts.observe(b"797", 0.030)
+    assert timeouts.st(b"797") is None  # not enough samples yet
+
+    timeouts.observe(b"797", 0.030)
+    assert timeouts.timeout(b"797") == pytest.approx(0.065)
+    assert timeouts.st(b"797") == 16  # 65.5 ms
+    assert timeouts.st(b"79B") is None
+
+    timeouts.back_off(b"797")
+    assert timeouts.st(b"797") == 32
+    for _ in range(10):
+        timeouts.observe(b"797", 0.030)
+    assert timeouts.st(b"797") == 16  # eased back
+    assert timeouts.summary()["797"]["samples"] == 20
+    print("  ✓ ATST from p99 latency, with backoff")
+
+
+def test_no_data_comes_back_quickly():
+    """Once the VCM's latency is known, a car that is off answers NO DATA fast."""
+    cmd = leaf_commands["bat_12v_voltage"]
+
+    async def run():
+        sim = ELMSimulator(frame_latency=0.01)
+        obd = await OBD.create("simulator", protocol="6", port=sim)
+        for _ in range(MIN_SAMPLES + 3):
+            response = await obd.query(cmd, force=True)
+            assert response.value is not None
+        assert sim.response_timeout < DEFAULT_ST
+
+        for ecu in sim.ecus.values():
+            ecu.awake = False
+        start = time.perf_counter()
+        response = await obd.query(leaf_commands["unknown"], force=True)
+        elapsed = time.perf_counter() - start
+        await obd.close()
+        return response, elapsed, sim.response_timeout
+
+    response, elapsed, st = asyncio.run(run())
+    assert response.value is None
+    assert elapsed < DEFAULT_ST * 0.004096 / 2
+    print(f"  ✓ NO DATA after {elapsed * 1000:.0f} ms with ATST {st:02X}")
+
+
+class TruncatingInterface:
+    """ELM stand-in whose multi-frame answers stop after the First Frame."""
+
+    response_latency = 0.0
+
+    def status(self):
+        return OBDStatus.CAR_CONNECTED
+
+    async def send_and_parse(self, cmd, deadline=None):
+        if cmd.startswith(b"AT"):
+            return [Message([Frame("OK")])]
+        message = Message([Frame("7BB10356101000000")])
+        message.data = bytearray.fromhex("610100000000")
+        message.incomplete = True
+        return [message]
+
+
+def test_truncated_response_backs_off():
+    """A timeout too short for the ECU is lengthened once answers are cut."""
+    timeouts = ResponseTimeouts()
+    for _ in range(MIN_SAMPLES):
+        timeouts.observe(b"79B", 0.0)
+    obd = OBD("test", timeouts=timeouts)
+    obd.interface = TruncatingInterface()
+    short = timeouts.st(b"79B")
+
+    asyncio.run(obd.query(leaf_commands["lbc"], force=True))
+    assert timeouts.st(b"79B") == 2 * short
+    print(f"  ✓ ATST {short:02X} -> {timeouts.st(b'79B'):02X} after a cut response")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Test the streaming ELM327 line tokenizer and the bytes protocol path."""
+
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.protocols.protocol_can import (
+    ISO_15765_4_11bit_500k,
+)
+from custom_components.nissan_leaf_obd_ble.tokenizer import ELMTokenizer
+
+
+def _feed(tokenizer, data, size=20):
+    for i in range(0, len(data), size):
+        tokenizer.feed(data[i : i + size])
+
+
+def test_lines_split_across_notifications():
+    """Lines are emitted once complete, whatever the notification boundaries."""
+    tokenizer = ELMTokenizer()
+    _feed(tokenizer, b"7BB1035610100010203\r7BB210405060708090A\r\r>", size=7)
+    assert tokenizer.prompt
+    assert tokenizer.lines == [b"7BB1035610100010203", b"7BB210405060708090A"]
+
+
+def test_nuls_whitespace_and_trailing_junk():
+    """NULs are dropped, lines are stripped and bytes after the prompt ignored."""
+    tokenizer = ELMTokenizer()
+    tokenizer.feed(b"\x00OK \r\n")
+    tokenizer.feed(b"\r>junk")
+    tokenizer.feed(b"more junk\r")
+    assert tokenizer.take_lines() == [b"OK"]
+    assert not tokenizer.prompt  # take_lines() resets for the next command
+
+
+def test_custom_end_marker():
+    """A non-prompt end marker (e.g. ATLP's OK) completes on its own."""
+    tokenizer = ELMTokenizer()
+    tokenizer.feed(b"O")
+    assert not tokenizer.done(b"OK")
+    tokenizer.feed(b"K")
+    assert tokenizer.done(b"OK")
+    assert not tokenizer.done()
+    assert tokenizer.take_lines() == [b"OK"]
+
+
+def test_protocol_accepts_bytes_lines():
+    """Bytes lines parse to the same message as the equivalent strings."""
+    lines = [b"79A0562110300A3", b"NO DATA"]
+    protocol = ISO_15765_4_11bit_500k()
+    from_bytes = protocol(lines)
+    from_str = protocol([line.decode() for line in lines])
+    assert [m.data for m in from_bytes] == [m.data for m in from_str]
+    assert from_bytes[0].data == bytearray(b"\x62\x11\x03\x00\xa3")
+    assert from_bytes[1].raw() == "NO DATA"
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
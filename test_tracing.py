@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Test the timing spans and the diagnostics built from them."""
+
+import asyncio
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.api import NissanLeafObdBleApiClient
+from custom_components.nissan_leaf_obd_ble.simulator import ELMSimulator
+from custom_components.nissan_leaf_obd_ble.tracing import RollingHistogram, Tracer
+
+
+def test_histogram_percentiles():
+    """p50/p95/max cover the rolling window; count covers all time."""
+    histogram = RollingHistogram(size=100)
+    for ms in range(1, 201):
+        histogram.add(ms / 1000)
+    summary = histogram.summary()
+    assert summary["count"] == 200
+    assert summary["max"] == summary["last"] == 200
+    assert summary["p50"] == 150
+    assert summary["p95"] == 196
+    assert RollingHistogram().summary() == {"count": 0}
+    print("  ✓ percentiles over the last 100 samples")
+
+
+def test_span_feeds_every_group():
+    """One span is filed under each of its groups."""
+    tracer = Tracer()
+    with tracer.span(command="speed", header="797"):
+        pass
+    summary = tracer.summary()
+    assert summary["command"]["speed"]["count"] == 1
+    assert summary["header"]["797"]["count"] == 1
+    assert tracer.last("command", "speed") is not None
+    assert tracer.last("stage", "cycle") is None
+    print("  ✓ span recorded per command and per header")
+
+
+def test_cycle_timing_in_diagnostics():
+    """A cycle on the simulator fills in every stage, command and header."""
+
+    async def run():
+        client = NissanLeafObdBleApiClient(
+            "simulator", transport=lambda: ELMSimulator(time_scale=0.1)
+        )
+        await client.async_get_data()
+        await client.async_get_data()
+        await client.async_disconnect()
+        return client
+
+    client = asyncio.run(run())
+    timing = client.diagnostics()["timing"]
+    assert {
+        "ble_connect",
+        "reset",
+        "at_command",
+        "session_connect",
+        "set_header",
+        "parse",
+        "decode",
+        "cycle",
+        "first_query",
+    } <= set(timing["stage"])
+    assert timing["stage"]["cycle"]["count"] == 2
+    assert timing["stage"]["ble_connect"]["count"] == 1
+    assert set(timing["header"]) == {"797", "743", "79B"}
+    assert timing["command"]["lbc"]["count"] == 2
+    # ATZ returns with the prompt rather than after a fixed second
+    assert client.tracer.last("stage", "reset") < 1.0
+    print(f"  ✓ last cycle {timing['stage']['cycle']['last']} ms")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Test negative and response pending (7F xx 78) UDS responses."""
+
+import asyncio
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.obd import OBD
+from custom_components.nissan_leaf_obd_ble.profile import VehicleProfile
+from custom_components.nissan_leaf_obd_ble.protocols.protocol_can import (
+    CompactReassembler,
+    ISO_15765_4_11bit_500k,
+    ISOTPReassembler,
+)
+from custom_components.nissan_leaf_obd_ble.simulator import ELMSimulator
+from custom_components.nissan_leaf_obd_ble.uds import NEGATIVE, PENDING, POSITIVE, classify
+
+
+def test_classify():
+    """Positive, negative and pending responses are told apart."""
+    assert classify(bytes.fromhex("6211039D")) == (POSITIVE, None)
+    assert classify(bytes.fromhex("7F2231")) == (NEGATIVE, 0x31)
+    assert classify(bytes.fromhex("7F2278")) == (PENDING, 0x78)
+    print("  ✓ responses classified")
+
+
+def test_pending_frames_skipped():
+    """The answer after response pending frames is parsed on its own."""
+    protocol = ISO_15765_4_11bit_500k()
+    lines = [b"79A037F2278", b"79A037F2278", b"79A046211039D"]
+
+    (message,) = protocol(lines)
+    assert message.data == bytes.fromhex("6211039D")
+    assert message.pending == 2 and not message.incomplete
+
+    reassembler = ISOTPReassembler(protocol)
+    assert [reassembler.feed(line) for line in lines] == [False, False, True]
+    assert reassembler.message().data == message.data
+    assert reassembler.pending == 2
+
+    (compact,) = CompactReassembler()([b"7F2278", b"6211039D"])
+    assert compact.data == message.data and compact.pending == 1
+
+    # the ELM stopped listening before the answer
+    (cut,) = protocol(lines[:2])
+    assert cut.incomplete and cut.data == bytes.fromhex("7F2278")
+    (cut,) = CompactReassembler()([b"7F2278"])
+    assert cut.incomplete
+    print("  ✓ response pending frames skipped")
+
+
+@pytest.mark.parametrize("pending_time", [0.05, 0.3])
+def test_pending_answer_decoded(pending_time):
+    """A slow ECU's answer is decoded, waiting longer if the ELM gave up."""
+    cmd = leaf_commands["bat_12v_voltage"]
+
+    async def run():
+        sim = ELMSimulator(time_scale=0.0)
+        vcm = sim.ecus[0x797]
+        expected = (await _query(sim, cmd)).value
+        vcm.pending = 1
+        vcm.pending_time = pending_time  # within or beyond ATST 32 (205 ms)
+        obd = await OBD.create("simulator", protocol="6", port=sim)
+        response = await obd.query(cmd, force=True)
+        await obd.close()
+        return expected, response.value, obd.timeouts.st(cmd.header)
+
+    expected, value, st = asyncio.run(run())
+    assert value == expected
+    if pending_time > 0.2:
+        assert st > 0x32  # asked again, waiting longer
+    else:
+        assert st is None
+    print(f"  ✓ answer {pending_time * 1000:.0f} ms after response pending decoded")
+
+
+async def _query(sim, cmd, profile=None):
+    obd = await OBD.create("simulator", protocol="6", port=sim, profile=profile)
+    response = await obd.query(cmd, force=True)
+    await obd.close()
+    return response
+
+
+def test_unsupported_did_remembered():
+    """A DID the ECU rejects for good isn't decoded, and isn't asked for again."""
+    cmd = leaf_commands["odometer"]
+    sim = ELMSimulator(time_scale=0.0)
+    del sim.ecus[0x743].dids[b"\x0e\x01"]
+    profile = VehicleProfile()
+
+    async def run():
+        obd = await OBD.create("simulator", protocol="6", port=sim, profile=profile)
+        first = await obd.query(cmd, force=True)
+        before = sim.stats["commands"]
+        again = await obd.query(cmd, force=True)
+        commands = sim.stats["commands"] - before
+        await obd.close()
+        return first, again, commands
+
+    first, again, commands = asyncio.run(run())
+    assert first.value is None and first.messages  # answered, not garbage
+    assert again.value is None and commands == 0
+    assert profile.negative_response(cmd) == 0x31
+    assert VehicleProfile.from_dict(profile.as_dict()).negative_response(cmd) == 0x31
+    print("  ✓ rejected DID cached, not sent again")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
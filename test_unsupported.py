@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Test that commands a car doesn't support drop out of the schedule."""
+
+import asyncio
+import sys
+import time
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.api import NissanLeafObdBleApiClient
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.profile import VehicleProfile
+from custom_components.nissan_leaf_obd_ble.simulator import ELMSimulator
+
+E_PEDAL = leaf_commands["e_pedal_mode"]  # ZE1 only
+
+
+def test_misses_expire():
+    """Unanswered MISSES_UNSUPPORTED times in a row, then tried again after the TTL."""
+    profile = VehicleProfile()
+    for _ in range(VehicleProfile.MISSES_UNSUPPORTED - 1):
+        profile.observe_missing(E_PEDAL, now=1000.0)
+    profile.observe_answer(E_PEDAL)  # an answer starts the count again
+    for _ in range(VehicleProfile.MISSES_UNSUPPORTED - 1):
+        profile.observe_missing(E_PEDAL, now=1000.0)
+    assert profile.is_supported(E_PEDAL, now=1000.0)
+    profile.observe_missing(E_PEDAL, now=1000.0)
+    assert not profile.is_supported(E_PEDAL, now=1000.0)
+    assert profile.dirty
+
+    stored = VehicleProfile.from_dict(profile.as_dict())
+    assert stored.unsupported == {"797:22131A": {"nrc": None, "since": 1000.0}}
+    expires = 1000.0 + VehicleProfile.UNSUPPORTED_TTL
+    assert not stored.is_supported(E_PEDAL, now=expires - 1)
+    assert stored.is_supported(E_PEDAL, now=expires)
+    assert stored.unsupported == {} and stored.dirty
+    print("  ✓ dropped after repeated misses, tried again after the TTL")
+
+
+def test_stored_entries_validated():
+    """Malformed stored entries are ignored."""
+    profile = VehicleProfile.from_dict(
+        {"unsupported": {"797:22131A": 0x31, "743:220E01": {"nrc": 0x31, "since": 5}}}
+    )
+    assert profile.unsupported == {"743:220E01": {"nrc": 0x31, "since": 5.0}}
+    print("  ✓ malformed entries ignored")
+
+
+def test_silent_command_dropped():
+    """A DID the ECU ignores stops being sent, without tripping its breaker."""
+    sim = ELMSimulator(time_scale=0.0)
+    sim.ecus[0x797].silent.add(b"\x13\x1a")
+    client = NissanLeafObdBleApiClient("simulator", transport=lambda: sim)
+
+    async def cycle():
+        client._scheduler.reset_due()
+        before = sim.stats["commands"]
+        data = await client.async_get_data()
+        return data, sim.stats["commands"] - before
+
+    async def run():
+        counts = []
+        for _ in range(VehicleProfile.MISSES_UNSUPPORTED + 2):
+            data, commands = await cycle()
+            counts.append(commands)
+        # a week later, it is asked for again
+        client.profile.unsupported["797:22131A"]["since"] -= VehicleProfile.UNSUPPORTED_TTL
+        _, reprobe = await cycle()
+        await client.async_disconnect()
+        return data, counts, reprobe
+
+    data, counts, reprobe = asyncio.run(run())
+    dropped = VehicleProfile.MISSES_UNSUPPORTED
+    assert counts[dropped] == counts[dropped + 1] == counts[dropped - 1] - 1
+    assert reprobe == counts[dropped - 1]
+    assert client.profile.misses(E_PEDAL) == 1  # counting again
+    assert data["power_switch"] is not None
+    assert "797" not in client.diagnostics()["circuit_breakers"]
+    print(f"  ✓ {counts[0]} commands per cycle, {counts[dropped]} once dropped")
+
+
+def test_rejected_command_dropped():
+    """A command rejected with a transient NRC every cycle also drops out."""
+    profile = VehicleProfile()
+    for _ in range(VehicleProfile.MISSES_UNSUPPORTED):
+        profile.observe_missing(E_PEDAL, 0x22)
+    assert profile.negative_response(E_PEDAL) == 0x22
+    assert not profile.is_supported(E_PEDAL)
+    assert profile.unsupported["797:22131A"]["since"] <= time.time()
+    print("  ✓ repeatedly rejected command dropped")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Test that a dongle which kept its setup is not reset again."""
+
+import asyncio
+import sys
+
+import pytest
+
+from custom_components.nissan_leaf_obd_ble.api import NissanLeafObdBleApiClient
+from custom_components.nissan_leaf_obd_ble.commands import leaf_commands
+from custom_components.nissan_leaf_obd_ble.obd import OBD
+from custom_components.nissan_leaf_obd_ble.simulator import DEFAULT_TIMEOUT, ELMSimulator
+
+
+def _client(sim, compact=False):
+    client = NissanLeafObdBleApiClient("simulator", transport=lambda: sim)
+    client.compact = compact
+    return client
+
+
+async def _session(client, sim):
+    """Run a cycle in a new session, returning its data and adapter commands."""
+    before = sim.stats["commands"]
+    data = await client.async_get_data()
+    return data, sim.stats["commands"] - before
+
+
+def test_clean_close_allows_warm_start():
+    """After a clean close, one ATDPN replaces the reset and the setup."""
+    sim = ELMSimulator(time_scale=0.0)
+
+    async def connect(warm_start):
+        before = sim.stats["commands"]
+        obd = await OBD.create("simulator", protocol="6", port=sim, warm_start=warm_start)
+        commands = sim.stats["commands"] - before
+        assert obd.warm_started == warm_start
+        response = await obd.query(leaf_commands["bat_12v_voltage"], force=True)
+        await obd.close()
+        return obd.clean_close, commands, response.value
+
+    async def run():
+        cold = await connect(False)
+        # the session's own settings were put back, not reset
+        assert cold[0]  # clean close
+        assert sim.headers and not sim.caf and not sim.echo
+        assert sim.response_timeout == DEFAULT_TIMEOUT
+        return cold, await connect(True)
+
+    (_, cold_commands, cold_value), (_, warm_commands, warm_value) = asyncio.run(run())
+    assert warm_value == cold_value
+    assert cold_commands == 8  # ATZ, six settings, AT RV
+    assert warm_commands == 2  # ATDPN, AT RV
+    print(f"  ✓ warm start in {warm_commands} commands instead of {cold_commands}")
+
+
+def test_warm_start_counted():
+    """The client warm starts every session after the first."""
+    sim = ELMSimulator(time_scale=0.0)
+    client = _client(sim, compact=True)
+
+    async def run():
+        for _ in range(3):
+            await _session(client, sim)
+            await client.async_disconnect()
+
+    asyncio.run(run())
+    assert client.stats["warm_starts"] == 2
+    assert client.tracer.summary()["stage"]["first_query"]["count"] == 3
+    print("  ✓ warm starts counted, first query timed")
+
+
+def test_reset_adapter_gets_full_init():
+    """A dongle that lost power fails the probe and is set up again."""
+    sim = ELMSimulator(time_scale=0.0)
+    client = _client(sim)
+
+    async def run():
+        cold, _ = await _session(client, sim)
+        await client.async_disconnect()
+        sim._reset()  # power cycled while disconnected
+        data, _ = await _session(client, sim)
+        await client.async_disconnect()
+        return cold, data
+
+    cold, data = asyncio.run(run())
+    assert data == cold
+    assert client.stats["warm_starts"] == 0
+    print("  ✓ probe mismatch falls back to ATZ")
+
+
+def test_lost_link_restores_settings_on_warm_start():
+    """A session that lost its link may have left compact formatting on."""
+    sim = ELMSimulator(time_scale=0.0)
+    client = _client(sim, compact=True)
+
+    async def run():
+        cold, _ = await _session(client, sim)
+        assert not sim.headers and sim.caf  # left in compact format
+        sim.client.is_connected = False  # out of range
+        client.compact = False
+        data, _ = await _session(client, sim)
+        await client.async_disconnect()
+        return cold, data
+
+    cold, data = asyncio.run(run())
+    assert data == cold
+    assert client.stats["warm_starts"] == 1
+    print("  ✓ raw format restored after a lost link")
+
+
+def main():
+    """Run all tests."""
+    return pytest.main([__file__, "-q"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())